@@ -0,0 +1,121 @@
+"""Time directory listings for 1k, 10k and 100k entries.
+
+Compares the old os.listdir + per-entry os.path calls with a full
+select_listing_page() over os.scandir(), and times list_directory() streaming the default first page and a full
+unpaginated page into a null sink:
+
+    python benchmarks/bench_listing.py [entries ...]
+
+Entry directories are created once under a temporary directory; pass
+--keep DIR to reuse them between runs.
+"""
+
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+original_argv = sys.argv
+sys.argv = [str(SRC_DIR / "simpleserver.py")]
+try:
+    import simpleserver  # noqa: E402
+finally:
+    sys.argv = original_argv
+
+
+class NullWriter:
+    def write(self, data):
+        return len(data)
+
+
+class BenchmarkHandler(simpleserver.SimpleHTTPRequestHandler):
+    listing_cache = simpleserver.ByteBudgetCache(0)
+
+    def __init__(self, path):
+        self.path = path
+        self.wfile = NullWriter()
+        self.headers = {}
+        self.request_version = "HTTP/1.1"
+        self.command = "GET"
+        self.close_connection = True
+        self.requests_remaining = 1
+
+    def send_response(self, code, message=None):
+        pass
+
+    def send_header(self, keyword, value):
+        pass
+
+    def end_headers(self):
+        pass
+
+
+def legacy_collect(path):
+    names = os.listdir(path)
+    names.sort(key=lambda a: a.lower())
+    rows = []
+    for name in names:
+        fullname = os.path.join(path, name)
+        size = None if os.path.isdir(fullname) else os.path.getsize(fullname)
+        rows.append((name, size, os.path.islink(fullname)))
+    return rows
+
+
+def scan_page(path, limit):
+    with os.scandir(path) as scanner:
+        return simpleserver.select_listing_page(scanner, limit)
+
+
+def populate(path, entries):
+    os.makedirs(path, exist_ok=True)
+    existing = len(os.listdir(path))
+    for index in range(existing, entries):
+        if index % 20 == 0:
+            os.mkdir(os.path.join(path, "dir-%06d" % index))
+        else:
+            with open(os.path.join(path, "File-%06d.txt" % index), "wb") as handle:
+                handle.write(b"x" * (index % 4096))
+
+
+def best_of(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    keep = None
+    if "--keep" in argv:
+        index = argv.index("--keep")
+        keep = argv[index + 1]
+        del argv[index:index + 2]
+    sizes = [int(value) for value in argv] or [1000, 10000, 100000]
+    with tempfile.TemporaryDirectory() as scratch:
+        base = keep or scratch
+        print("%8s %12s %12s %12s %12s" % ("entries", "legacy ms", "scandir ms", "page ms", "all ms"))
+        for size in sizes:
+            path = os.path.join(base, "entries-%d" % size)
+            populate(path, size)
+            page = BenchmarkHandler("/entries-%d/" % size)
+            everything = BenchmarkHandler("/entries-%d/?limit=%d" % (size, size))
+            everything.listing_max_page_size = size
+            legacy = best_of(lambda: legacy_collect(path))
+            scanned = best_of(lambda: scan_page(path, size))
+            paged = best_of(lambda: page.list_directory(path))
+            rendered = best_of(lambda: everything.list_directory(path))
+            print("%8d %12.1f %12.1f %12.1f %12.1f" % (
+                size, legacy * 1000, scanned * 1000, paged * 1000, rendered * 1000,
+            ))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
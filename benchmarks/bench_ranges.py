@@ -0,0 +1,107 @@
+"""Time seek-heavy range requests against a large file, cold and warm.
+
+Serves one large file from a local server and fetches ranges at random
+offsets over a keep-alive connection, first with the file dropped from the
+page cache and then again with it cached, with posix_fadvise read-ahead
+hints on and off:
+
+    python benchmarks/bench_ranges.py [size-in-MB] [--dir DIR]
+
+The file is created under a temporary directory, or DIR with --dir.  Cold
+runs rely on POSIX_FADV_DONTNEED emptying the page cache for the file, which
+a tmpfs directory ignores, so point --dir at a disk-backed filesystem.
+"""
+
+import http.client
+import os
+from pathlib import Path
+import random
+import sys
+import tempfile
+import threading
+import time
+
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+from bench_listing import simpleserver  # noqa: E402
+
+
+RANGE_SIZE = 4 * 1024 * 1024
+REQUESTS = 32
+
+
+class QuietHandler(simpleserver.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def write_file(path, size):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as handle:
+        for _ in range(size // len(block)):
+            handle.write(block)
+        # Dirty pages cannot be dropped, so make sure they reach the disk.
+        os.fsync(handle.fileno())
+
+
+def drop_page_cache(path):
+    with open(path, "rb") as handle:
+        os.posix_fadvise(handle.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def fetch_ranges(address, offsets):
+    connection = http.client.HTTPConnection(*address, timeout=60)
+    try:
+        started = time.perf_counter()
+        for offset in offsets:
+            connection.request("GET", "/large.bin", headers={
+                "Range": "bytes=%d-%d" % (offset, offset + RANGE_SIZE - 1),
+            })
+            response = connection.getresponse()
+            body = response.read()
+            if response.status != 206 or len(body) != RANGE_SIZE:
+                raise RuntimeError("unexpected response %d" % response.status)
+        return time.perf_counter() - started
+    finally:
+        connection.close()
+
+
+def main(argv):
+    directory = None
+    if "--dir" in argv:
+        index = argv.index("--dir")
+        directory = argv[index + 1]
+        del argv[index:index + 2]
+    size = (int(argv[0]) if argv else 256) * 1024 * 1024
+    rng = random.Random(20)
+    offsets = [rng.randrange(0, size - RANGE_SIZE) for _ in range(REQUESTS)]
+    mb = REQUESTS * RANGE_SIZE / 1e6
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        path = os.path.join(scratch, "large.bin")
+        write_file(path, size)
+        original_cwd = os.getcwd()
+        os.chdir(scratch)
+        server = simpleserver.ThreadingSimpleServer(("127.0.0.1", 0), QuietHandler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            print("%d random %d MB ranges from a %d MB file" % (REQUESTS, RANGE_SIZE >> 20, size >> 20))
+            print("%-10s %12s %12s" % ("hints", "cold MB/s", "warm MB/s"))
+            for name, readahead in (("off", 0), ("on", QuietHandler.readahead_max)):
+                QuietHandler.readahead_max = readahead
+                drop_page_cache(path)
+                cold = fetch_ranges(server.server_address, offsets)
+                warm = fetch_ranges(server.server_address, offsets)
+                print("%-10s %12.1f %12.1f" % (name, mb / cold, mb / warm))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+            os.chdir(original_cwd)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
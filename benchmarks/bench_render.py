@@ -0,0 +1,204 @@
+"""Time rendering a 1000-entry directory listing page.
+
+Compares the page built the way it was before precompiled templates (one
+str fragment encoded and written per customwrite() call) with the
+templates in simple_templates, on the same pre-scanned entries, and then
+times a whole list_directory() request into a null sink:
+
+    python benchmarks/bench_render.py [entries ...]
+"""
+
+from io import BytesIO
+import html
+import os
+from pathlib import Path
+import sys
+import tempfile
+import urllib.parse
+
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+from bench_listing import BenchmarkHandler, best_of, populate, simpleserver  # noqa: E402
+
+
+def legacy_head(handler, request_path, read_only, listing_root, display_path):
+    """The page head as built before templates: one encode per fragment."""
+    f = BytesIO()
+    displaypath = html.escape(
+        display_path if display_path is not None else urllib.parse.unquote(request_path)
+    )
+
+    js_action_create_folder = "window.open('%s' + document.getElementById('folderName').value,'_self')" % (
+            request_path.strip() + "?createfolder=",
+        )
+
+    def customwrite(htmlstring):
+        f.write(htmlstring.encode("utf-8"))
+
+    customwrite("<!DOCTYPE html>\n")
+    customwrite("<html lang=\"en\">\n")
+    customwrite("<head>\n")
+    customwrite("<meta charset=\"utf-8\">\n")
+    customwrite("<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">\n")
+    customwrite("<script src=\"%s\"></script>\n" % simpleserver.STATIC_URLS["theme.js"])
+    customwrite("<title>Directory listing for %s</title>\n" % displaypath)
+    customwrite("<link rel=\"stylesheet\" href=\"%s\">\n" % simpleserver.STATIC_URLS["listing.css"])
+    customwrite("</head>\n")
+    customwrite("<body>\n")
+    customwrite("<div class=\"container\">\n")
+    customwrite("<div class=\"card\">\n")
+    customwrite("<div class=\"header\">\n")
+    customwrite("<h2>%s</h2>\n" % ("Shared directory" if read_only else "Directory listing"))
+    customwrite("<div class=\"path\">%s</div>\n" % displaypath)
+    customwrite("</div>\n")
+    if not read_only:
+        customwrite("<div class=\"upload-panel\">\n")
+        customwrite("<form id=\"upload-form\" class=\"upload-form\" ENCTYPE=\"multipart/form-data\" method=\"post\">\n")
+        customwrite("<label id=\"upload-dropzone\" class=\"upload-dropzone\" for=\"upload-input\" tabindex=\"0\">\n")
+        customwrite("<strong>Drop files here or choose files</strong>\n")
+        customwrite("<span class=\"upload-hint\">Files upload individually so each transfer can be tracked or cancelled.</span>\n")
+        customwrite("<input id=\"upload-input\" name=\"file\" type=\"file\" multiple>\n")
+        customwrite("</label>\n")
+        customwrite("<div class=\"upload-controls\">\n")
+        customwrite("<button id=\"upload-submit\" class=\"btn\" type=\"submit\">Upload selected</button>\n")
+        customwrite("<button id=\"refresh-list\" class=\"btn secondary\" type=\"button\" hidden>Refresh listing</button>\n")
+        customwrite("</div>\n")
+        customwrite("</form>\n")
+        customwrite("<ul id=\"upload-queue\" class=\"upload-queue\" aria-live=\"polite\"></ul>\n")
+        customwrite("</div>\n")
+    customwrite("<div class=\"actions\">\n")
+    if not read_only:
+        customwrite("<form ENCTYPE=\"multipart/form-data\">")
+        customwrite("<label for=\"folderName\"><small>Create folder:</small></label>")
+        customwrite("<input type=\"text\" id=\"folderName\" placeholder=\"New folder\">")
+        customwrite("<button class=\"btn secondary\" type=\"button\" onclick=\"" + js_action_create_folder + "\">Create</button>")
+        customwrite("</form>\n")
+        customwrite("<form id=\"download-form\" class=\"download-form\" method=\"get\" action='%s'>" % request_path)
+        customwrite("<label for=\"download-format\"><small>Download as:</small></label>")
+        customwrite("<select id=\"download-format\" name=\"download\">")
+        customwrite("<option value=\"zip\" selected>zip</option>")
+        customwrite("<option value=\"tar\">tar</option>")
+        customwrite("<option value=\"tar.gz\">tar.gz</option>")
+        customwrite("</select>")
+        customwrite("<input type=\"hidden\" name=\"dir\" value='%s'>" % request_path)
+        customwrite("<button class=\"btn\" type=\"submit\">Download</button>")
+        customwrite("<button id=\"download-selected\" class=\"btn secondary\" type=\"submit\" ")
+        customwrite("formmethod=\"post\" formaction=\"/__download__\" disabled>Download selected</button>")
+        customwrite("</form>\n")
+        customwrite("<a class=\"btn secondary\" href='/__connect__'>Connect devices</a>\n")
+        customwrite("<div class=\"share-settings\">")
+        customwrite("<label for=\"share-expiry\"><small>Share expires:</small></label>")
+        customwrite("<select id=\"share-expiry\">")
+        customwrite("<option value=\"900\">15 minutes</option>")
+        customwrite("<option value=\"3600\" selected>1 hour</option>")
+        customwrite("<option value=\"86400\">24 hours</option>")
+        customwrite("</select></div>\n")
+    customwrite("<button class=\"btn secondary\" type=\"button\" id=\"theme-toggle\">Light mode</button>\n")
+    if handler.server_password and not read_only:
+        customwrite("<a class=\"btn secondary\" href='/__logout__'>Logout</a>\n")
+    customwrite("</div>\n")
+    if not read_only:
+        customwrite("<div id=\"share-result\" class=\"share-result\" hidden>\n")
+        customwrite("<input id=\"share-link\" class=\"share-link\" type=\"text\" readonly aria-label=\"Generated share link\">\n")
+        customwrite("<button id=\"copy-share\" class=\"btn secondary\" type=\"button\">Copy</button>\n")
+        customwrite("<span id=\"share-status\" class=\"share-status\" aria-live=\"polite\"></span>\n")
+        customwrite("</div>\n")
+    customwrite("<ul class=\"list\">\n")
+    if request_path != listing_root:
+        customwrite('<li><a href="%s">..</a>\n' % (urllib.parse.quote(request_path + ".."),))
+    return f.getvalue()
+
+
+def legacy_row(entry, request_path, read_only):
+    displayname = linkname = entry.name
+    # Append / for directories or @ for symbolic links
+    size_display = ""
+    if entry.is_dir:
+        displayname = linkname = entry.name + "/"
+    else:
+        size_display = "<span>(%s)</span>" % (simpleserver.sizeof_fmt(entry.size),)
+    if entry.is_link:
+        displayname = entry.name + "@"
+        # Note: a link to a directory displays with @ and links with /
+    row = "<li>"
+    if not read_only:
+        row += "<label class=\"select-entry\"><input type=\"checkbox\" name=\"path\" value=\"%s\" " % (
+            urllib.parse.quote(entry.name),
+        )
+        row += "form=\"download-form\" aria-label=\"Select %s\"></label>" % (html.escape(displayname),)
+    row += "<a class=\"file-link\" href=\"%s\">%s</a><div class=\"file-meta\">%s<time>%s</time>" % (
+        urllib.parse.quote(linkname),
+        html.escape(displayname),
+        size_display,
+        simpleserver.format_mtime(entry.mtime_ns),
+    )
+    if not read_only:
+        scope_path = urllib.parse.quote(
+            urllib.parse.unquote(request_path) + linkname,
+            safe='/',
+        )
+        row += "<button class=\"share-button\" type=\"button\" data-scope=\"%s\">Share</button>" % (
+            html.escape(scope_path, quote=True),
+        )
+        row += "<a class=\"delete\" href=\"%s\">Delete</a>" % (
+            "?deletefile=" + html.escape(displayname),
+        )
+    return (row + "</div></li>\n").encode("utf-8")
+
+
+def legacy_tail(page_links):
+    f = BytesIO()
+
+    def customwrite(htmlstring):
+        f.write(htmlstring.encode("utf-8"))
+    customwrite("</ul>\n")
+    if page_links:
+        customwrite("<nav class=\"pages\">%s</nav>\n" % page_links)
+    customwrite("<div class=\"footer\">Powered By: Gil, check new version ")
+    customwrite("<a href=\"https://github.com/adrianogil/simple-server\">")
+    customwrite("here</a>.</div>\n")
+    customwrite("</div>\n</div>\n")
+    customwrite("<script src=\"%s\"></script>\n" % simpleserver.STATIC_URLS["listing.js"])
+    customwrite("</body>\n</html>\n")
+    return f.getvalue()
+
+
+def legacy_render(handler, entries, request_path):
+    f = BytesIO()
+    f.write(legacy_head(handler, request_path, False, "/", None))
+    for entry in entries:
+        f.write(legacy_row(entry, request_path, False))
+    f.write(legacy_tail(""))
+    return f.getvalue()
+
+
+def template_render(handler, entries, request_path):
+    parts = handler.render_listing_head(request_path, False, "/", None)
+    handler.render_listing_rows(entries, request_path, False, parts)
+    handler.render_listing_tail("", parts)
+    return b"".join(parts)
+
+
+def main(argv):
+    sizes = [int(value) for value in argv] or [1000]
+    print("%8s %14s %14s %14s" % ("entries", "customwrite ms", "template ms", "request ms"))
+    with tempfile.TemporaryDirectory() as base:
+        for size in sizes:
+            path = os.path.join(base, "entries-%d" % size)
+            populate(path, size)
+            request_path = "/entries-%d/" % size
+            handler = BenchmarkHandler("%s?limit=%d" % (request_path, size))
+            handler.listing_max_page_size = size
+            with os.scandir(path) as scanner:
+                entries = simpleserver.select_listing_page(scanner, size).entries
+            assert legacy_render(handler, entries, request_path) == template_render(handler, entries, request_path)
+            legacy = best_of(lambda: legacy_render(handler, entries, request_path), repeat=20)
+            templated = best_of(lambda: template_render(handler, entries, request_path), repeat=20)
+            request = best_of(lambda: handler.list_directory(path), repeat=20)
+            print("%8d %14.2f %14.2f %14.2f" % (size, legacy * 1000, templated * 1000, request * 1000))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
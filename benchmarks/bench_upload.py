@@ -0,0 +1,98 @@
+"""Compare upload parsing throughput and peak memory.
+
+Runs the streaming multipart parser used by deal_post_data against the
+previous cgi.FieldStorage code path on the same request body:
+
+    python benchmarks/bench_upload.py [size-in-MB ...]
+
+The cgi module was removed in Python 3.13; on newer interpreters only the
+streaming parser is measured.
+"""
+
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from simple_multipart import MultipartParser  # noqa: E402
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import cgi
+    except ImportError:
+        cgi = None
+
+
+BOUNDARY = "----simple-server-benchmark"
+
+
+def write_request_body(path, size):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as body:
+        body.write((
+            "--%s\r\n"
+            "Content-Disposition: form-data; name=\"file\"; filename=\"upload.bin\"\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n" % BOUNDARY
+        ).encode("ascii"))
+        for _ in range(size // len(block)):
+            body.write(block)
+        body.write(block[:size % len(block)])
+        body.write(("\r\n--%s--\r\n" % BOUNDARY).encode("ascii"))
+    return os.path.getsize(path)
+
+
+def streaming_upload(rfile, content_length, destination):
+    for part in MultipartParser(rfile, BOUNDARY, content_length):
+        with open(destination, "wb") as uploaded_file:
+            for chunk in part.iter_chunks():
+                uploaded_file.write(chunk)
+
+
+def field_storage_upload(rfile, content_length, destination):
+    content_type = "multipart/form-data; boundary=%s" % BOUNDARY
+    form = cgi.FieldStorage(
+        fp=rfile,
+        headers={"content-type": content_type, "content-length": str(content_length)},
+        environ={"REQUEST_METHOD": "POST", "CONTENT_TYPE": content_type},
+    )
+    with open(destination, "wb") as uploaded_file:
+        uploaded_file.write(form["file"].file.read())
+
+
+def measure(upload, body_path, content_length, destination):
+    with open(body_path, "rb") as rfile:
+        tracemalloc.start()
+        started = time.perf_counter()
+        upload(rfile, content_length, destination)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    os.remove(destination)
+    return content_length / elapsed / 1e6, peak / 1e6
+
+
+def main(argv):
+    sizes = [int(value) for value in argv] or [16, 128]
+    implementations = [("streaming", streaming_upload)]
+    if cgi is not None:
+        implementations.append(("cgi.FieldStorage", field_storage_upload))
+    print("%-18s %8s %10s %14s" % ("parser", "size MB", "MB/s", "peak alloc MB"))
+    with tempfile.TemporaryDirectory() as directory:
+        body_path = os.path.join(directory, "body")
+        destination = os.path.join(directory, "upload.bin")
+        for size in sizes:
+            content_length = write_request_body(body_path, size * 1024 * 1024)
+            for name, upload in implementations:
+                throughput, peak = measure(upload, body_path, content_length, destination)
+                print("%-18s %8d %10.1f %14.1f" % (name, size, throughput, peak))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
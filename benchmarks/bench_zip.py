@@ -0,0 +1,119 @@
+"""Time building a directory download archive from a mixed tree.
+
+The tree holds compressible text, incompressible "photos" and gzip
+archives in roughly equal parts.  The archive is written into a null sink
+with every entry deflated on one thread, as downloads used to be, then with
+compressed formats stored, then with a pool of worker threads:
+
+    python benchmarks/bench_zip.py [tree-size-in-MB] [--keep DIR] [--workers N]
+
+The tree defaults to 5120 MB and is created once under a temporary
+directory; pass --keep DIR to reuse it between runs.
+"""
+
+import gzip
+import os
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+from bench_listing import simpleserver  # noqa: E402
+from simple_zip import ZIP_DEFLATED, CompressionPool, ZipStreamWriter  # noqa: E402
+
+
+FILE_SIZE = 8 * 1024 * 1024
+
+
+class CountingSink:
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+class DeflateEverything(ZipStreamWriter):
+    def method_for(self, arcname):
+        return ZIP_DEFLATED
+
+
+def text_block(rng):
+    words = [b"GET", b"POST", b"/index.html", b"/api/items", b"200", b"404", b"ok", b"timeout"]
+    lines = []
+    size = 0
+    while size < 1024 * 1024:
+        line = b"%d %s %s %d\n" % (rng.randrange(1 << 30), rng.choice(words), rng.choice(words), rng.randrange(1000))
+        lines.append(line)
+        size += len(line)
+    return b"".join(lines)
+
+
+def populate(path, total):
+    os.makedirs(path, exist_ok=True)
+    existing = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    rng = random.Random(5)
+    text = text_block(rng)
+    noise = os.urandom(1024 * 1024)
+    packed = gzip.compress(b"".join(text_block(rng) for _ in range(6)))[:len(noise)]
+    index = len(os.listdir(path))
+    while existing < total:
+        kind = index % 3
+        name = ("log-%05d.txt", "photo-%05d.jpg", "bundle-%05d.tar.gz")[kind] % index
+        with open(os.path.join(path, name), "wb") as handle:
+            for _ in range(FILE_SIZE // len(noise)):
+                if kind == 0:
+                    handle.write(text)
+                elif kind == 1:
+                    handle.write(noise)
+                else:
+                    handle.write(packed)
+        existing += FILE_SIZE
+        index += 1
+
+
+def build(path, writer_class, pool):
+    sink = CountingSink()
+    writer = writer_class(sink.write, pool=pool)
+    for name in sorted(os.listdir(path)):
+        writer.add_file(os.path.join(path, name), "tree/" + name)
+    writer.close()
+    return sink.size
+
+
+def main(argv):
+    keep = None
+    if "--keep" in argv:
+        index = argv.index("--keep")
+        keep = argv[index + 1]
+        del argv[index:index + 2]
+    workers = os.cpu_count() or 1
+    if "--workers" in argv:
+        index = argv.index("--workers")
+        workers = int(argv[index + 1])
+        del argv[index:index + 2]
+    total = (int(argv[0]) if argv else 5120) * 1024 * 1024
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(keep or scratch, "mixed-tree")
+        populate(path, total)
+        tree_size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        print("%d MB mixed tree, %d files" % (tree_size >> 20, len(os.listdir(path))))
+        print("%-28s %10s %12s" % ("archive", "MB/s", "archive MB"))
+        for name, writer_class, pool in (
+            ("deflate all, 1 thread", DeflateEverything, None),
+            ("type-aware, 1 thread", ZipStreamWriter, None),
+            ("type-aware, %d threads" % workers, ZipStreamWriter, CompressionPool(workers)),
+        ):
+            started = time.perf_counter()
+            size = build(path, writer_class, pool)
+            elapsed = time.perf_counter() - started
+            print("%-28s %10.1f %12.1f" % (name, tree_size / elapsed / 1e6, size / 1e6))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
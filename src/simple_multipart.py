@@ -0,0 +1,152 @@
+"""Incremental multipart/form-data parser for streaming uploads.
+
+The request body is read in fixed-size chunks and each part is handed out as
+an iterator of byte chunks, so memory stays bounded by the chunk size no
+matter how large the uploaded files are.
+"""
+
+from email.message import Message
+from email.parser import BytesHeaderParser
+
+
+CHUNK_SIZE = 64 * 1024
+MAX_HEADER_SIZE = 16 * 1024
+
+
+class MultipartError(ValueError):
+    """The body is not well-formed multipart data."""
+
+
+class IncompleteBody(MultipartError):
+    """The body ended before the closing boundary or the declared length."""
+
+
+def parse_content_type(value):
+    """Return (content_type, params) for a Content-Type header value."""
+    message = Message()
+    message["Content-Type"] = value or ""
+    params = dict(message.get_params(failobj=[])[1:])
+    return message.get_content_type(), params
+
+
+class MultipartPart:
+    def __init__(self, parser, headers):
+        self._parser = parser
+        self.headers = headers
+        self.name = headers.get_param("name", header="content-disposition")
+        self.filename = headers.get_filename()
+        self.consumed = False
+
+    def iter_chunks(self):
+        """Yield the body of this part; may only be consumed once."""
+        if self.consumed:
+            return
+        self.consumed = True
+        yield from self._parser._read_part_body()
+
+    def discard(self):
+        for _ in self.iter_chunks():
+            pass
+
+
+class MultipartParser:
+    """Iterate over the parts of a multipart body read from a file-like object."""
+
+    def __init__(self, fp, boundary, content_length, chunk_size=CHUNK_SIZE):
+        if not boundary:
+            raise MultipartError("Missing multipart boundary")
+        if isinstance(boundary, str):
+            boundary = boundary.encode("latin-1")
+        self.fp = fp
+        self.remaining = content_length
+        self.chunk_size = chunk_size
+        self.delimiter = b"\r\n--" + boundary
+        # The first boundary has no preceding CRLF; adding one lets every
+        # boundary be found with the same delimiter.
+        self.buffer = bytearray(b"\r\n")
+        self.finished = False
+
+    def _fill(self):
+        if self.remaining <= 0:
+            return False
+        data = self.fp.read(min(self.chunk_size, self.remaining))
+        if not data:
+            raise IncompleteBody("Request body ended early")
+        self.remaining -= len(data)
+        self.buffer += data
+        return True
+
+    def _require(self, size):
+        while len(self.buffer) < size:
+            if not self._fill():
+                raise IncompleteBody("Request body ended early")
+
+    def _read_part_body(self):
+        delimiter = self.delimiter
+        keep = len(delimiter) - 1
+        while True:
+            index = self.buffer.find(delimiter)
+            if index >= 0:
+                if index:
+                    yield bytes(self.buffer[:index])
+                del self.buffer[:index + len(delimiter)]
+                return
+            if len(self.buffer) > keep:
+                yield bytes(self.buffer[:-keep])
+                del self.buffer[:-keep]
+            if not self._fill():
+                raise IncompleteBody("Closing boundary not found")
+
+    def _read_part_headers(self):
+        while True:
+            index = self.buffer.find(b"\r\n\r\n")
+            if index >= 0:
+                break
+            if len(self.buffer) > MAX_HEADER_SIZE:
+                raise MultipartError("Part headers are too large")
+            if not self._fill():
+                raise IncompleteBody("Part headers ended early")
+        if index > MAX_HEADER_SIZE:
+            raise MultipartError("Part headers are too large")
+        headers = BytesHeaderParser().parsebytes(bytes(self.buffer[:index]))
+        del self.buffer[:index + 4]
+        return headers
+
+    def __iter__(self):
+        if self.finished:
+            return
+        for _ in self._read_part_body():
+            pass  # preamble
+        while True:
+            self._require(2)
+            marker = bytes(self.buffer[:2])
+            del self.buffer[:2]
+            if marker == b"--":
+                self.finished = True
+                self.discard_rest()
+                return
+            if marker != b"\r\n":
+                # Transport padding after a boundary is allowed but unusual.
+                self.buffer[:0] = marker
+                self._skip_line()
+            part = MultipartPart(self, self._read_part_headers())
+            yield part
+            part.discard()
+
+    def _skip_line(self):
+        while True:
+            index = self.buffer.find(b"\r\n")
+            if index >= 0:
+                if self.buffer[:index].strip(b" \t"):
+                    raise MultipartError("Malformed multipart boundary")
+                del self.buffer[:index + 2]
+                return
+            if not self._fill():
+                raise IncompleteBody("Request body ended early")
+
+    def discard_rest(self):
+        """Read and drop whatever is left of the declared body."""
+        self.buffer.clear()
+        while self.remaining > 0:
+            self._fill()
+            self.buffer.clear()
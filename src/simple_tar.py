@@ -0,0 +1,118 @@
+"""Streaming tar writer for directory exports.
+
+The tree is walked one directory at a time with os.scandir and written with
+tarfile's stream mode, so memory stays bounded by the largest directory and
+the archive can be unpacked while it arrives.  Symbolic links are stored as
+links and never followed; FIFOs, sockets and device files are skipped.
+"""
+
+import os
+import stat
+import tarfile
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def walk_tree(path, arcname, exclude=()):
+    """Yield (arcname, path, lstat) for PATH and everything below it.
+
+    Each directory comes before its contents and entries are sorted by name.
+    Symbolic links to directories are yielded as links, not descended into.
+    Entries that vanish or cannot be read are left out, and so are the paths
+    in EXCLUDE together with everything below them.
+
+    """
+    if path in exclude:
+        return
+    try:
+        root_stat = os.lstat(path)
+    except OSError:
+        return
+    yield arcname, path, root_stat
+    if not stat.S_ISDIR(root_stat.st_mode):
+        return
+    pending = [(path, arcname)]
+    while pending:
+        directory, prefix = pending.pop()
+        try:
+            with os.scandir(directory) as scanner:
+                entries = sorted(scanner, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirectories = []
+        for entry in entries:
+            if entry.path in exclude:
+                continue
+            try:
+                entry_stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            child = prefix + "/" + entry.name
+            yield child, entry.path, entry_stat
+            if stat.S_ISDIR(entry_stat.st_mode):
+                subdirectories.append((entry.path, child))
+        pending.extend(reversed(subdirectories))
+
+
+class _FixedSizeReader:
+    """Read exactly SIZE bytes from SOURCE, padding with zeros if it shrank."""
+
+    def __init__(self, source, size):
+        self.source = source
+        self.remaining = size
+
+    def read(self, size):
+        size = min(size, self.remaining)
+        data = self.source.read(size)
+        if len(data) < size:
+            data += bytes(size - len(data))
+        self.remaining -= size
+        return data
+
+
+class TarStreamWriter:
+    """Write a POSIX (pax) tar archive to FILEOBJ, which only needs write()."""
+
+    def __init__(self, fileobj):
+        self.tar = tarfile.open(
+            fileobj=fileobj,
+            mode="w|",
+            format=tarfile.PAX_FORMAT,
+            bufsize=CHUNK_SIZE,
+            encoding="utf-8",
+            errors="surrogateescape",
+        )
+
+    def add(self, arcname, path, file_stat):
+        """Add one entry from walk_tree(); return False if it was skipped."""
+        info = tarfile.TarInfo(arcname)
+        info.mode = stat.S_IMODE(file_stat.st_mode)
+        info.mtime = int(file_stat.st_mtime)
+        if stat.S_ISDIR(file_stat.st_mode):
+            info.type = tarfile.DIRTYPE
+            self.tar.addfile(info)
+        elif stat.S_ISLNK(file_stat.st_mode):
+            info.type = tarfile.SYMTYPE
+            try:
+                info.linkname = os.readlink(path)
+            except OSError:
+                return False
+            self.tar.addfile(info)
+        elif stat.S_ISREG(file_stat.st_mode):
+            try:
+                source = open(path, "rb")
+            except OSError:
+                return False
+            with source:
+                # The header carries the size, so a file that grows or
+                # shrinks while it is read is cut or padded to match.
+                info.size = os.fstat(source.fileno()).st_size
+                self.tar.addfile(info, _FixedSizeReader(source, info.size))
+        else:
+            return False
+        return True
+
+    def close(self):
+        """Write the end-of-archive blocks; FILEOBJ is left open."""
+        self.tar.close()
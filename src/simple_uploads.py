@@ -0,0 +1,180 @@
+"""Resumable upload sessions, a subset of the tus 1.0 protocol.
+
+A session is two files in a staging directory: <id>.json with the target
+name, relative to the served root, and declared length, and <id>.part
+with the bytes received so far.  The size of the .part file is the upload
+offset, so sessions survive restarts and are shared by worker processes,
+and a PATCH cut off halfway keeps everything that reached the disk.  A
+complete upload is renamed onto its destination, which must be on the
+same filesystem.
+"""
+
+import base64
+import binascii
+import json
+import os
+import re
+import secrets
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent PATCHes are not serialized.
+    fcntl = None
+
+
+CHUNK_SIZE = 64 * 1024
+TUS_VERSION = "1.0.0"
+
+_UPLOAD_ID = re.compile(r"^[A-Za-z0-9_-]{32}$")
+
+
+class UploadError(ValueError):
+    """A request that does not fit the session; STATUS is the HTTP answer."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_upload_metadata(value):
+    """Decode an Upload-Metadata header into {key: str}.
+
+    The header is a comma-separated list of "key base64value" pairs; a key
+    may come without a value.  Raises ValueError on malformed input.
+
+    """
+    metadata = {}
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, encoded = item.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(encoded.strip(), validate=True).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError):
+            raise ValueError("Invalid Upload-Metadata")
+    return metadata
+
+
+class UploadSession:
+    def __init__(self, store, upload_id, info):
+        self.store = store
+        self.id = upload_id
+        self.destination = info["destination"]
+        self.length = info["length"]
+        self.part_path = store.path_for(upload_id, ".part")
+
+    @property
+    def offset(self):
+        return os.stat(self.part_path).st_size
+
+    @property
+    def expires_at(self):
+        return self.store.expires_at(self.part_path)
+
+    def append(self, rfile, offset, count):
+        """Write COUNT bytes from RFILE at OFFSET and return the new offset.
+
+        Bytes are written as they arrive.  If the body ends early, whatever
+        was received is kept; the client asks for the offset and resumes.
+
+        """
+        if offset + count > self.length:
+            raise UploadError(413, "Chunk runs past the declared upload length.")
+        fd = os.open(self.part_path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+        with open(fd, "wb") as part:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(part.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    raise UploadError(409, "Another request is writing to this upload.")
+            current = os.fstat(part.fileno()).st_size
+            if offset != current:
+                raise UploadError(409, "Upload-Offset does not match the upload.")
+            part.seek(current)
+            remaining = count
+            while remaining > 0:
+                chunk = rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                part.write(chunk)
+                remaining -= len(chunk)
+            part.flush()
+            return current + count - remaining
+
+    def commit(self, destination):
+        """Move the complete upload onto DESTINATION and end the session."""
+        os.replace(self.part_path, destination)
+        self.store.remove(self.id)
+
+
+class UploadStore:
+    """Resumable upload sessions kept as files under DIRECTORY.
+
+    Sessions without a write for TTL seconds expire and are removed.
+
+    """
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+
+    def path_for(self, upload_id, suffix):
+        return os.path.join(self.directory, upload_id + suffix)
+
+    def expires_at(self, path):
+        return os.stat(path).st_mtime + self.ttl
+
+    def create(self, destination, length):
+        """Start a session for LENGTH bytes bound for DESTINATION."""
+        os.makedirs(self.directory, exist_ok=True)
+        upload_id = secrets.token_urlsafe(24)
+        info = {"destination": destination, "length": length, "created": time.time()}
+        # Not tempfile.mkstemp(): that would leave the file mode at 0600.
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+        os.close(os.open(self.path_for(upload_id, ".part"), flags, 0o666))
+        with open(self.path_for(upload_id, ".json"), "w", encoding="utf-8") as handle:
+            json.dump(info, handle)
+        return UploadSession(self, upload_id, info)
+
+    def get(self, upload_id):
+        """Return the live session UPLOAD_ID, or None."""
+        if not _UPLOAD_ID.match(upload_id or ""):
+            return None
+        try:
+            with open(self.path_for(upload_id, ".json"), encoding="utf-8") as handle:
+                info = json.load(handle)
+            expires_at = self.expires_at(self.path_for(upload_id, ".part"))
+        except (OSError, ValueError):
+            return None
+        if expires_at <= time.time():
+            self.remove(upload_id)
+            return None
+        return UploadSession(self, upload_id, info)
+
+    def remove(self, upload_id):
+        for suffix in (".part", ".json"):
+            try:
+                os.unlink(self.path_for(upload_id, suffix))
+            except OSError:
+                pass
+
+    def expire(self):
+        """Remove every session that has not been written to within the TTL."""
+        now = time.time()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            upload_id, suffix = os.path.splitext(name)
+            if suffix != ".json":
+                continue
+            try:
+                expired = self.expires_at(self.path_for(upload_id, ".part")) <= now
+            except OSError:
+                # A session whose data is gone leaves only its metadata.
+                expired = True
+            if expired:
+                self.remove(upload_id)
@@ -0,0 +1,276 @@
+"""Streaming ZIP writer for archives sent straight to a client.
+
+Entries are emitted as local header, data and data descriptor while files are
+read, so nothing needs to be seekable and no temporary archive is created.
+ZIP64 records are added when an entry, the archive or the entry count grows
+past the classic format's limits.
+
+File data is deflated in independent blocks, each primed with the 32 KB
+before it, so the blocks can be compressed on a thread pool (zlib releases
+the GIL) and still join into one deflate stream.  The archive bytes do not
+depend on the number of workers.  Types that are already compressed are
+stored as they are.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import posixpath
+import stat
+import struct
+import threading
+import time
+import zlib
+
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_COUNT_LIMIT = 0xFFFF
+CHUNK_SIZE = 64 * 1024
+DEFLATE_BLOCK_SIZE = 1024 * 1024
+DEFLATE_WINDOW = 32 * 1024
+# File data one archive may hold while its blocks compress, however many
+# workers the pool has.
+MAX_LOOKAHEAD = 8 * DEFLATE_BLOCK_SIZE
+
+# Suffixes of formats that are compressed already; deflating them again
+# costs CPU for a few bytes at best.
+STORED_SUFFIXES = frozenset((
+    ".7z", ".aac", ".apk", ".avi", ".avif", ".br", ".bz2", ".docx", ".epub",
+    ".flac", ".gif", ".gz", ".heic", ".jar", ".jpeg", ".jpg", ".m4a", ".m4v",
+    ".mkv", ".mov", ".mp3", ".mp4", ".odp", ".ods", ".odt", ".ogg", ".opus",
+    ".png", ".pptx", ".rar", ".tbz2", ".tgz", ".txz", ".webm", ".webp",
+    ".whl", ".woff", ".woff2", ".xlsx", ".xz", ".zip", ".zst",
+))
+
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+_END_RECORD = struct.Struct("<4s4H2LH")
+_ZIP64_END_RECORD = struct.Struct("<4sQ2H2L4Q")
+_ZIP64_END_LOCATOR = struct.Struct("<4sLQL")
+
+
+# A final, empty fixed-Huffman block: ends a stream of sync-flushed blocks.
+_DEFLATE_END = b"\x03\x00"
+
+
+def deflate_block(data, level, zdict):
+    """Raw-deflate DATA as a sync-flushed block primed with ZDICT."""
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class CompressionPool:
+    """A thread pool shared by every archive being written, started on first use."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        """Return the pool, or None when compression runs on the caller's thread."""
+        if self.workers <= 1:
+            return None
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="simple-server-zip")
+            return self._executor
+
+
+def dos_datetime(timestamp):
+    year, month, day, hour, minute, second = time.localtime(timestamp)[:6]
+    if year < 1980:
+        return 0, (1 << 5) | 1
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class ZipStreamWriter:
+    """Write a ZIP archive through WRITE, a callable taking bytes.
+
+    With a CompressionPool of several workers, blocks of file data are
+    deflated on it while the writer reads ahead, holding up to two blocks
+    per worker and never more than MAX_LOOKAHEAD; entries still come out in
+    the order they were added.
+
+    """
+
+    def __init__(self, write, compression=ZIP_DEFLATED, compresslevel=6, pool=None):
+        self._write = write
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.executor = pool.executor() if pool is not None else None
+        if self.executor is not None:
+            self.lookahead = min(2 * pool.workers * DEFLATE_BLOCK_SIZE, MAX_LOOKAHEAD)
+        else:
+            self.lookahead = 0
+        self.offset = 0
+        self.entries = []
+        # Entry starts, data blocks and entry ends waiting to be written.
+        self._queue = deque()
+        self._queued_bytes = 0
+        self._current = None
+
+    def write(self, data):
+        self._write(data)
+        self.offset += len(data)
+
+    def add_directory(self, arcname, mtime):
+        arcname = arcname.rstrip("/") + "/"
+        self._add_entry(arcname, mtime, stat.S_IFDIR | 0o755, ZIP_STORED, iter(()), 0)
+
+    def method_for(self, arcname):
+        """Return the compression method for ARCNAME, storing compressed formats."""
+        if self.compression == ZIP_DEFLATED and self.compresslevel > 0:
+            if posixpath.splitext(arcname)[1].lower() not in STORED_SUFFIXES:
+                return ZIP_DEFLATED
+        return ZIP_STORED
+
+    def add_file(self, path, arcname, stat_result=None):
+        """Stream the file at PATH into the archive as ARCNAME."""
+        with open(path, "rb") as source:
+            self.add_fileobj(source, arcname, stat_result)
+
+    def add_fileobj(self, source, arcname, stat_result=None):
+        """Stream an open binary file into the archive as ARCNAME."""
+        if stat_result is None:
+            stat_result = os.fstat(source.fileno())
+        method = self.method_for(arcname)
+        size = DEFLATE_BLOCK_SIZE if method == ZIP_DEFLATED else CHUNK_SIZE
+        chunks = iter(lambda: source.read(size), b"")
+        self._add_entry(
+            arcname,
+            stat_result.st_mtime,
+            stat_result.st_mode,
+            method,
+            chunks,
+            stat_result.st_size,
+        )
+
+    def _add_entry(self, arcname, mtime, mode, method, chunks, expected_size):
+        self._enqueue(("start", arcname, mtime, mode, method, expected_size), 0)
+        window = b""
+        for chunk in chunks:
+            if method != ZIP_DEFLATED:
+                block = None
+            elif self.executor is None:
+                block = deflate_block(chunk, self.compresslevel, window)
+            else:
+                block = self.executor.submit(deflate_block, chunk, self.compresslevel, window)
+            if method == ZIP_DEFLATED:
+                window = (window + chunk)[-DEFLATE_WINDOW:]
+            self._enqueue(("data", chunk, block), len(chunk))
+        self._enqueue(("end",), 0)
+
+    def _enqueue(self, item, size):
+        self._queue.append(item)
+        self._queued_bytes += size
+        while self._queue and (self._queued_bytes > self.lookahead or self._queue[0][0] != "data"):
+            self._write_next()
+
+    def _write_next(self):
+        item = self._queue.popleft()
+        kind = item[0]
+        if kind == "data":
+            _, chunk, block = item
+            self._queued_bytes -= len(chunk)
+            if isinstance(block, Future):
+                block = block.result()
+            elif block is None:
+                block = chunk
+            entry = self._current
+            entry["crc"] = zlib.crc32(chunk, entry["crc"])
+            entry["file_size"] += len(chunk)
+            entry["compress_size"] += len(block)
+            self.write(block)
+        elif kind == "start":
+            self._start_entry(*item[1:])
+        else:
+            self._end_entry()
+
+    def _start_entry(self, arcname, mtime, mode, method, expected_size):
+        name = arcname.encode("utf-8")
+        flags = _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8
+        dos_time, dos_date = dos_datetime(mtime)
+        # Sizes are only known afterwards, so ZIP64 is decided from the
+        # expected size with headroom for incompressible data.
+        zip64 = expected_size * 1.05 > ZIP64_LIMIT
+        extra = struct.pack("<2H2Q", 1, 16, 0, 0) if zip64 else b""
+        self._current = {
+            "arcname": arcname, "name": name, "flags": flags, "method": method,
+            "dos_time": dos_time, "dos_date": dos_date, "mode": mode, "zip64": zip64,
+            "header_offset": self.offset, "crc": 0, "file_size": 0, "compress_size": 0,
+        }
+        self.write(_LOCAL_HEADER.pack(
+            b"PK\x03\x04", 45 if zip64 else 20, 0, flags, method, dos_time, dos_date,
+            0, ZIP64_LIMIT if zip64 else 0, ZIP64_LIMIT if zip64 else 0, len(name), len(extra),
+        ) + name + extra)
+
+    def _end_entry(self):
+        entry = self._current
+        self._current = None
+        if entry["method"] == ZIP_DEFLATED:
+            entry["compress_size"] += len(_DEFLATE_END)
+            self.write(_DEFLATE_END)
+        crc, compress_size, file_size = entry["crc"], entry["compress_size"], entry["file_size"]
+        zip64 = entry["zip64"]
+        if not zip64 and (file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT):
+            raise ValueError("%s grew past the size it was archived with" % entry["arcname"])
+
+        size_format = "<4sL2Q" if zip64 else "<4s3L"
+        self.write(struct.pack(size_format, b"PK\x07\x08", crc, compress_size, file_size))
+        self.entries.append((entry["name"], entry["flags"], entry["method"], entry["dos_time"],
+                             entry["dos_date"], crc, compress_size, file_size, entry["mode"],
+                             entry["header_offset"]))
+
+    def close(self):
+        """Write any queued entries, the central directory and end records."""
+        while self._queue:
+            self._write_next()
+        directory_offset = self.offset
+        for (name, flags, method, dos_time, dos_date, crc, compress_size,
+             file_size, mode, header_offset) in self.entries:
+            zip64_fields = []
+            if file_size >= ZIP64_LIMIT:
+                zip64_fields.append(file_size)
+                file_size = ZIP64_LIMIT
+            if compress_size >= ZIP64_LIMIT:
+                zip64_fields.append(compress_size)
+                compress_size = ZIP64_LIMIT
+            if header_offset >= ZIP64_LIMIT:
+                zip64_fields.append(header_offset)
+                header_offset = ZIP64_LIMIT
+            extra = b""
+            if zip64_fields:
+                extra = struct.pack("<2H%dQ" % len(zip64_fields), 1, 8 * len(zip64_fields), *zip64_fields)
+            version = 45 if zip64_fields else 20
+            external_attr = (mode & 0xFFFF) << 16
+            if stat.S_ISDIR(mode):
+                external_attr |= 0x10
+            self.write(_CENTRAL_HEADER.pack(
+                b"PK\x01\x02", version, 3, version, 0, flags, method, dos_time, dos_date,
+                crc, compress_size, file_size, len(name), len(extra), 0, 0, 0,
+                external_attr, header_offset,
+            ) + name + extra)
+
+        directory_size = self.offset - directory_offset
+        count = len(self.entries)
+        if count >= ZIP_COUNT_LIMIT or directory_size >= ZIP64_LIMIT or directory_offset >= ZIP64_LIMIT:
+            zip64_end_offset = self.offset
+            self.write(_ZIP64_END_RECORD.pack(
+                b"PK\x06\x06", _ZIP64_END_RECORD.size - 12, 45, 45, 0, 0,
+                count, count, directory_size, directory_offset,
+            ))
+            self.write(_ZIP64_END_LOCATOR.pack(b"PK\x06\x07", 0, zip64_end_offset, 1))
+            count = min(count, ZIP_COUNT_LIMIT)
+            directory_size = min(directory_size, ZIP64_LIMIT)
+            directory_offset = min(directory_offset, ZIP64_LIMIT)
+        self.write(_END_RECORD.pack(
+            b"PK\x05\x06", 0, 0, count, count, directory_size, directory_offset, 0,
+        ))
@@ -13,13 +13,20 @@ __all__ = ["SimpleHTTPRequestHandler"]
 __author__ = "gil"
 __home_page__ = "http://adrianogil.github.io"
 
+import base64
+import collections
+import errno
+import fnmatch
+import heapq
 import ntpath
+import operator
 import os
 import posixpath
 import urllib
-import cgi
 from datetime import timezone
 from email.utils import parsedate_to_datetime
+import gzip
+import hashlib
 import html
 import shutil
 import mimetypes
@@ -28,18 +35,63 @@ from io import BytesIO
 import atexit
 import json
 import ipaddress
+import logging
+import logging.handlers
+import math
+import multiprocessing.managers
 import signal
 import socket
+import stat
+import tempfile
 import time
 import secrets
+import zlib
 from http import cookies
 
+from simple_multipart import IncompleteBody, MultipartError, MultipartParser, parse_content_type
 from simple_qr import qr_svg
+from simple_tar import TarStreamWriter, walk_tree
+from simple_templates import Template
+from simple_uploads import TUS_VERSION, UploadError, UploadStore, parse_upload_metadata
+from simple_zip import CompressionPool, ZipStreamWriter
 
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from socketserver import ThreadingMixIn
+import asyncio
+import concurrent.futures
+import itertools
+import queue
+import selectors
 import threading
-import sys, zipfile
+import sys
+
+
+logger = logging.getLogger("simpleserver")
+logger.addHandler(logging.NullHandler())
+
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "off": logging.CRITICAL + 1,
+}
+
+
+def configure_logging(level):
+    """Route log records through a queue so request threads never block on stderr.
+
+    Returns the listener thread that writes the records; stop it to flush.
+
+    """
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(sys.stderr))
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    listener.start()
+    return listener
 
 
 def sizeof_fmt(num, suffix='B'):
@@ -89,6 +141,18 @@ def resolve_contained_child(root, child_name, parent=None):
     return destination
 
 
+def resolve_upload_name(name):
+    """Resolve the exact file NAME of a resumable upload in the served root.
+
+    The name comes base64-encoded in Upload-Metadata and is used as given;
+    it is quoted so resolve_contained_child() does not unquote it again.
+
+    """
+    if not isinstance(name, str):
+        raise ValueError("Invalid file or folder name")
+    return resolve_contained_child(os.getcwd(), urllib.parse.quote(name, safe=""))
+
+
 def parse_http_date(value):
     try:
         parsed = parsedate_to_datetime(value)
@@ -99,27 +163,938 @@ def parse_http_date(value):
     return parsed.timestamp()
 
 
-def parse_byte_range(value, file_size):
-    unit, separator, range_spec = value.partition('=')
-    if not separator or unit.strip().lower() != 'bytes' or ',' in range_spec:
+def parse_byte_ranges(value, file_size, max_ranges=None):
+    """Parse a Range header into sorted, coalesced (start, end) pairs.
+
+    Overlapping and adjacent ranges are merged.  Returns None when the
+    header should be ignored: another unit, or more than MAX_RANGES ranges
+    left after merging.  Raises ValueError when no range is satisfiable.
+
+    """
+    unit, separator, range_set = value.partition('=')
+    if not separator or unit.strip().lower() != 'bytes':
         return None
 
-    match = re.fullmatch(r"(\d*)-(\d*)", range_spec.strip())
-    if not match or not any(match.groups()) or file_size == 0:
+    ranges = []
+    for range_spec in range_set.split(','):
+        match = re.fullmatch(r"(\d*)-(\d*)", range_spec.strip())
+        if not match or not any(match.groups()):
+            raise ValueError("Unsatisfiable byte range")
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = int(last) if last else file_size - 1
+            if last and end < start:
+                raise ValueError("Unsatisfiable byte range")
+            if start < file_size:
+                ranges.append((start, min(end, file_size - 1)))
+        elif int(last) > 0 and file_size > 0:
+            ranges.append((max(0, file_size - int(last)), file_size - 1))
+    if not ranges:
         raise ValueError("Unsatisfiable byte range")
 
-    first, last = match.groups()
-    if first:
-        start = int(first)
-        end = int(last) if last else file_size - 1
-        if start >= file_size or end < start:
-            raise ValueError("Unsatisfiable byte range")
-        return start, min(end, file_size - 1)
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    if max_ranges is not None and len(merged) > max_ranges:
+        return None
+    return merged
+
+
+def advise_sequential_read(fd, offset, length, readahead):
+    """Tell the kernel LENGTH bytes of FD are about to be read from OFFSET.
+
+    SEQUENTIAL widens the file's read-ahead window and WILLNEED starts
+    reading the first READAHEAD bytes of the range in the background, so a
+    seek into a large file does not start cold.
+
+    """
+    try:
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fd, offset, min(length, readahead), os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+
+
+def drop_cached_pages(fd, offset, length):
+    """Let the kernel drop the page cache of a range that was just sent."""
+    try:
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+
+
+class ByteBudgetCache:
+    """Thread-safe LRU mapping bounded by the total size of its values.
+
+    Callers pass each value's size in bytes; least recently used items are
+    evicted once the budget is exceeded.  A budget of 0 disables the cache.
+
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.items = collections.OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.items:
+                self.current_bytes -= self.items.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self.items[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self.current_bytes -= self.items.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.items),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class CachedFile:
+    """One OpenFileCache entry: a descriptor with what is known about it."""
+
+    def __init__(self, fd, file_stat, etag, content_type, checked_at, error=None):
+        self.fd = fd
+        self.stat = file_stat
+        self.etag = etag
+        self.content_type = content_type
+        self.checked_at = checked_at
+        # (errno, strerror) of a failed open, cached like a success.
+        self.error = error
+        self.refs = 0
+        self.retired = False
+
+
+class SharedFile:
+    """A reader over a cached descriptor that keeps its own position.
+
+    Reads go through os.pread() and sendfile is given explicit offsets, so
+    any number of SharedFiles can use the same descriptor at once.
+
+    """
+
+    mode = "rb"
+
+    def __init__(self, cache, entry):
+        self.cache = cache
+        self.entry = entry
+        self.position = 0
+        self.closed = False
+
+    def fileno(self):
+        return self.entry.fd
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.entry.stat.st_size
+        self.position = offset
+        return offset
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = max(self.entry.stat.st_size - self.position, 0)
+        data = os.pread(self.entry.fd, size, self.position)
+        self.position += len(data)
+        return data
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.cache.release(self.entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class OpenFileCache:
+    """Keep hot files open together with their stat results, ETags and types.
+
+    Modeled on nginx's open_file_cache.  An entry is trusted for VALID_FOR
+    seconds and then revalidated with one os.stat(); a file that changed is
+    reopened.  Failed opens are cached the same way, so probing for missing
+    sidecars stays cheap.  At most MAX_FDS entries are kept, least recently
+    used first out, and 0 disables the cache.  An evicted descriptor is
+    closed once its last reader is done with it.
+
+    """
+
+    def __init__(self, max_fds=0, valid_for=1.0):
+        self.max_fds = max_fds
+        self.valid_for = valid_for
+        self.entries = collections.OrderedDict()
+        self.open_fds = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def open(self, path, describe):
+        """Return a SharedFile for the regular file at PATH or raise OSError.
+
+        DESCRIBE(path, stat) returns the (etag, content_type) stored with a
+        newly opened file.
+
+        """
+        return SharedFile(self, self._lookup(path, describe, acquire=True))
+
+    def stat(self, path, describe):
+        """Return the cached stat result of PATH or raise OSError."""
+        return self._lookup(path, describe, acquire=False).stat
+
+    def holds_file(self, path):
+        """Return True when PATH is cached as a regular file that needs no revalidation."""
+        with self.lock:
+            entry = self.entries.get(path)
+            return (
+                entry is not None
+                and entry.error is None
+                and time.monotonic() - entry.checked_at < self.valid_for
+            )
+
+    def release(self, entry):
+        with self.lock:
+            entry.refs -= 1
+            if entry.retired and entry.refs == 0:
+                os.close(entry.fd)
+
+    def _use(self, entry, acquire):
+        if entry.error is not None:
+            raise OSError(*entry.error)
+        if acquire:
+            entry.refs += 1
+        return entry
+
+    def _retire(self, entry):
+        if entry.fd is None:
+            return
+        entry.retired = True
+        self.open_fds -= 1
+        if entry.refs == 0:
+            os.close(entry.fd)
+
+    def _lookup(self, path, describe, acquire):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and now - entry.checked_at < self.valid_for:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return self._use(entry, acquire)
+        if entry is not None and entry.error is None:
+            try:
+                current = os.stat(path)
+            except OSError:
+                current = None
+            if current is not None and (
+                current.st_dev, current.st_ino, current.st_size, current.st_mtime_ns,
+            ) == (
+                entry.stat.st_dev, entry.stat.st_ino, entry.stat.st_size, entry.stat.st_mtime_ns,
+            ):
+                with self.lock:
+                    if self.entries.get(path) is entry:
+                        entry.checked_at = now
+                        self.entries.move_to_end(path)
+                        self.revalidations += 1
+                        return self._use(entry, acquire)
+
+        entry = self._open(path, describe, now)
+        with self.lock:
+            self.misses += 1
+            previous = self.entries.pop(path, None)
+            if previous is not None:
+                self._retire(previous)
+            self.entries[path] = entry
+            if entry.fd is not None:
+                self.open_fds += 1
+            while len(self.entries) > self.max_fds:
+                self._retire(self.entries.popitem(last=False)[1])
+                self.evictions += 1
+            return self._use(entry, acquire)
+
+    def _open(self, path, describe, now):
+        # O_NONBLOCK keeps a FIFO from stalling the open; only regular
+        # files are kept.
+        flags = os.O_RDONLY | getattr(os, "O_BINARY", 0) | getattr(os, "O_NONBLOCK", 0)
+        try:
+            fd = os.open(path, flags)
+        except OSError as error:
+            return CachedFile(None, None, None, None, now, (error.errno, error.strerror, path))
+        try:
+            file_stat = os.fstat(fd)
+        except OSError as error:
+            os.close(fd)
+            return CachedFile(None, None, None, None, now, (error.errno, error.strerror, path))
+        if not stat.S_ISREG(file_stat.st_mode):
+            os.close(fd)
+            return CachedFile(None, None, None, None, now, (errno.EISDIR, "Not a regular file", path))
+        etag, content_type = describe(path, file_stat)
+        return CachedFile(fd, file_stat, etag, content_type, now)
+
+    def clear(self):
+        with self.lock:
+            for entry in self.entries.values():
+                self._retire(entry)
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "open_fds": self.open_fds,
+                "max_fds": self.max_fds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+            }
+
+
+def tree_fingerprint(entries, *salt):
+    """Hash the (arcname, path, stat) entries of a walked tree.
+
+    Names, sizes and mtime_ns go in, so any added, removed, renamed or
+    modified entry gives another fingerprint.  SALT holds the archive
+    format and settings that also change the archive bytes.
+
+    """
+    digest = hashlib.sha256(repr(salt).encode("utf-8"))
+    for arcname, _, file_stat in entries:
+        digest.update(arcname.encode("utf-8", "surrogateescape"))
+        digest.update(b"\0%d\0%d\n" % (file_stat.st_size, file_stat.st_mtime_ns))
+    return digest.hexdigest()
+
+
+# Directory download formats: ?download=FORMAT -> (Content-Type, suffix).
+ARCHIVE_FORMATS = {
+    "zip": ("application/zip", ".zip"),
+    "tar": ("application/x-tar", ".tar"),
+    "tar.gz": ("application/gzip", ".tar.gz"),
+}
+
+
+class ArchiveCache:
+    """Finished directory archives kept as files in a cache directory.
+
+    Each archive is named by the fingerprint of the tree it was built from,
+    so a changed tree simply misses.  The directory should live outside the
+    served tree.  Access times order the files for LRU eviction once their
+    total size passes max_bytes; keeping that state on disk lets worker
+    processes share the cache and a restart keep it.
+
+    """
+
+    suffix = ".zip"
+
+    def __init__(self, directory=None, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """Return the path of the archive for KEY, or None."""
+        path = self.path_for(key)
+        try:
+            file_stat = os.stat(path)
+            # Mark it used without touching mtime, which the ETag includes.
+            os.utime(path, ns=(time.time_ns(), file_stat.st_mtime_ns))
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return path
+
+    def create(self):
+        """Return (file, path) of a new partial archive in the cache directory."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix=".part-", dir=self.directory)
+        return os.fdopen(fd, "wb"), path
+
+    def commit(self, key, partial_path):
+        """Move a complete partial archive into place and evict down to budget."""
+        os.replace(partial_path, self.path_for(key))
+        self.evict()
+
+    def discard(self, partial_path):
+        try:
+            os.unlink(partial_path)
+        except OSError:
+            pass
+
+    def scan(self):
+        """Return [(atime_ns, size, path)] for the cached archives."""
+        archives = []
+        try:
+            with os.scandir(self.directory) as scanner:
+                for entry in scanner:
+                    if not entry.name.endswith(self.suffix) or entry.name.startswith("."):
+                        continue
+                    try:
+                        file_stat = entry.stat()
+                    except OSError:
+                        continue
+                    archives.append((file_stat.st_atime_ns, file_stat.st_size, entry.path))
+        except OSError:
+            pass
+        return archives
+
+    def evict(self):
+        archives = sorted(self.scan())
+        total = sum(size for _, size, _ in archives)
+        for _, size, path in archives:
+            if total <= self.max_bytes:
+                break
+            try:
+                # Downloads already reading the file keep their descriptor.
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            with self.lock:
+                self.evictions += 1
+
+    def stats(self):
+        archives = self.scan() if self.directory else []
+        with self.lock:
+            return {
+                "entries": len(archives),
+                "bytes": sum(size for _, size, _ in archives),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+ListingEntry = collections.namedtuple(
+    "ListingEntry", "name is_dir is_link size mtime_ns inode",
+)
+
+
+ListingPage = collections.namedtuple("ListingPage", "entries total start")
+
+# Sort keys end with the exact name so that every key is unique and can
+# serve as a pagination cursor.
+LISTING_SORT_FIELDS = {
+    "name": (str, str),
+    "size": (int, str, str),
+    "mtime": (int, str, str),
+}
+
+
+def make_listing_entry(dir_entry):
+    """Build a ListingEntry from a DirEntry with one stat call; None if it vanished."""
+    try:
+        is_link = dir_entry.is_symlink()
+        try:
+            fs = dir_entry.stat()
+        except FileNotFoundError:
+            if not is_link:
+                return None
+            # A dangling symlink is still listed, as the link itself.
+            fs = dir_entry.stat(follow_symlinks=False)
+    except OSError:
+        return None
+    is_dir = stat.S_ISDIR(fs.st_mode)
+    return ListingEntry(
+        dir_entry.name,
+        is_dir,
+        is_link,
+        0 if is_dir else fs.st_size,
+        fs.st_mtime_ns,
+        fs.st_ino,
+    )
+
+
+def listing_sort_key(entry, sort):
+    if sort == "name":
+        return (entry.name.lower(), entry.name)
+    value = entry.size if sort == "size" else entry.mtime_ns
+    return (value, entry.name.lower(), entry.name)
+
+
+def encode_cursor(sort, descending, key):
+    order = "desc" if descending else "asc"
+    data = json.dumps([sort, order] + list(key), separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(value, sort, descending):
+    """Return the sort key inside a cursor made by encode_cursor() for this order."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    fields = LISTING_SORT_FIELDS[sort]
+    if (
+        not isinstance(data, list)
+        or data[:2] != [sort, "desc" if descending else "asc"]
+        or len(data) != len(fields) + 2
+        or not all(type(item) is field for item, field in zip(data[2:], fields))
+    ):
+        raise ValueError("Invalid cursor")
+    return tuple(data[2:])
 
-    suffix_length = int(last)
-    if suffix_length <= 0:
-        raise ValueError("Unsatisfiable byte range")
-    return max(0, file_size - suffix_length), file_size - 1
+
+def select_listing_page(dir_entries, limit, sort="name", descending=False,
+                        after=None, before=None, match=None):
+    """Pick one sorted page out of DIR_ENTRIES (an os.scandir() iterator).
+
+    Only LIMIT entries are held at a time, however large the directory is.
+    AFTER and BEFORE are sort keys from decode_cursor(): the page holds the
+    first LIMIT entries after AFTER, or the last LIMIT entries before BEFORE.
+    MATCH is an optional glob applied to names.  When sorting by name, only
+    the entries that make it onto the page are stat'ed.
+
+    """
+    counts = {"total": 0, "in_range": 0}
+
+    def candidates():
+        for dir_entry in dir_entries:
+            if match is not None and not fnmatch.fnmatchcase(dir_entry.name, match):
+                continue
+            item = dir_entry if sort == "name" else make_listing_entry(dir_entry)
+            if item is None:
+                continue
+            key = listing_sort_key(item, sort)
+            counts["total"] += 1
+            if after is not None and not (key < after if descending else key > after):
+                continue
+            if before is not None and not (key > before if descending else key < before):
+                continue
+            counts["in_range"] += 1
+            yield key, item
+
+    take_last = before is not None and after is None
+    pick = heapq.nsmallest if descending == take_last else heapq.nlargest
+    selected = pick(limit, candidates(), key=operator.itemgetter(0))
+    if take_last:
+        selected.reverse()
+        start = counts["in_range"] - len(selected)
+    else:
+        start = counts["total"] - counts["in_range"]
+    entries = []
+    for _, item in selected:
+        if not isinstance(item, ListingEntry):
+            item = make_listing_entry(item)
+        if item is not None:
+            entries.append(item)
+    return ListingPage(entries, counts["total"], start)
+
+
+def format_file_etag(inode, mtime_ns, size):
+    return '"%x-%x-%x"' % (inode, mtime_ns, size)
+
+
+def format_mtime(mtime_ns):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(mtime_ns // 1000000000))
+
+
+def content_disposition(filename, disposition="attachment"):
+    fallback = filename.encode("ascii", "replace").decode("ascii").replace('"', "_").replace("?", "_")
+    return '%s; filename="%s"; filename*=UTF-8\'\'%s' % (
+        disposition, fallback, urllib.parse.quote(filename, safe=""),
+    )
+
+
+class ChunkedWriter:
+    """Buffer a body of unknown length and send it in chunked transfer coding.
+
+    With CHUNKED false (HTTP/1.0 clients) the bytes are written as they are
+    and the end of the body is marked by closing the connection.
+
+    """
+
+    def __init__(self, wfile, chunked=True, buffer_size=64 * 1024):
+        self.wfile = wfile
+        self.chunked = chunked
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.chunked:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(self.buffer), self.buffer))
+        else:
+            self.wfile.write(self.buffer)
+        self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        if self.chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
+
+class GzipWriter:
+    """Gzip everything written through it into OUT as it arrives.
+
+    Up to KEEP bytes of compressed output are also kept, so a response that
+    fits can be cached afterwards; getvalue() returns None once it outgrew
+    KEEP.
+
+    """
+
+    def __init__(self, out, level, keep=0):
+        self.out = out
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        self.keep = keep
+        self.kept = []
+        self.kept_size = 0
+
+    def _emit(self, data):
+        if not data:
+            return
+        self.out.write(data)
+        if self.kept is not None:
+            self.kept_size += len(data)
+            if self.kept_size > self.keep:
+                self.kept = None
+            else:
+                self.kept.append(data)
+
+    def write(self, data):
+        self._emit(self.compressor.compress(data))
+        return len(data)
+
+    def flush(self):
+        """Push out everything written so far, e.g. a page head before its rows."""
+        self._emit(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+        self.out.flush()
+
+    def finish(self):
+        """Write the end of the gzip stream without closing OUT."""
+        self._emit(self.compressor.flush())
+
+    def close(self):
+        self.finish()
+        self.out.close()
+
+    def getvalue(self):
+        return None if self.kept is None else b"".join(self.kept)
+
+
+def parse_accept_encoding(value):
+    """Return {coding: q} for an Accept-Encoding header, ignoring bad q-values."""
+    codings = {}
+    for item in (value or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, number = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def accepts_encoding(value, coding):
+    codings = parse_accept_encoding(value)
+    return codings.get(coding, codings.get("*", 0.0)) > 0
+
+
+# Precompressed sidecars: FILE.gz or FILE.zst is served in place of FILE to
+# clients that accept the coding.  The server only passes the bytes on, so
+# no compression library is needed for either.
+PRECOMPRESSED_SUFFIXES = {
+    "zstd": ".zst",
+    "gzip": ".gz",
+}
+
+
+# Types worth gzipping on the fly.  Anything else, including archives,
+# images, audio and video, is already compressed or not worth the CPU.
+COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/x-javascript",
+    "application/xhtml+xml",
+    "application/xml",
+    "image/svg+xml",
+}
+
+
+def is_compressible_type(content_type):
+    content_type = content_type.partition(";")[0].strip().lower()
+    return (
+        content_type.startswith("text/")
+        or content_type in COMPRESSIBLE_TYPES
+        or content_type.endswith(("+json", "+xml"))
+    )
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_TYPES = {
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+}
+
+
+def load_static_assets(directory=STATIC_DIR):
+    """Read the page stylesheets and scripts and give each a content-hashed URL.
+
+    Returns ({name: url}, {url filename: asset}); each asset keeps its bytes,
+    a gzip variant compressed once here, its content type and ETag.
+
+    """
+    urls = {}
+    files = {}
+    for name in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(name)
+        if extension not in STATIC_TYPES:
+            continue
+        with open(os.path.join(directory, name), "rb") as source:
+            body = source.read()
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        filename = "%s.%s%s" % (stem, digest, extension)
+        files[filename] = {
+            "body": body,
+            "gzip": gzip.compress(body, 9, mtime=0),
+            "content_type": STATIC_TYPES[extension],
+            "etag": '"%s"' % digest,
+        }
+        urls[name] = "/__static__/" + filename
+    return urls, files
+
+
+STATIC_URLS, STATIC_FILES = load_static_assets()
+
+
+def page_head_source(title, stylesheet):
+    """Return the HTML source every page starts with, up to <body>."""
+    return (
+        "<!DOCTYPE html>\n"
+        "<html lang=\"en\">\n"
+        "<head>\n"
+        "<meta charset=\"utf-8\">\n"
+        "<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">\n"
+        "<script src=\"%s\"></script>\n"
+        "<title>%s</title>\n"
+        "<link rel=\"stylesheet\" href=\"%s\">\n"
+        "</head>\n"
+        "<body>\n"
+    ) % (STATIC_URLS["theme.js"], title, STATIC_URLS[stylesheet])
+
+
+def page_source(title, stylesheet, body, script=None):
+    """Return the HTML source of a whole page around BODY."""
+    if script:
+        body += "<script src=\"%s\"></script>\n" % STATIC_URLS[script]
+    return page_head_source(title, stylesheet) + body + "</body>\n</html>\n"
+
+
+FOOTER = (
+    "<div class=\"footer\">Powered By: Gil, check new version at "
+    "<a href=\"https://github.com/adrianogil/simple-server\">here</a>.</div>\n"
+)
+
+LOGIN_PAGE = Template(page_source("Server Login", "login.css", (
+    "<div class=\"card\">\n"
+    "<h2 class=\"title\">Password required</h2>\n"
+    "<p class=\"subtitle\">Enter the server password to continue.</p>\n"
+    "{message}"
+    "<form method=\"post\" action=\"/__login__\">\n"
+    "<input type=\"hidden\" name=\"next\" value=\"{next_path}\">\n"
+    "<label for=\"password\">Password</label>\n"
+    "<input id=\"password\" name=\"password\" type=\"password\" autofocus required>\n"
+    "<button class=\"btn\" type=\"submit\">Sign in</button>\n"
+    "</form>\n"
+    "</div>\n"
+)))
+
+RESULT_PAGE = Template(page_source("{title}", "dialog.css", (
+    "<div class=\"card\">\n"
+    "<h2 class=\"title\">{heading}</h2>\n"
+    "<div class=\"status {status_class}\">{status_text}</div>\n"
+    "{message}"
+    "<div class=\"actions\"><a href=\"{back}\">Back to listing</a></div>\n"
+    + FOOTER +
+    "</div>\n"
+)))
+
+CONNECT_PAGE = Template(page_source("Connect a device", "connect.css", (
+    "<main class=\"container\">\n"
+    "<header class=\"page-header\"><a class=\"back\" href=\"/\">&larr; Back to files</a>"
+    "<h1>Connect a device</h1><p>Open the URL or scan its QR code from a phone or tablet "
+    "on the same network.</p></header>\n"
+    "{notice}\n"
+    "<section class=\"connections\" aria-label=\"Available connection addresses\">{cards}</section>\n"
+    "</main>\n"
+), script="connect.js"))
+
+
+def listing_head_source(read_only, logout):
+    """Return the listing page source up to the first entry row."""
+    parts = [
+        "<div class=\"container\">\n"
+        "<div class=\"card\">\n"
+        "<div class=\"header\">\n"
+        "<h2>%s</h2>\n"
+        "<div class=\"path\">{path}</div>\n"
+        "</div>\n" % ("Shared directory" if read_only else "Directory listing")
+    ]
+    if not read_only:
+        parts.append(
+            "<div class=\"upload-panel\">\n"
+            "<form id=\"upload-form\" class=\"upload-form\" ENCTYPE=\"multipart/form-data\" method=\"post\">\n"
+            "<label id=\"upload-dropzone\" class=\"upload-dropzone\" for=\"upload-input\" tabindex=\"0\">\n"
+            "<strong>Drop files here or choose files</strong>\n"
+            "<span class=\"upload-hint\">Files upload individually so each transfer can be tracked or cancelled.</span>\n"
+            "<input id=\"upload-input\" name=\"file\" type=\"file\" multiple>\n"
+            "</label>\n"
+            "<div class=\"upload-controls\">\n"
+            "<button id=\"upload-submit\" class=\"btn\" type=\"submit\">Upload selected</button>\n"
+            "<button id=\"refresh-list\" class=\"btn secondary\" type=\"button\" hidden>Refresh listing</button>\n"
+            "</div>\n"
+            "</form>\n"
+            "<ul id=\"upload-queue\" class=\"upload-queue\" aria-live=\"polite\"></ul>\n"
+            "</div>\n"
+        )
+    parts.append("<div class=\"actions\">\n")
+    if not read_only:
+        parts.append(
+            "<form ENCTYPE=\"multipart/form-data\">"
+            "<label for=\"folderName\"><small>Create folder:</small></label>"
+            "<input type=\"text\" id=\"folderName\" placeholder=\"New folder\">"
+            "<button class=\"btn secondary\" type=\"button\" onclick=\"{create_folder}\">Create</button>"
+            "</form>\n"
+            "<form id=\"download-form\" class=\"download-form\" method=\"get\" action='{download}'>"
+            "<label for=\"download-format\"><small>Download as:</small></label>"
+            "<select id=\"download-format\" name=\"download\">"
+            "<option value=\"zip\" selected>zip</option>"
+            "<option value=\"tar\">tar</option>"
+            "<option value=\"tar.gz\">tar.gz</option>"
+            "</select>"
+            "<input type=\"hidden\" name=\"dir\" value='{download}'>"
+            "<button class=\"btn\" type=\"submit\">Download</button>"
+            "<button id=\"download-selected\" class=\"btn secondary\" type=\"submit\" "
+            "formmethod=\"post\" formaction=\"/__download__\" disabled>Download selected</button>"
+            "</form>\n"
+            "<a class=\"btn secondary\" href='/__connect__'>Connect devices</a>\n"
+            "<div class=\"share-settings\">"
+            "<label for=\"share-expiry\"><small>Share expires:</small></label>"
+            "<select id=\"share-expiry\">"
+            "<option value=\"900\">15 minutes</option>"
+            "<option value=\"3600\" selected>1 hour</option>"
+            "<option value=\"86400\">24 hours</option>"
+            "</select></div>\n"
+        )
+    parts.append("<button class=\"btn secondary\" type=\"button\" id=\"theme-toggle\">Light mode</button>\n")
+    if logout:
+        parts.append("<a class=\"btn secondary\" href='/__logout__'>Logout</a>\n")
+    parts.append("</div>\n")
+    if not read_only:
+        parts.append(
+            "<div id=\"share-result\" class=\"share-result\" hidden>\n"
+            "<input id=\"share-link\" class=\"share-link\" type=\"text\" readonly aria-label=\"Generated share link\">\n"
+            "<button id=\"copy-share\" class=\"btn secondary\" type=\"button\">Copy</button>\n"
+            "<span id=\"share-status\" class=\"share-status\" aria-live=\"polite\"></span>\n"
+            "</div>\n"
+        )
+    parts.append("<ul class=\"list\">\n{parent}")
+    return page_head_source("Directory listing for {path}", "listing.css") + "".join(parts)
+
+
+# Keyed by (read_only, logout); a shared listing never shows Logout.
+LISTING_HEADS = {
+    (read_only, logout): Template(listing_head_source(read_only, logout))
+    for read_only in (False, True)
+    for logout in (False, True)
+}
+
+# Rows are the hot loop of a listing: they are formatted as str and the
+# whole page of rows is encoded at once.
+LISTING_ROWS = {
+    True: (
+        "<li><a class=\"file-link\" href=\"%(href)s\">%(name)s</a><div class=\"file-meta\">"
+        "%(size)s<time>%(mtime)s</time></div></li>\n"
+    ),
+    False: (
+        "<li><label class=\"select-entry\"><input type=\"checkbox\" name=\"path\" value=\"%(value)s\" "
+        "form=\"download-form\" aria-label=\"Select %(name)s\"></label>"
+        "<a class=\"file-link\" href=\"%(href)s\">%(name)s</a><div class=\"file-meta\">"
+        "%(size)s<time>%(mtime)s</time>"
+        "<button class=\"share-button\" type=\"button\" data-scope=\"%(scope)s%(href)s\">Share</button>"
+        "<a class=\"delete\" href=\"?deletefile=%(name)s\">Delete</a></div></li>\n"
+    ),
+}
+
+LISTING_TAIL = Template(
+    "</ul>\n"
+    "{pages}"
+    "<div class=\"footer\">Powered By: Gil, check new version "
+    "<a href=\"https://github.com/adrianogil/simple-server\">here</a>.</div>\n"
+    "</div>\n</div>\n"
+    "<script src=\"{listing_js}\"></script>\n"
+    "</body>\n</html>\n",
+    listing_js=STATIC_URLS["listing.js"],
+)
 
 
 def discover_lan_addresses():
@@ -219,6 +1194,13 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
     """
 
     server_version = "SimpleHTTPWithUpload/" + __version__
+    protocol_version = "HTTP/1.1"
+    # Headers and small bodies are separate writes; without TCP_NODELAY a
+    # reused connection can stall on delayed ACKs between them.
+    disable_nagle_algorithm = True
+    keep_alive_timeout = 15
+    max_keep_alive_requests = 100
+    keep_alive_error_codes = frozenset((403, 404, 410))
     server_password = None
     session_duration_seconds = 1800
     session_cookie_name = "SimpleServerSession"
@@ -228,7 +1210,170 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
     share_lock = threading.Lock()
     share_expiry_options = (900, 3600, 86400)
     max_share_links = 1000
+    # Largest form body accepted by the selected-files download endpoint.
+    max_batch_request_size = 1024 * 1024
+    # Resumable uploads are staged in this directory of the served root and
+    # expire after upload_session_ttl seconds without a write.
+    upload_staging_dir = ".simple-server-uploads"
+    upload_session_ttl = 24 * 60 * 60
+    # Form uploads are written to a hidden file like this beside their
+    # destination and renamed into place once the whole body has arrived.
+    upload_temp_name = re.compile(r"\.upload-[0-9a-f]{16}\.part\Z")
     copy_buffer_size = 64 * 1024
+    use_sendfile = True
+    # Rendered listings, keyed on the directory's mtime_ns.
+    listing_cache = ByteBudgetCache(16 * 1024 * 1024)
+    # Directories changed this recently are not cached: a second change
+    # within the file system's timestamp granularity would go unnoticed.
+    listing_cache_min_age = 1.0
+    listing_page_size = 1000
+    listing_max_page_size = 10000
+    # Codings whose sidecars may replace a file, preferred first on equal q.
+    precompressed_encodings = ("zstd", "gzip")
+    # On-the-fly gzip for text files, listings and JSON; level 0 turns it off.
+    gzip_level = 6
+    gzip_min_size = 1024
+    # Compressed file and listing bodies, keyed on (representation ETag, level).
+    gzip_cache = ByteBudgetCache(32 * 1024 * 1024)
+    # Each response keeps at most this much compressed output for the cache.
+    gzip_cache_max_entry_size = 1024 * 1024
+    # Descriptors, stat results, ETags and types of hot files; off by default.
+    open_file_cache = OpenFileCache()
+    # Bodies of files up to small_file_max_size, keyed on path and identity.
+    small_file_cache = ByteBudgetCache(16 * 1024 * 1024)
+    small_file_max_size = 256 * 1024
+    # Like listing_cache_min_age: a file this fresh may still be changing
+    # within the file system's timestamp granularity.
+    small_file_min_age = 1.0
+    # Ranges left after merging beyond which a Range header is ignored.
+    max_byte_ranges = 64
+    # posix_fadvise() hints: bodies of at least fadvise_min_size are read
+    # sequentially with up to readahead_max bytes prefetched, and the pages
+    # of bodies of at least drop_cache_min_size are dropped once sent so a
+    # one-off huge download does not evict the hot working set.  0 disables.
+    fadvise_min_size = 1024 * 1024
+    readahead_max = 8 * 1024 * 1024
+    drop_cache_min_size = 1024 * 1024 * 1024
+    # Directory downloads: deflate level (0 stores every entry) and the
+    # threads that compress archive blocks, shared by all downloads.
+    zip_level = 6
+    zip_pool = CompressionPool(os.cpu_count() or 1)
+    # Finished directory archives, kept when --archive-cache names a directory.
+    archive_cache = ArchiveCache()
+    transfer_mode = None
+    content_disposition = None
+    # Set when an idle keep-alive connection is handed back to the server.
+    park_requested = False
+
+    def handle(self):
+        """Serve requests on one connection until it closes, idles or hits the cap."""
+        self.close_connection = True
+        self.requests_remaining = self.max_keep_alive_requests
+        self.serve_requests()
+
+    def serve_requests(self):
+        while self.wait_for_request():
+            self.handle_one_request()
+            self.requests_remaining -= 1
+            self.server.record_request()
+            if self.close_connection:
+                return
+            if self.can_park():
+                # The server watches the idle connection and hands it back
+                # to a worker through resume() once the next request arrives.
+                self.park_requested = True
+                return
+
+    def can_park(self):
+        """Return True if the connection can wait for its next request without a thread."""
+        if not getattr(self.server, "parks_idle_connections", False):
+            return False
+        # A request the client already pipelined is served right away.
+        self.connection.settimeout(0)
+        try:
+            return not self.rfile.peek(1)
+        except OSError:
+            return False
+
+    def resume(self):
+        """Serve a parked connection again; its next request has arrived."""
+        self.park_requested = False
+        try:
+            self.serve_requests()
+        finally:
+            self.finish()
+
+    def finish(self):
+        if not self.park_requested:
+            super().finish()
+
+    def wait_for_request(self):
+        """Wait up to keep_alive_timeout for the next request to start.
+
+        Returns False when the client stays silent or hangs up.  That is how
+        every idle keep-alive connection ends, so it is not logged; a timeout
+        once the request line has started still is.
+
+        """
+        self.connection.settimeout(self.keep_alive_timeout)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+
+    def parse_request(self):
+        # The idle timeout only covers the wait for a request line; slow
+        # uploads and downloads fall back to the per-request timeout.
+        if self.connection is not None:
+            self.connection.settimeout(self.timeout)
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        # Hand the worker back to the pool when other connections are queued.
+        if self.close_connection or self.requests_remaining <= 1 or self.server.connections_waiting():
+            self.send_header("Connection", "close")
+            return
+        if self.request_version == "HTTP/1.0":
+            self.send_header("Connection", "keep-alive")
+        self.send_header(
+            "Keep-Alive",
+            # Whole seconds only; rounding up keeps a sub-second timeout from
+            # being advertised as timeout=0.
+            "timeout=%d, max=%d" % (math.ceil(self.keep_alive_timeout), self.requests_remaining - 1),
+        )
+
+    def send_error(self, code, message=None, explain=None):
+        """Send an error page with a Content-Length so the connection can be reused.
+
+        Only lookup failures on GET/HEAD keep the connection open; anything
+        else may have left an unread body or a malformed request behind.
+
+        """
+        if getattr(self, "command", None) not in ("GET", "HEAD") or code not in self.keep_alive_error_codes:
+            self.close_connection = True
+        try:
+            short_message, long_message = self.responses[code]
+        except KeyError:
+            short_message, long_message = '???', '???'
+        if message is None:
+            message = short_message
+        if explain is None:
+            explain = long_message
+        self.log_error("code %d, message %s", code, message)
+        self.send_response(code, message)
+        body = b""
+        if code >= 200 and code not in (204, 205, 304):
+            body = (self.error_message_format % {
+                'code': code,
+                'message': html.escape(message, quote=False),
+                'explain': html.escape(explain, quote=False),
+            }).encode('UTF-8', 'replace')
+            self.send_header("Content-Type", self.error_content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD' and body:
+            self.wfile.write(body)
 
     def log_request(self, code='-', size='-'):
         requestline = re.sub(
@@ -236,8 +1381,20 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             r"\1<redacted>",
             self.requestline,
         )
+        if self.transfer_mode:
+            self.log_message('"%s" %s %s %s', requestline, str(code), str(size), self.transfer_mode)
+            self.transfer_mode = None
+            return
         self.log_message('"%s" %s %s', requestline, str(code), str(size))
 
+    def log_error(self, format, *args):
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning("%s - - [%s] %s", self.address_string(), self.log_date_time_string(), format % args)
+
+    def log_message(self, format, *args):
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s - - [%s] %s", self.address_string(), self.log_date_time_string(), format % args)
+
     def send_json_response(self, status, payload):
         body = json.dumps(payload).encode("utf-8")
         self.send_response(status)
@@ -248,12 +1405,50 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(body)
 
+    def send_static_asset(self, include_body=True):
+        """Serve a fingerprinted stylesheet or script; its URL changes with its content."""
+        name = urllib.parse.urlsplit(self.path).path[len("/__static__/"):]
+        asset = STATIC_FILES.get(name)
+        if asset is None:
+            self.send_error(404, "File not found")
+            return
+        body = asset["body"]
+        etag = asset["etag"]
+        encoded = accepts_encoding(self.headers.get("Accept-Encoding"), "gzip")
+        if encoded:
+            body = asset["gzip"]
+            etag = etag[:-1] + '-gzip"'
+        not_modified = self.is_not_modified(etag, 0)
+        if not_modified:
+            self.send_response(304)
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", asset["content_type"])
+            self.send_header("Content-Length", str(len(body)))
+            if encoded:
+                self.send_header("Content-Encoding", "gzip")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("X-Content-Type-Options", "nosniff")
+        self.end_headers()
+        if include_body and not not_modified:
+            self.wfile.write(body)
+
     def send_health_response(self, include_body=True):
         payload = {
             "status": "ok",
             "uptime": max(0.0, time.monotonic() - self.server.started_at),
             "version": __version__,
             "app": "simple-server",
+            "pool": self.server.pool_stats(),
+            "caches": {
+                "listing": self.listing_cache.stats(),
+                "gzip": self.gzip_cache.stats(),
+                "open_files": self.open_file_cache.stats(),
+                "small_files": self.small_file_cache.stats(),
+                "archives": self.archive_cache.stats(),
+            },
         }
         body = json.dumps(payload).encode("utf-8")
         self.send_response(200)
@@ -291,31 +1486,7 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
                 '<code>--local</code> to expose a LAN URL.</div>'
             )
 
-        body = ("""<!DOCTYPE html>
-<html lang="en">
-<head>
-<meta charset="utf-8">
-<meta name="viewport" content="width=device-width, initial-scale=1">
-<script>(function(){var stored=localStorage.getItem('simple-server-theme');document.documentElement.setAttribute('data-theme',stored||'dark');})();</script>
-<title>Connect a device</title>
-<style>
-:root{color-scheme:dark;--bg:#0b1120;--text:#e2e8f0;--muted:#94a3b8;--card:#0f172a;--surface:#111827;--border:#1e293b;--primary:#3b82f6;--link:#60a5fa;--notice:#172554;--notice-border:#1d4ed8;--shadow:0 12px 30px rgba(2,6,23,.6)}
-:root[data-theme='light']{color-scheme:light;--bg:#f5f7fb;--text:#0f172a;--muted:#64748b;--card:#fff;--surface:#f8fafc;--border:#e2e8f0;--primary:#2563eb;--link:#1d4ed8;--notice:#eff6ff;--notice-border:#93c5fd;--shadow:0 12px 30px rgba(15,23,42,.08)}
-*{box-sizing:border-box}body{font-family:system-ui,-apple-system,Segoe UI,Roboto,Ubuntu,Arial,sans-serif;background:var(--bg);color:var(--text);margin:0;padding:32px}.container{max-width:920px;margin:0 auto}.page-header{margin-bottom:24px}.back{color:var(--link);text-decoration:none;font-size:14px}.page-header h1{font-size:30px;margin:18px 0 6px}.page-header p{color:var(--muted);margin:0;line-height:1.5}.notice{background:var(--notice);border:1px solid var(--notice-border);border-radius:12px;padding:14px 16px;margin-bottom:18px;line-height:1.5}.connections{display:grid;grid-template-columns:repeat(auto-fit,minmax(280px,1fr));gap:18px}.connection-card{display:flex;align-items:center;gap:20px;background:var(--card);border:1px solid var(--border);border-radius:16px;padding:20px;box-shadow:var(--shadow)}.qr-wrap{flex:0 0 168px;background:#fff;border-radius:12px;padding:6px;line-height:0}.qr-code{display:block;width:100%%;height:auto}.connection-info{display:flex;min-width:0;flex:1;flex-direction:column;align-items:flex-start;gap:9px}.eyebrow{color:var(--muted);font-size:12px;text-transform:uppercase;letter-spacing:.08em}.connection-url{color:var(--link);font-weight:600;overflow-wrap:anywhere}.copy-button{background:var(--primary);color:#fff;border:0;border-radius:8px;padding:8px 11px;font-size:14px;cursor:pointer}.copy-status{min-height:18px;color:var(--muted);font-size:12px}@media(max-width:580px){body{padding:20px}.connection-card{flex-direction:column;align-items:stretch}.qr-wrap{width:min(100%%,240px);margin:0 auto;flex-basis:auto}}
-</style>
-</head>
-<body>
-<main class="container">
-<header class="page-header"><a class="back" href="/">&larr; Back to files</a><h1>Connect a device</h1><p>Open the URL or scan its QR code from a phone or tablet on the same network.</p></header>
-%s
-<section class="connections" aria-label="Available connection addresses">%s</section>
-</main>
-<script>
-(function(){function fallbackCopy(value){var input=document.createElement('textarea');input.value=value;input.setAttribute('readonly','');input.style.position='fixed';input.style.opacity='0';document.body.appendChild(input);input.select();var copied=document.execCommand('copy');document.body.removeChild(input);return copied?Promise.resolve():Promise.reject();}document.querySelectorAll('.copy-button').forEach(function(button){button.addEventListener('click',function(){var status=button.parentElement.querySelector('.copy-status');var value=button.getAttribute('data-url');var action=navigator.clipboard&&navigator.clipboard.writeText?navigator.clipboard.writeText(value):fallbackCopy(value);action.then(function(){status.textContent='Copied to clipboard.';button.textContent='Copied';}).catch(function(){status.textContent='Copy failed. Select the URL above.';});});});})();
-</script>
-</body>
-</html>
-""" % (notice, ''.join(cards))).encode("utf-8")
+        body = CONNECT_PAGE.render(notice=notice, cards="".join(cards))
         self.send_response(200)
         self.send_header("Content-Type", "text/html; charset=utf-8")
         self.send_header("Content-Length", str(len(body)))
@@ -327,7 +1498,7 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             self.wfile.write(body)
 
     def make_file_etag(self, file_stat):
-        return '"%x-%x-%x"' % (
+        return format_file_etag(
             getattr(file_stat, 'st_ino', 0),
             file_stat.st_mtime_ns,
             file_stat.st_size,
@@ -365,9 +1536,13 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         cached_at = parse_http_date(if_range)
         return cached_at is not None and int(modified_at) <= int(cached_at)
 
-    def send_file_validator_headers(self, file_stat, etag):
+    def send_file_validator_headers(self, file_stat, etag, vary=False):
         self.send_header("Accept-Ranges", "bytes")
+        if vary:
+            self.send_header("Vary", "Accept-Encoding")
         self.send_header("ETag", etag)
+        if self.content_disposition:
+            self.send_header("Content-Disposition", self.content_disposition)
         self.send_header("Last-Modified", self.date_time_string(file_stat.st_mtime))
         self.send_header("Cache-Control", "no-cache")
         self.send_header("Referrer-Policy", "no-referrer")
@@ -384,14 +1559,17 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
 
     def handle_create_share(self):
         if self.headers.get_content_type() != "application/json":
+            self.close_connection = True
             self.send_json_response(415, {"status": "error", "message": "Share requests must use JSON."})
             return
         try:
             length = int(self.headers.get("Content-Length", 0))
         except ValueError:
+            self.close_connection = True
             self.send_json_response(400, {"status": "error", "message": "Invalid request length."})
             return
         if length <= 0 or length > 4096:
+            self.close_connection = True
             self.send_json_response(400, {"status": "error", "message": "Invalid share request."})
             return
         try:
@@ -420,7 +1598,7 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             contained = os.path.commonpath((served_root, target)) == served_root
         except ValueError:
             contained = False
-        if not contained or not os.path.exists(target):
+        if not contained or not os.path.exists(target) or self.is_upload_staging_path(target):
             self.send_json_response(404, {"status": "error", "message": "Share target not found."})
             return
 
@@ -494,7 +1672,7 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         except ValueError:
             self.send_error(404, "Shared path not found")
             return None
-        if not os.path.exists(target):
+        if not os.path.exists(target) or self.is_upload_staging_path(target):
             self.send_error(404, "Shared path not found")
             return None
 
@@ -503,6 +1681,7 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
                 self.send_response(301)
                 self.send_header("Location", request_path + "/")
                 self.send_header("Referrer-Policy", "no-referrer")
+                self.send_header("Content-Length", "0")
                 self.end_headers()
                 return None
             for index_name in "index.html", "index.htm":
@@ -557,84 +1736,15 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         return True
 
     def render_login_page(self, message="", next_path="/"):
-        f = BytesIO()
-
-        def customwrite(htmlstring):
-            f.write(htmlstring.encode('utf-8'))
-
-        customwrite("<!DOCTYPE html>\n")
-        customwrite("<html lang=\"en\">\n")
-        customwrite("<head>\n")
-        customwrite("<meta charset=\"utf-8\">\n")
-        customwrite("<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">\n")
-        customwrite("<script>\n")
-        customwrite("(function(){\n")
-        customwrite("var stored=localStorage.getItem('simple-server-theme');\n")
-        customwrite("var theme=stored||'dark';\n")
-        customwrite("document.documentElement.setAttribute('data-theme', theme);\n")
-        customwrite("})();\n")
-        customwrite("</script>\n")
-        customwrite("<title>Server Login</title>\n")
-        customwrite("<style>\n")
-        customwrite(":root{color-scheme:dark;--bg:#0b1120;--text:#e2e8f0;--muted:#94a3b8;"
-                    "--card:#0f172a;--border:#1e293b;--primary:#3b82f6;--shadow:0 10px 30px rgba(2,6,23,.6);}\n")
-        customwrite(":root[data-theme='light']{color-scheme:light;--bg:#f5f7fb;--text:#1f2937;--muted:#64748b;"
-                    "--card:#fff;--border:#e2e8f0;--primary:#2563eb;--shadow:0 10px 30px rgba(15,23,42,.08);}\n")
-        customwrite("body{font-family:system-ui,-apple-system,Segoe UI,Roboto,Ubuntu,Arial,sans-serif;"
-                    "background:var(--bg);color:var(--text);margin:0;padding:32px;}\n")
-        customwrite(".card{max-width:420px;margin:0 auto;background:var(--card);border-radius:14px;"
-                    "box-shadow:var(--shadow);padding:28px;border:1px solid var(--border);}\n")
-        customwrite(".title{font-size:22px;margin:0 0 8px;}\n")
-        customwrite(".subtitle{color:var(--muted);font-size:14px;margin:0 0 18px;}\n")
-        customwrite(".message{color:#dc2626;font-size:14px;margin-bottom:12px;}\n")
-        customwrite("label{display:block;font-size:14px;margin-bottom:6px;}\n")
-        customwrite("input[type='password']{width:100%;padding:10px 12px;border-radius:8px;"
-                    "border:1px solid var(--border);font-size:14px;background:transparent;color:var(--text);}\n")
-        customwrite(".btn{margin-top:14px;background:var(--primary);color:#fff;border:none;border-radius:8px;"
-                    "padding:10px 14px;font-size:14px;cursor:pointer;width:100%;}\n")
-        customwrite("</style>\n")
-        customwrite("</head>\n")
-        customwrite("<body>\n")
-        customwrite("<div class=\"card\">\n")
-        customwrite("<h2 class=\"title\">Password required</h2>\n")
-        customwrite("<p class=\"subtitle\">Enter the server password to continue.</p>\n")
-        if message:
-            customwrite("<div class=\"message\">%s</div>\n" % html.escape(message))
-        customwrite("<form method=\"post\" action=\"/__login__\">\n")
-        customwrite("<input type=\"hidden\" name=\"next\" value=\"%s\">\n" % html.escape(next_path))
-        customwrite("<label for=\"password\">Password</label>\n")
-        customwrite("<input id=\"password\" name=\"password\" type=\"password\" autofocus required>\n")
-        customwrite("<button class=\"btn\" type=\"submit\">Sign in</button>\n")
-        customwrite("</form>\n")
-        customwrite("</div>\n")
-        customwrite("<script>\n")
-        customwrite("(function(){\n")
-        customwrite("var button=document.getElementById('theme-toggle');\n")
-        customwrite("var root=document.documentElement;\n")
-        customwrite("function applyLabel(){\n")
-        customwrite("if(!button){return;}\n")
-        customwrite("var theme=root.getAttribute('data-theme')||'dark';\n")
-        customwrite("button.textContent=theme==='dark'?'Light mode':'Dark mode';\n")
-        customwrite("}\n")
-        customwrite("if(button){\n")
-        customwrite("button.addEventListener('click',function(){\n")
-        customwrite("var next=(root.getAttribute('data-theme')==='dark')?'light':'dark';\n")
-        customwrite("root.setAttribute('data-theme',next);\n")
-        customwrite("localStorage.setItem('simple-server-theme',next);\n")
-        customwrite("applyLabel();\n")
-        customwrite("});\n")
-        customwrite("}\n")
-        customwrite("applyLabel();\n")
-        customwrite("})();\n")
-        customwrite("</script>\n")
-        customwrite("</body>\n</html>\n")
-        length = f.tell()
-        f.seek(0)
+        body = LOGIN_PAGE.render(
+            message="<div class=\"message\">%s</div>\n" % html.escape(message) if message else "",
+            next_path=html.escape(next_path),
+        )
         self.send_response(401)
         self.send_header("Content-type", "text/html; charset=utf-8")
-        self.send_header("Content-Length", str(length))
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        return f
+        return BytesIO(body)
 
     def handle_login(self):
         length = int(self.headers.get("Content-Length", 0))
@@ -658,6 +1768,7 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             f"{self.session_cookie_name}={token}; HttpOnly; Path=/; Max-Age={self.session_duration_seconds}; SameSite=Lax"
         )
         self.send_header("Set-Cookie", cookie_value)
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
     def handle_logout(self):
@@ -669,6 +1780,7 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         self.send_header("Location", "/__login__")
         cookie_value = f"{self.session_cookie_name}=; HttpOnly; Path=/; Max-Age=0; SameSite=Lax"
         self.send_header("Set-Cookie", cookie_value)
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
     def do_GET(self):
@@ -677,6 +1789,9 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         if request_path == "/healthz":
             self.send_health_response()
             return
+        if request_path.startswith("/__static__/"):
+            self.send_static_asset()
+            return
         if request_path.startswith("/__share__/"):
             self.handle_shared_request(include_body=True)
             return
@@ -709,16 +1824,23 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         if request_path == "/healthz":
             self.send_health_response(include_body=False)
             return
+        if request_path.startswith("/__static__/"):
+            self.send_static_asset(include_body=False)
+            return
         if request_path.startswith("/__share__/"):
             self.handle_shared_request(include_body=False)
             return
         if self.server_password and not self.is_authenticated():
             self.send_response(401)
+            self.send_header("Content-Length", "0")
             self.end_headers()
             return
         if request_path == "/__connect__":
             self.send_connection_page(include_body=False)
             return
+        if request_path.startswith("/__uploads__/"):
+            self.handle_upload_offset(request_path)
+            return
         f = self.send_head()
         if f:
             f.close()
@@ -736,9 +1858,11 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             self.send_error(405, "Shared links are read-only")
             return
         if request_path == "/__share__" and self.server_password and not self.is_authenticated():
+            self.close_connection = True
             self.send_json_response(401, {"status": "error", "message": "Authentication required."})
             return
         if self.server_password and not self.is_authenticated():
+            self.close_connection = True
             f = self.render_login_page(next_path=self.path)
             if f:
                 self.copyfile(f, self.wfile)
@@ -747,8 +1871,14 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         if request_path == "/__share__":
             self.handle_create_share()
             return
+        if request_path == "/__download__":
+            self.handle_batch_download()
+            return
+        if request_path == "/__uploads__":
+            self.handle_upload_create()
+            return
         r, info = self.deal_post_data()
-        print(r, info, "by: ", self.client_address)
+        logger.debug("upload %s: %s (client %s)", "ok" if r else "failed", info, self.client_address)
         if "application/json" in self.headers.get("Accept", ""):
             body = json.dumps({
                 "status": "ok" if r else "error",
@@ -760,87 +1890,18 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(body)
             return
-        f = BytesIO()
-
-        def customwrite(htmlstring):
-            f.write(htmlstring.encode('utf-8'))
-
-        customwrite("<!DOCTYPE html>\n")
-        customwrite("<html lang=\"en\">\n")
-        customwrite("<head>\n")
-        customwrite("<meta charset=\"utf-8\">\n")
-        customwrite("<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">\n")
-        customwrite("<script>\n")
-        customwrite("(function(){\n")
-        customwrite("var stored=localStorage.getItem('simple-server-theme');\n")
-        customwrite("var theme=stored||'dark';\n")
-        customwrite("document.documentElement.setAttribute('data-theme', theme);\n")
-        customwrite("})();\n")
-        customwrite("</script>\n")
-        customwrite("<title>Upload Result</title>\n")
-        customwrite("<style>\n")
-        customwrite(":root{color-scheme:dark;--bg:#0b1120;--text:#e2e8f0;--muted:#94a3b8;"
-                    "--card:#0f172a;--border:#1e293b;--primary:#3b82f6;--shadow:0 10px 30px rgba(2,6,23,.6);}\n")
-        customwrite(":root[data-theme='light']{color-scheme:light;--bg:#f5f7fb;--text:#1f2937;--muted:#64748b;"
-                    "--card:#fff;--border:#e2e8f0;--primary:#2563eb;--shadow:0 10px 30px rgba(15,23,42,.08);}\n")
-        customwrite("body{font-family:system-ui,-apple-system,Segoe UI,Roboto,Ubuntu,Arial,sans-serif;"
-                    "background:var(--bg);color:var(--text);margin:0;padding:32px;}\n")
-        customwrite(".card{max-width:720px;margin:0 auto;background:var(--card);border-radius:14px;"
-                    "box-shadow:var(--shadow);padding:28px;border:1px solid var(--border);}\n")
-        customwrite(".title{font-size:22px;margin:0 0 8px;}\n")
-        customwrite(".status{font-weight:600;margin:12px 0;}\n")
-        customwrite(".status.success{color:#059669;}\n")
-        customwrite(".status.fail{color:#dc2626;}\n")
-        customwrite(".actions a{display:inline-block;margin-top:12px;padding:8px 14px;"
-                    "background:var(--primary);color:#fff;border-radius:8px;text-decoration:none;}\n")
-        customwrite(".footer{margin-top:18px;font-size:12px;color:var(--muted);}\n")
-        customwrite("</style>\n")
-        customwrite("</head>\n")
-        customwrite("<body>\n")
-        customwrite("<div class=\"card\">\n")
-        customwrite("<h2 class=\"title\">Upload Result</h2>\n")
-        if r:
-            customwrite("<div class=\"status success\">Success</div>\n")
-        else:
-            customwrite("<div class=\"status fail\">Failed</div>\n")
-        customwrite("<p>%s</p>\n" % info)
-        customwrite("<div class=\"actions\"><a href=\"%s\">Back to listing</a></div>\n" % self.headers['referer'])
-        customwrite("<div class=\"footer\">Powered By: Gil, check new version at "
-                    "<a href=\"https://github.com/adrianogil/simple-server\">here</a>.</div>\n")
-        customwrite("</div>\n")
-        customwrite("<script>\n")
-        customwrite("(function(){\n")
-        customwrite("var button=document.getElementById('theme-toggle');\n")
-        customwrite("var root=document.documentElement;\n")
-        customwrite("function applyLabel(){\n")
-        customwrite("if(!button){return;}\n")
-        customwrite("var theme=root.getAttribute('data-theme')||'dark';\n")
-        customwrite("button.textContent=theme==='dark'?'Light mode':'Dark mode';\n")
-        customwrite("}\n")
-        customwrite("if(button){\n")
-        customwrite("button.addEventListener('click',function(){\n")
-        customwrite("var next=(root.getAttribute('data-theme')==='dark')?'light':'dark';\n")
-        customwrite("root.setAttribute('data-theme',next);\n")
-        customwrite("localStorage.setItem('simple-server-theme',next);\n")
-        customwrite("applyLabel();\n")
-        customwrite("});\n")
-        customwrite("}\n")
-        customwrite("applyLabel();\n")
-        customwrite("})();\n")
-        customwrite("</script>\n")
-        customwrite("</body>\n</html>\n")
-        length = f.tell()
-        f.seek(0)
-        self.send_response(200 if r else 400)
-        self.send_header("Content-type", "text/html")
-        self.send_header("Content-Length", str(length))
-        self.end_headers()
-        if f:
-            self.copyfile(f, self.wfile)
-            f.close()
+        self.send_result_page(
+            200 if r else 400,
+            "Upload Result",
+            "Upload Result",
+            r,
+            "Success" if r else "Failed",
+            "<p>%s</p>\n" % info,
+            self.headers['referer'],
+        )
 
     def create_directory(self, path, folder_name, last_page):
-        print("create_directory %s %s" % (path, folder_name))
+        logger.debug("create_directory %s %s", path, folder_name)
 
         result = True
 
@@ -856,87 +1917,18 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         else:
             os.mkdir(new_folder)
 
-        """Serve a POST request."""
-        f = BytesIO()
-
-        def customwrite(htmlstring):
-            f.write(htmlstring.encode('utf-8'))
-
-        customwrite("<!DOCTYPE html>\n")
-        customwrite("<html lang=\"en\">\n")
-        customwrite("<head>\n")
-        customwrite("<meta charset=\"utf-8\">\n")
-        customwrite("<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">\n")
-        customwrite("<script>\n")
-        customwrite("(function(){\n")
-        customwrite("var stored=localStorage.getItem('simple-server-theme');\n")
-        customwrite("var theme=stored||'dark';\n")
-        customwrite("document.documentElement.setAttribute('data-theme', theme);\n")
-        customwrite("})();\n")
-        customwrite("</script>\n")
-        customwrite("<title>Folder Created</title>\n")
-        customwrite("<style>\n")
-        customwrite(":root{color-scheme:dark;--bg:#0b1120;--text:#e2e8f0;--muted:#94a3b8;"
-                    "--card:#0f172a;--border:#1e293b;--primary:#3b82f6;--shadow:0 10px 30px rgba(2,6,23,.6);}\n")
-        customwrite(":root[data-theme='light']{color-scheme:light;--bg:#f5f7fb;--text:#1f2937;--muted:#64748b;"
-                    "--card:#fff;--border:#e2e8f0;--primary:#2563eb;--shadow:0 10px 30px rgba(15,23,42,.08);}\n")
-        customwrite("body{font-family:system-ui,-apple-system,Segoe UI,Roboto,Ubuntu,Arial,sans-serif;"
-                    "background:var(--bg);color:var(--text);margin:0;padding:32px;}\n")
-        customwrite(".card{max-width:720px;margin:0 auto;background:var(--card);border-radius:14px;"
-                    "box-shadow:var(--shadow);padding:28px;border:1px solid var(--border);}\n")
-        customwrite(".title{font-size:22px;margin:0 0 8px;}\n")
-        customwrite(".status{font-weight:600;margin:12px 0;}\n")
-        customwrite(".status.success{color:#059669;}\n")
-        customwrite(".status.fail{color:#dc2626;}\n")
-        customwrite(".actions a{display:inline-block;margin-top:12px;padding:8px 14px;"
-                    "background:var(--primary);color:#fff;border-radius:8px;text-decoration:none;}\n")
-        customwrite(".footer{margin-top:18px;font-size:12px;color:var(--muted);}\n")
-        customwrite("</style>\n")
-        customwrite("</head>\n")
-        customwrite("<body>\n")
-        customwrite("<div class=\"card\">\n")
-        customwrite("<h2 class=\"title\">Folder \"%s\"</h2>\n" % html.escape(folder_name))
-        if result:
-            customwrite("<div class=\"status success\">Created successfully.</div>\n")
-        else:
-            customwrite("<div class=\"status fail\">Folder already exists.</div>\n")
-        customwrite("<div class=\"actions\"><a href=\"%s\">Back to listing</a></div>\n" % last_page)
-        customwrite("<div class=\"footer\">Powered By: Gil, check new version at "
-                    "<a href=\"https://github.com/adrianogil/simple-server\">here</a>.</div>\n")
-        customwrite("</div>\n")
-        customwrite("<script>\n")
-        customwrite("(function(){\n")
-        customwrite("var button=document.getElementById('theme-toggle');\n")
-        customwrite("var root=document.documentElement;\n")
-        customwrite("function applyLabel(){\n")
-        customwrite("if(!button){return;}\n")
-        customwrite("var theme=root.getAttribute('data-theme')||'dark';\n")
-        customwrite("button.textContent=theme==='dark'?'Light mode':'Dark mode';\n")
-        customwrite("}\n")
-        customwrite("if(button){\n")
-        customwrite("button.addEventListener('click',function(){\n")
-        customwrite("var next=(root.getAttribute('data-theme')==='dark')?'light':'dark';\n")
-        customwrite("root.setAttribute('data-theme',next);\n")
-        customwrite("localStorage.setItem('simple-server-theme',next);\n")
-        customwrite("applyLabel();\n")
-        customwrite("});\n")
-        customwrite("}\n")
-        customwrite("applyLabel();\n")
-        customwrite("})();\n")
-        customwrite("</script>\n")
-        customwrite("</body>\n</html>\n")
-        length = f.tell()
-        f.seek(0)
-        self.send_response(200)
-        self.send_header("Content-type", "text/html")
-        self.send_header("Content-Length", str(length))
-        self.end_headers()
-        if f:
-            self.copyfile(f, self.wfile)
-            f.close()
+        self.send_result_page(
+            200,
+            "Folder Created",
+            "Folder \"%s\"" % html.escape(folder_name),
+            result,
+            "Created successfully." if result else "Folder already exists.",
+            "",
+            last_page,
+        )
 
     def delete_file(self, path, file_name, last_page):
-        print("delete_file %s %s" % (path, file_name))
+        logger.debug("delete_file %s %s", path, file_name)
 
         result = True
 
@@ -945,114 +1937,318 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         except ValueError as error:
             self.send_error(400, str(error))
             return None
+        if self.is_upload_staging_path(file_path):
+            self.send_error(404, "File not found")
+            return None
         file_name = os.path.basename(file_path)
 
         if os.path.exists(file_path):
             os.remove(file_path)
 
-        """Serve a POST request."""
-        f = BytesIO()
-
-        def customwrite(htmlstring):
-            f.write(htmlstring.encode('utf-8'))
-
-        customwrite("<!DOCTYPE html>\n")
-        customwrite("<html lang=\"en\">\n")
-        customwrite("<head>\n")
-        customwrite("<meta charset=\"utf-8\">\n")
-        customwrite("<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">\n")
-        customwrite("<script>\n")
-        customwrite("(function(){\n")
-        customwrite("var stored=localStorage.getItem('simple-server-theme');\n")
-        customwrite("var theme=stored||'dark';\n")
-        customwrite("document.documentElement.setAttribute('data-theme', theme);\n")
-        customwrite("})();\n")
-        customwrite("</script>\n")
-        customwrite("<title>File Removed</title>\n")
-        customwrite("<style>\n")
-        customwrite(":root{color-scheme:dark;--bg:#0b1120;--text:#e2e8f0;--muted:#94a3b8;"
-                    "--card:#0f172a;--border:#1e293b;--primary:#3b82f6;--shadow:0 10px 30px rgba(2,6,23,.6);}\n")
-        customwrite(":root[data-theme='light']{color-scheme:light;--bg:#f5f7fb;--text:#1f2937;--muted:#64748b;"
-                    "--card:#fff;--border:#e2e8f0;--primary:#2563eb;--shadow:0 10px 30px rgba(15,23,42,.08);}\n")
-        customwrite("body{font-family:system-ui,-apple-system,Segoe UI,Roboto,Ubuntu,Arial,sans-serif;"
-                    "background:var(--bg);color:var(--text);margin:0;padding:32px;}\n")
-        customwrite(".card{max-width:720px;margin:0 auto;background:var(--card);border-radius:14px;"
-                    "box-shadow:var(--shadow);padding:28px;border:1px solid var(--border);}\n")
-        customwrite(".title{font-size:22px;margin:0 0 8px;}\n")
-        customwrite(".status{font-weight:600;margin:12px 0;}\n")
-        customwrite(".status.success{color:#059669;}\n")
-        customwrite(".status.fail{color:#dc2626;}\n")
-        customwrite(".actions a{display:inline-block;margin-top:12px;padding:8px 14px;"
-                    "background:var(--primary);color:#fff;border-radius:8px;text-decoration:none;}\n")
-        customwrite(".footer{margin-top:18px;font-size:12px;color:var(--muted);}\n")
-        customwrite("</style>\n")
-        customwrite("</head>\n")
-        customwrite("<body>\n")
-        customwrite("<div class=\"card\">\n")
-        customwrite("<h2 class=\"title\">Removed \"%s\"</h2>\n" % html.escape(file_name))
-        if result:
-            customwrite("<div class=\"status success\">File deleted successfully.</div>\n")
-        else:
-            customwrite("<div class=\"status fail\">Failed to delete file.</div>\n")
-        customwrite("<div class=\"actions\"><a href=\"%s\">Back to listing</a></div>\n" % last_page)
-        customwrite("<div class=\"footer\">Powered By: Gil, check new version at "
-                    "<a href=\"https://github.com/adrianogil/simple-server\">here</a>.</div>\n")
-        customwrite("</div>\n")
-        customwrite("<script>\n")
-        customwrite("(function(){\n")
-        customwrite("var button=document.getElementById('theme-toggle');\n")
-        customwrite("var root=document.documentElement;\n")
-        customwrite("function applyLabel(){\n")
-        customwrite("if(!button){return;}\n")
-        customwrite("var theme=root.getAttribute('data-theme')||'dark';\n")
-        customwrite("button.textContent=theme==='dark'?'Light mode':'Dark mode';\n")
-        customwrite("}\n")
-        customwrite("if(button){\n")
-        customwrite("button.addEventListener('click',function(){\n")
-        customwrite("var next=(root.getAttribute('data-theme')==='dark')?'light':'dark';\n")
-        customwrite("root.setAttribute('data-theme',next);\n")
-        customwrite("localStorage.setItem('simple-server-theme',next);\n")
-        customwrite("applyLabel();\n")
-        customwrite("});\n")
-        customwrite("}\n")
-        customwrite("applyLabel();\n")
-        customwrite("})();\n")
-        customwrite("</script>\n")
-        customwrite("</body>\n</html>\n")
-        length = f.tell()
-        f.seek(0)
-        self.send_response(200)
+        self.send_result_page(
+            200,
+            "File Removed",
+            "Removed \"%s\"" % html.escape(file_name),
+            result,
+            "File deleted successfully." if result else "Failed to delete file.",
+            "",
+            last_page,
+        )
+
+    def send_result_page(self, status, title, heading, succeeded, status_text, message, back):
+        """Send the small page shown after an upload, mkdir or delete."""
+        body = RESULT_PAGE.render(
+            title=title,
+            heading=heading,
+            status_class="success" if succeeded else "fail",
+            status_text=status_text,
+            message=message,
+            back=html.escape(back or "/", quote=True),
+        )
+        self.send_response(status)
         self.send_header("Content-type", "text/html")
-        self.send_header("Content-Length", str(length))
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        if f:
-            self.copyfile(f, self.wfile)
-            f.close()
+        self.wfile.write(body)
 
-    def deal_post_data(self):
-        ctype, pdict = cgi.parse_header(self.headers['Content-Type'])
-        pdict['boundary'] = bytes(pdict['boundary'], "utf-8")
-        pdict['CONTENT-LENGTH'] = int(self.headers['Content-Length'])
-        if ctype == 'multipart/form-data':
-            form = cgi.FieldStorage( fp=self.rfile, headers=self.headers, environ={'REQUEST_METHOD':'POST', 'CONTENT_TYPE':self.headers['Content-Type'], })
-            print (type(form))
-            if getattr(form, "bytes_read", pdict['CONTENT-LENGTH']) < pdict['CONTENT-LENGTH']:
-                return (False, "Upload cancelled or incomplete.")
-            try:
-                records = form["file"] if isinstance(form["file"], list) else [form["file"]]
-                uploads = [
-                    (record, resolve_contained_child(os.getcwd(), record.filename))
-                    for record in records
-                ]
-                for record, destination in uploads:
-                    with open(destination, "wb") as uploaded_file:
-                        uploaded_file.write(record.file.read())
-            except ValueError:
-                return (False, "Upload rejected: invalid filename or destination.")
-            except IOError:
-                return (False, "Can't create file to write, do you have permission to write?")
+    def do_PATCH(self):
+        """Append a chunk to a resumable upload."""
+        request_path = urllib.parse.urlsplit(self.path).path
+        if not self.check_upload_request(request_path):
+            return
+        self.handle_upload_chunk(request_path)
+
+    def do_DELETE(self):
+        """Cancel a resumable upload."""
+        request_path = urllib.parse.urlsplit(self.path).path
+        if not self.check_upload_request(request_path):
+            return
+        session = self.upload_store().get(request_path[len("/__uploads__/"):])
+        if session is None:
+            self.send_upload_response(404)
+            return
+        self.upload_store().remove(session.id)
+        self.send_upload_response(204)
+
+    def check_upload_request(self, request_path):
+        """Answer PATCH and DELETE requests that are not for an upload session."""
+        if not request_path.startswith("/__uploads__/"):
+            self.close_connection = True
+            self.send_error(405, "Method not allowed")
+            return False
+        if self.server_password and not self.is_authenticated():
+            self.close_connection = True
+            self.send_json_response(401, {"status": "error", "message": "Authentication required."})
+            return False
+        return True
+
+    def upload_store(self):
+        return UploadStore(self.upload_staging_path(), self.upload_session_ttl)
+
+    def upload_staging_path(self):
+        return os.path.join(os.getcwd(), self.upload_staging_dir)
+
+    def is_upload_staging_path(self, path):
+        """Return True for the upload staging directory, anything in it and
+        form uploads that are still being written.
+
+        Session files name other clients' uploads and half-written files are
+        not the upload yet, so neither is served, listed, shared, archived or
+        deleted through the UI.
+
+        """
+        if self.upload_temp_name.match(os.path.basename(path)):
+            return True
+        staging = os.path.normcase(self.upload_staging_path())
+        path = os.path.normcase(path)
+        return path == staging or path.startswith(staging + os.sep)
+
+    def listed_entries(self, path, dir_entries):
+        """Leave upload staging paths out of the entries of PATH."""
+        staging = self.upload_staging_path()
+        hide_staging = os.path.normcase(os.path.join(path, self.upload_staging_dir)) == os.path.normcase(staging)
+        return (
+            entry for entry in dir_entries
+            if not self.upload_temp_name.match(entry.name)
+            and not (hide_staging and entry.name == self.upload_staging_dir)
+        )
+
+    def send_upload_response(self, status, session=None, offset=None, headers=()):
+        """Send a body-less tus response with the session's offset and expiry."""
+        self.send_response(status)
+        self.send_header("Tus-Resumable", TUS_VERSION)
+        self.send_header("Cache-Control", "no-store")
+        if session is not None:
+            self.send_header("Upload-Offset", str(session.offset if offset is None else offset))
+            self.send_header("Upload-Length", str(session.length))
+        for keyword, value in headers:
+            self.send_header(keyword, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def handle_upload_create(self):
+        """Start a resumable upload for the Upload-Length and filename given.
+
+        Like form uploads, the file lands in the served root; the session
+        URL is sent back in Location.
+
+        """
+        try:
+            length = int(self.headers.get("Upload-Length", ""))
+            if length < 0:
+                raise ValueError("negative length")
+            metadata = parse_upload_metadata(self.headers.get("Upload-Metadata"))
+            destination = resolve_upload_name(metadata.get("filename"))
+        except ValueError:
+            self.send_json_response(400, {"status": "error", "message": "Invalid upload request."})
+            return
+        if self.headers.get("Content-Length", "0") != "0":
+            # Creation with an initial chunk is not supported; skip the body.
+            self.close_connection = True
+        store = self.upload_store()
+        store.expire()
+        # Relative to the served root: session files never hold server paths.
+        session = store.create(os.path.basename(destination), length)
+        if length == 0:
+            try:
+                session.commit(destination)
+            except OSError:
+                self.send_json_response(500, {"status": "error", "message": "Upload could not be saved."})
+                return
+        self.send_upload_response(201, session, offset=0, headers=(
+            ("Location", "/__uploads__/" + session.id),
+            ("Upload-Expires", self.date_time_string(time.time() + self.upload_session_ttl)),
+        ))
+
+    def handle_upload_offset(self, request_path):
+        """Answer HEAD for a resumable upload with the offset to resume from."""
+        session = self.upload_store().get(request_path[len("/__uploads__/"):])
+        if session is None:
+            self.send_upload_response(404)
+            return
+        self.send_upload_response(200, session, headers=(
+            ("Upload-Expires", self.date_time_string(session.expires_at)),
+        ))
+
+    def handle_upload_chunk(self, request_path):
+        """Write a PATCH body at its Upload-Offset and commit a finished upload.
+
+        Bytes are kept as they arrive, so a request cut off halfway still
+        moves the offset forward.
+
+        """
+        session = self.upload_store().get(request_path[len("/__uploads__/"):])
+        if session is None:
+            self.close_connection = True
+            self.send_upload_response(404)
+            return
+        if self.headers.get_content_type() != "application/offset+octet-stream":
+            self.close_connection = True
+            self.send_upload_response(415)
+            return
+        try:
+            offset = int(self.headers.get("Upload-Offset", ""))
+            count = int(self.headers.get("Content-Length", ""))
+            if offset < 0 or count < 0:
+                raise ValueError("negative offset or length")
+        except ValueError:
+            self.close_connection = True
+            self.send_upload_response(400)
+            return
+        try:
+            new_offset = session.append(self.rfile, offset, count)
+        except UploadError as error:
+            self.close_connection = True
+            self.send_upload_response(error.status, session)
+            return
+        except OSError:
+            # The client went away; what arrived is on disk for the next try.
+            self.close_connection = True
+            return
+        if new_offset < offset + count:
+            self.close_connection = True
+            return
+        if new_offset == session.length:
+            try:
+                session.commit(resolve_upload_name(session.destination))
+            except (OSError, ValueError):
+                self.send_json_response(500, {"status": "error", "message": "Upload could not be saved."})
+                return
+            logger.debug("resumable upload ok: %s (client %s)", session.destination, self.client_address)
+        self.send_upload_response(204, session, offset=new_offset, headers=(
+            ("Upload-Expires", self.date_time_string(time.time() + self.upload_session_ttl)),
+        ))
+
+    def handle_batch_download(self):
+        """Stream the files and folders selected in a listing as one archive.
+
+        The form body names the listing in "dir", each selected entry of it
+        in "path" and the archive format in "download".  Every entry is
+        checked with resolve_contained_child() before anything is sent.
+
+        """
+        if self.headers.get_content_type() != "application/x-www-form-urlencoded":
+            self.close_connection = True
+            self.send_error(415, "Selections must be posted as a form")
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length <= 0 or length > self.max_batch_request_size:
+            self.close_connection = True
+            self.send_error(413 if length > 0 else 400, "Invalid selection")
+            return
+        try:
+            form = urllib.parse.parse_qs(self.rfile.read(length).decode("ascii"))
+        except UnicodeDecodeError:
+            self.send_error(400, "Invalid selection")
+            return
+        archive_format = form.get("download", ["zip"])[0]
+        names = list(dict.fromkeys(form.get("path", [])))
+        if archive_format not in ARCHIVE_FORMATS or not names or len(form.get("dir", ())) != 1:
+            self.send_error(400, "Invalid selection")
+            return
+        parent = self.translate_path(form["dir"][0])
+        if not os.path.isdir(parent):
+            self.send_error(404, "Folder not found")
+            return
+        name = os.path.basename(os.path.normpath(parent)) or "download"
+        roots = []
+        for child_name in names:
+            try:
+                child = resolve_contained_child(os.getcwd(), child_name, parent)
+            except ValueError:
+                self.send_error(400, "Invalid selection")
+                return
+            if not os.path.lexists(child) or self.is_upload_staging_path(child):
+                self.send_error(404, "File not found")
+                return
+            roots.append((child, posixpath.join(name, os.path.basename(child))))
+        self.send_archive(name + "-selection", archive_format, roots)
+
+    def deal_post_data(self):
+        ctype, pdict = parse_content_type(self.headers.get('Content-Type'))
+        if ctype != 'multipart/form-data':
+            self.close_connection = True
+            return (True, "Files uploaded")
+        try:
+            content_length = int(self.headers.get('Content-Length'))
+            parser = MultipartParser(self.rfile, pdict.get('boundary'), content_length, self.copy_buffer_size)
+        except (TypeError, ValueError):
+            self.close_connection = True
+            return (False, "Upload cancelled or incomplete.")
+
+        # Each file is streamed into a hidden temporary file next to its
+        # destination and only renamed into place once the whole body parsed.
+        staged = []
+        try:
+            for part in parser:
+                if part.name != "file":
+                    continue
+                destination = resolve_contained_child(os.getcwd(), part.filename)
+                # Not tempfile.mkstemp(): that would leave the file mode at 0600.
+                temp_path = os.path.join(
+                    # Named to match upload_temp_name, which hides it until then.
+                    os.path.dirname(destination), ".upload-%s.part" % secrets.token_hex(8),
+                )
+                fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+                staged.append((temp_path, destination))
+                with open(fd, "wb") as uploaded_file:
+                    for chunk in part.iter_chunks():
+                        uploaded_file.write(chunk)
+            if not staged:
+                return (False, "Upload rejected: no file was sent.")
+            for temp_path, destination in staged:
+                os.replace(temp_path, destination)
+            staged = []
+        except IncompleteBody:
+            self.close_connection = True
+            return (False, "Upload cancelled or incomplete.")
+        except MultipartError:
+            self.close_connection = True
+            return (False, "Upload rejected: malformed form data.")
+        except ValueError:
+            self.discard_request_body(parser)
+            return (False, "Upload rejected: invalid filename or destination.")
+        except IOError:
+            self.discard_request_body(parser)
+            return (False, "Can't create file to write, do you have permission to write?")
+        finally:
+            for temp_path, destination in staged:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
         return (True, "Files uploaded")
 
+    def discard_request_body(self, parser):
+        """Drain an upload we rejected so the client still reads our reply."""
+        try:
+            parser.discard_rest()
+        except MultipartError:
+            self.close_connection = True
+
     def send_head(self):
         """Common code for GET and HEAD commands.
 
@@ -1066,34 +2262,33 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         """
         self._range_remaining = None
         path = self.translate_path(self.path)
-        print("send_head - path: " + str(self.path))
+        logger.debug("send_head path=%s", self.path)
+        if self.is_upload_staging_path(path):
+            self.send_error(404, "File not found")
+            return None
         f = None
         if '?deletefile=' in self.path:
             index = self.path.index('?deletefile=')
             file_to_be_deleted = self.path[index + 12:]
-            print("Let's delete file: " + file_to_be_deleted)
             return self.delete_file(path, file_to_be_deleted, self.path[:index])
         elif '?createfolder=' in self.path:
             index = self.path.index('?createfolder=')
             folder_name = self.path[index + 14:]
             return self.create_directory(path, folder_name, self.path[:index])
-        elif self.path.endswith('?download'):
-            tmp_file = "tmp.zip"
-            self.path = self.path.replace("?download","")
-
-            # Improve zipped path
-            zip = zipfile.ZipFile(tmp_file, 'w')
-            for root, dirs, files in os.walk(path):
-                for file in files:
-                    if os.path.join(root, file) != os.path.join(root, tmp_file):
-                        zip.write(os.path.join(root, file))
-            zip.close()
-            path = self.translate_path(tmp_file)
-        elif os.path.isdir(path):
-            if not self.path.endswith('/'):
+        elif self.path.endswith('?download') or '?download=' in self.path:
+            query = self.path.partition('?')[2]
+            archive_format = urllib.parse.parse_qs(query).get("download", ["zip"])[0]
+            if archive_format not in ARCHIVE_FORMATS:
+                self.send_error(400, "Unknown archive format")
+                return None
+            return self.send_directory_archive(path, archive_format)
+        elif not self.open_file_cache.holds_file(path) and os.path.isdir(path):
+            request_path, separator, query = self.path.partition('?')
+            if not request_path.endswith('/'):
                 # redirect browser - doing basically what apache does
                 self.send_response(301)
-                self.send_header("Location", self.path + "/")
+                self.send_header("Location", request_path + "/" + separator + query)
+                self.send_header("Content-Length", "0")
                 self.end_headers()
                 return None
             for index in "index.html", "index.htm":
@@ -1105,43 +2300,409 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
                 return self.list_directory(path)
         return self.send_file_head(path)
 
+    def send_directory_archive(self, path, archive_format="zip"):
+        """Stream the directory at PATH to the client as a ZIP or tar archive.
+
+        The archive is produced while the tree is walked, so the first bytes
+        go out right away and nothing is written to the served tree.  With
+        archive_cache enabled, the tree is stat'ed first to fingerprint it,
+        a ZIP archive is also written to the cache and later downloads of
+        the unchanged tree are served from that file, with a Content-Length,
+        an ETag and ranges.
+
+        """
+        if not os.path.isdir(path):
+            self.send_error(404, "File not found")
+            return None
+        name = os.path.basename(os.path.normpath(path)) or "download"
+        entries = key = None
+        if archive_format == "zip" and self.archive_cache_usable():
+            # Only a cacheable archive needs the whole tree stat'ed up front.
+            entries = list(self.walk_archive_tree(path, name))
+            key = tree_fingerprint(entries, "zip", self.zip_level)
+            cached = self.archive_cache.get(key)
+            if cached is not None:
+                self.content_disposition = content_disposition(name + ".zip")
+                try:
+                    return self.send_file_head(cached)
+                finally:
+                    self.content_disposition = None
+        return self.send_archive(name, archive_format, [(path, name)], entries, key)
+
+    def send_archive(self, name, archive_format, roots, entries=None, cache_key=None):
+        """Stream the (path, arcname) ROOTS and everything below them as one archive.
+
+        ENTRIES are the ZIP entries when the caller already walked the
+        roots; with a CACHE_KEY the archive is also written to
+        archive_cache.  tar and tar.gz archives walk the tree lazily with
+        os.scandir, so memory stays bounded however large it is.
+
+        """
+        content_type, suffix = ARCHIVE_FORMATS[archive_format]
+        chunked = self.request_version != "HTTP/1.0"
+        if not chunked:
+            self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Disposition", content_disposition(name + suffix))
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if self.command == "HEAD":
+            return None
+
+        out = ChunkedWriter(self.wfile, chunked, self.copy_buffer_size)
+        if archive_format == "zip":
+            if entries is None:
+                entries = (entry for path, arcname in roots for entry in self.walk_archive_tree(path, arcname))
+            self.write_zip_archive(out, entries, cache_key)
+        else:
+            self.write_tar_archive(out, roots, archive_format == "tar.gz")
+        return None
+
+    def write_zip_archive(self, out, entries, cache_key=None):
+        """Write ENTRIES as a ZIP archive to OUT and close it.
+
+        With a CACHE_KEY the archive is also copied into archive_cache.  The
+        copy is best-effort: if the cache directory fails, for instance when
+        it runs out of space, the download goes on without it.
+
+        """
+        cache = self.archive_cache
+        partial = None
+        if cache_key is not None:
+            try:
+                partial = cache.create()
+            except OSError as error:
+                logger.warning("archive cache unavailable, not caching: %s", error)
+
+        def drop_partial():
+            nonlocal partial
+            partial_file, partial_path = partial
+            partial = None
+            try:
+                partial_file.close()
+            except OSError:
+                pass
+            cache.discard(partial_path)
+
+        def write(data):
+            out.write(data)
+            if partial is not None:
+                try:
+                    partial[0].write(data)
+                except OSError as error:
+                    logger.warning("archive cache write failed, not caching: %s", error)
+                    drop_partial()
+
+        try:
+            archive = ZipStreamWriter(write, compresslevel=self.zip_level, pool=self.zip_pool)
+            unchanged = self.write_archive_entries(archive, entries)
+            archive.close()
+        except BaseException:
+            if partial is not None:
+                drop_partial()
+            raise
+        if partial is not None:
+            # Commit before the body ends, so the client's next request hits.
+            # The cached copy must match the fingerprint exactly.
+            partial_file, partial_path = partial
+            try:
+                partial_file.close()
+                if unchanged:
+                    cache.commit(cache_key, partial_path)
+                else:
+                    cache.discard(partial_path)
+            except OSError as error:
+                logger.warning("archive cache write failed, not caching: %s", error)
+                cache.discard(partial_path)
+        out.close()
+
+    def write_tar_archive(self, out, roots, compress):
+        """Write the (path, arcname) ROOTS as a tar archive to OUT and close it.
+
+        Symbolic links are archived as links and special files are skipped.
+
+        """
+        if compress:
+            out = GzipWriter(out, self.zip_level)
+        archive = TarStreamWriter(out)
+        staging = self.upload_staging_path()
+        for path, name in roots:
+            for arcname, entry_path, entry_stat in walk_tree(path, name, exclude={staging}):
+                if self.upload_temp_name.match(os.path.basename(entry_path)):
+                    continue
+                if not archive.add(arcname, entry_path, entry_stat):
+                    logger.debug("download skipped %s", entry_path)
+        archive.close()
+        out.close()
+
+    def walk_archive_tree(self, path, name):
+        """Yield (arcname, path, stat) for the tree at PATH in archive order.
+
+        Directories come before their files, both sorted by name; entries
+        that vanish or are not regular files are left out.  A PATH that is
+        a file gives that file alone.  The tree is walked as entries are
+        consumed, so an archive can start before the walk ends.
+
+        """
+        if not os.path.isdir(path):
+            try:
+                fs = os.stat(path)
+            except OSError:
+                return
+            if stat.S_ISREG(fs.st_mode):
+                yield name, path, fs
+            return
+        staging = self.upload_staging_path()
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if os.path.join(root, name) != staging)
+            relative = os.path.relpath(root, path)
+            prefix = name if relative == os.curdir else posixpath.join(name, *relative.split(os.sep))
+            try:
+                root_stat = os.stat(root)
+            except OSError:
+                continue
+            yield prefix + "/", root, root_stat
+            for file_name in sorted(files):
+                if self.upload_temp_name.match(file_name):
+                    continue
+                file_path = os.path.join(root, file_name)
+                try:
+                    fs = os.stat(file_path)
+                except OSError as error:
+                    logger.debug("download skipped %s: %s", file_path, error)
+                    continue
+                if stat.S_ISREG(fs.st_mode):
+                    yield posixpath.join(prefix, file_name), file_path, fs
+
+    def write_archive_entries(self, archive, entries):
+        """Add ENTRIES to ARCHIVE; return False if any file changed since the walk."""
+        unchanged = True
+        for arcname, file_path, fs in entries:
+            if arcname.endswith("/"):
+                archive.add_directory(arcname, fs.st_mtime)
+                continue
+            try:
+                source = open(file_path, "rb")
+            except OSError as error:
+                logger.debug("download skipped %s: %s", file_path, error)
+                unchanged = False
+                continue
+            with source:
+                current = os.fstat(source.fileno())
+                if (current.st_size, current.st_mtime_ns) != (fs.st_size, fs.st_mtime_ns):
+                    unchanged = False
+                archive.add_fileobj(source, arcname, current)
+        return unchanged
+
+    def archive_cache_usable(self):
+        """Return True when archive_cache is enabled.
+
+        check_archive_cache() has made sure at startup that the cache is
+        outside the served tree.
+
+        """
+        return bool(self.archive_cache.directory and self.archive_cache.max_bytes)
+
+    def open_precompressed(self, path, file_stat):
+        """Pick a precompressed sidecar of PATH for this request.
+
+        Returns (found, coding, file, stat).  FOUND tells whether any fresh
+        sidecar exists, so responses must vary on Accept-Encoding; CODING is
+        None when the plain file should be served.  A sidecar older than the
+        file is stale and ignored.
+
+        """
+        accepted = parse_accept_encoding(self.headers.get("Accept-Encoding"))
+        found = False
+        best = None
+        for coding in self.precompressed_encodings:
+            sidecar = path + PRECOMPRESSED_SUFFIXES[coding]
+            try:
+                sidecar_stat = self.stat_file(sidecar)
+            except OSError:
+                continue
+            if not stat.S_ISREG(sidecar_stat.st_mode) or sidecar_stat.st_mtime_ns < file_stat.st_mtime_ns:
+                continue
+            found = True
+            quality = accepted.get(coding, accepted.get("*", 0.0))
+            if quality > 0 and (best is None or quality > best[0]):
+                best = (quality, coding, sidecar)
+        if best is None:
+            return found, None, None, None
+        try:
+            f, sidecar_stat, _, _ = self.open_file(best[2])
+        except IOError:
+            return found, None, None, None
+        return found, best[1], f, sidecar_stat
+
+    def describe_file(self, path, file_stat):
+        return self.make_file_etag(file_stat), self.guess_type(path)
+
+    def open_file(self, path):
+        """Open PATH for reading and return (file, stat, etag, content_type).
+
+        Goes through open_file_cache when it is enabled; raises OSError.
+
+        """
+        if self.open_file_cache.max_fds:
+            f = self.open_file_cache.open(path, self.describe_file)
+            return f, f.entry.stat, f.entry.etag, f.entry.content_type
+        # Always read in binary mode. Opening files in text mode may cause
+        # newline translations, making the actual size of the content
+        # transmitted *less* than the content-length!
+        f = open(path, 'rb')
+        fs = os.fstat(f.fileno())
+        return (f, fs) + self.describe_file(path, fs)
+
+    def stat_file(self, path):
+        if self.open_file_cache.max_fds:
+            return self.open_file_cache.stat(path, self.describe_file)
+        return os.stat(path)
+
+    def send_small_file(self, path):
+        """Answer from small_file_cache when it holds PATH unchanged.
+
+        The file is stat'ed and its device, inode, size and mtime_ns must
+        match the cached copy, so a changed file is never served from memory.
+        Ranges and clients that should get a compressed representation take
+        the regular path.  Returns True when the request was answered.
+
+        """
+        if self.headers.get("Range"):
+            return False
+        try:
+            fs = os.stat(path)
+        except OSError:
+            return False
+        if fs.st_size > self.small_file_max_size or not stat.S_ISREG(fs.st_mode):
+            return False
+        cached = self.small_file_cache.get((path, fs.st_dev, fs.st_ino, fs.st_size, fs.st_mtime_ns))
+        if cached is None:
+            return False
+        body, etag, ctype, vary = cached
+        accepted = self.headers.get("Accept-Encoding")
+        if accepted:
+            if self.gzip_applies(ctype, fs.st_size) and accepts_encoding(accepted, "gzip"):
+                return False
+            for coding in self.precompressed_encodings:
+                if not accepts_encoding(accepted, coding):
+                    continue
+                try:
+                    sidecar_stat = self.stat_file(path + PRECOMPRESSED_SUFFIXES[coding])
+                except OSError:
+                    continue
+                if sidecar_stat.st_mtime_ns >= fs.st_mtime_ns:
+                    return False
+        if self.is_not_modified(etag, fs.st_mtime):
+            self.send_response(304)
+            self.send_file_validator_headers(fs, etag, vary)
+            self.end_headers()
+            return True
+        self.send_memory_file(fs, etag, ctype, body, vary)
+        return True
+
+    def send_memory_file(self, fs, etag, ctype, body, vary):
+        """Send a whole file held in memory; headers and body go out in one write."""
+        self.transfer_mode = "memory"
+        self.send_response(200)
+        self.send_header("Content-type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_file_validator_headers(fs, etag, vary)
+        if self.command == "HEAD" or self.request_version == "HTTP/0.9":
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+            return
+        self._headers_buffer.append(b"\r\n")
+        self._headers_buffer.append(body)
+        self.flush_headers()
+
     def send_file_head(self, path):
         self._range_remaining = None
-        ctype = self.guess_type(path)
+        if self.small_file_cache.max_bytes and self.send_small_file(path):
+            return None
         try:
-            # Always read in binary mode. Opening files in text mode may cause
-            # newline translations, making the actual size of the content
-            # transmitted *less* than the content-length!
-            f = open(path, 'rb')
+            f, fs, etag, ctype = self.open_file(path)
         except IOError:
             self.send_error(404, "File not found")
             return None
-        fs = os.fstat(f.fileno())
-        etag = self.make_file_etag(fs)
+        vary = False
+        coding = None
+        if self.precompressed_encodings:
+            vary, coding, sidecar, sidecar_stat = self.open_precompressed(path, fs)
+            if coding is not None:
+                # Ranges, validators and sizes now refer to the encoded bytes;
+                # the coding in the ETag keeps it apart from the plain file's.
+                f.close()
+                f, fs = sidecar, sidecar_stat
+                etag = '%s-%s"' % (self.make_file_etag(fs)[:-1], coding)
+        compressed = None
+        if coding is None and self.gzip_applies(ctype, fs.st_size):
+            vary = True
+            if accepts_encoding(self.headers.get("Accept-Encoding"), "gzip"):
+                coding = "gzip"
+                etag = '%s-gzip"' % etag[:-1]
+                compressed = self.gzip_cache.get((etag, self.gzip_level))
+                if compressed is None and not self.is_not_modified(etag, fs.st_mtime):
+                    return self.send_gzipped_file(f, fs, etag, ctype)
         if self.is_not_modified(etag, fs.st_mtime):
             self.send_response(304)
-            self.send_file_validator_headers(fs, etag)
+            self.send_file_validator_headers(fs, etag, vary)
             self.end_headers()
             f.close()
             return None
 
+        size = fs.st_size
+        if compressed is not None:
+            f.close()
+            f = BytesIO(compressed)
+            size = len(compressed)
+
         byte_range = None
         range_header = self.headers.get("Range")
         if range_header and self.if_range_matches(etag, fs.st_mtime):
             try:
-                byte_range = parse_byte_range(range_header, fs.st_size)
+                byte_ranges = parse_byte_ranges(range_header, size, self.max_byte_ranges)
             except ValueError:
                 self.send_response(416)
-                self.send_header("Content-Range", "bytes */%s" % fs.st_size)
+                self.send_header("Content-Range", "bytes */%s" % size)
                 self.send_header("Content-Length", "0")
-                self.send_file_validator_headers(fs, etag)
+                self.send_file_validator_headers(fs, etag, vary)
                 self.end_headers()
                 f.close()
                 return None
+            if byte_ranges and len(byte_ranges) > 1:
+                return self.send_byte_ranges(f, fs, etag, ctype, coding, vary, size, byte_ranges)
+            if byte_ranges:
+                byte_range = byte_ranges[0]
+
+        if (
+            coding is None
+            and byte_range is None
+            and self.command == "GET"
+            and size <= self.small_file_max_size
+            and self.small_file_cache.max_bytes
+            and time.time() - fs.st_mtime >= self.small_file_min_age
+        ):
+            body = f.read(size + 1)
+            if len(body) == size:
+                f.close()
+                self.small_file_cache.put(
+                    (path, fs.st_dev, fs.st_ino, fs.st_size, fs.st_mtime_ns),
+                    (body, etag, ctype, vary),
+                    len(body),
+                )
+                self.send_memory_file(fs, etag, ctype, body, vary)
+                return None
+            # The file changed while it was read: do not cache it.
+            f.seek(0)
 
+        self.transfer_mode = "sendfile" if self.can_sendfile(f) else "copy"
         if byte_range is None:
             self.send_response(200)
-            content_length = fs.st_size
+            content_length = size
         else:
             start, end = byte_range
             content_length = end - start + 1
@@ -1150,320 +2711,382 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             self.send_response(206)
             self.send_header(
                 "Content-Range",
-                "bytes %s-%s/%s" % (start, end, fs.st_size),
+                "bytes %s-%s/%s" % (start, end, size),
             )
         self.send_header("Content-type", ctype)
+        if coding is not None:
+            self.send_header("Content-Encoding", coding)
         self.send_header("Content-Length", str(content_length))
-        self.send_file_validator_headers(fs, etag)
+        self.send_file_validator_headers(fs, etag, vary)
         self.end_headers()
         return f
 
+    def send_byte_ranges(self, f, fs, etag, ctype, coding, vary, size, byte_ranges):
+        """Send several ranges of F as one multipart/byteranges response.
+
+        Part headers are built up front, so Content-Length is known without
+        buffering any body; each part's bytes then go through copyfile() and
+        its zero-copy path.  Headers (and the body, for GET) are sent here
+        and None is returned.
+
+        """
+        boundary = secrets.token_hex(16)
+        part_heads = []
+        for start, end in byte_ranges:
+            part_heads.append((
+                "\r\n--%s\r\n"
+                "Content-Type: %s\r\n"
+                "Content-Range: bytes %d-%d/%d\r\n"
+                "\r\n" % (boundary, ctype, start, end, size)
+            ).encode("latin-1"))
+        closing = ("\r\n--%s--\r\n" % boundary).encode("ascii")
+        content_length = (
+            sum(len(head) for head in part_heads)
+            + sum(end - start + 1 for start, end in byte_ranges)
+            + len(closing)
+        )
+        with f:
+            self.transfer_mode = "sendfile" if self.can_sendfile(f) else "copy"
+            self.send_response(206)
+            self.send_header("Content-Type", "multipart/byteranges; boundary=%s" % boundary)
+            if coding is not None:
+                self.send_header("Content-Encoding", coding)
+            self.send_header("Content-Length", str(content_length))
+            self.send_file_validator_headers(fs, etag, vary)
+            self.end_headers()
+            if self.command == "HEAD":
+                return None
+            for head, (start, end) in zip(part_heads, byte_ranges):
+                self.wfile.write(head)
+                f.seek(start)
+                self._range_remaining = end - start + 1
+                self.copyfile(f, self.wfile)
+            self._range_remaining = None
+            self.wfile.write(closing)
+        return None
+
+    def gzip_applies(self, content_type, size=None):
+        """Return True when a response of this type and size may be gzipped on the fly."""
+        return (
+            self.gzip_level > 0
+            and (size is None or size >= self.gzip_min_size)
+            and is_compressible_type(content_type)
+        )
+
+    def send_gzipped_file(self, f, fs, etag, ctype):
+        """Stream F gzipped in chunked transfer coding and cache the result.
+
+        The compressed length is only known at the end, so a Range is not
+        honoured here; once the body is cached, later requests get ranges.
+        Headers (and the body, for GET) are sent here and None is returned.
+
+        """
+        with f:
+            chunked = self.request_version != "HTTP/1.0"
+            if not chunked:
+                self.close_connection = True
+            self.transfer_mode = "gzip"
+            self.send_response(200)
+            self.send_header("Content-type", ctype)
+            self.send_header("Content-Encoding", "gzip")
+            if chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+            self.send_file_validator_headers(fs, etag, vary=True)
+            self.end_headers()
+            if self.command == "HEAD":
+                return None
+            writer = ChunkedWriter(self.wfile, chunked, self.copy_buffer_size)
+            keep = min(self.gzip_cache_max_entry_size, self.gzip_cache.max_bytes)
+            out = GzipWriter(writer, self.gzip_level, keep=keep)
+            for chunk in iter(lambda: f.read(self.copy_buffer_size), b""):
+                out.write(chunk)
+            out.finish()
+            # A file rewritten while it was read must not be cached under
+            # the ETag it had when it was opened.
+            after = os.fstat(f.fileno())
+            unchanged = (after.st_mtime_ns, after.st_size) == (fs.st_mtime_ns, fs.st_size)
+        body = out.getvalue()
+        if body is not None and unchanged:
+            # Cache before the body ends, so the client's next request hits.
+            self.gzip_cache.put((etag, self.gzip_level), body, len(body))
+        writer.close()
+        return None
+
     def list_directory(self, path, read_only=False, listing_root="/", display_path=None):
         """Helper to produce a directory listing (absent index.html).
 
-        Return value is either a file object, or None (indicating an
-        error).  In either case, the headers are sent, making the
-        interface the same as for send_head().
+        The listing is split into pages of listing_page_size entries that
+        are selected with ?after= / ?before= cursors and ?limit=.  The page
+        head is sent before the directory is read and rows are streamed in
+        chunked transfer coding, so memory stays bounded by the page size.
+        Headers (and the body, for GET) are sent here and None is returned.
 
         """
+        request_path, _, query = self.path.partition("?")
+        as_json = self.wants_json_listing(query)
         try:
-            list = os.listdir(path)
-        except os.error:
+            params = self.parse_listing_params(query, allow_sorting=as_json)
+        except ValueError as error:
+            self.send_error(400, str(error))
+            return None
+        try:
+            dir_stat = os.stat(path)
+        except OSError:
             self.send_error(404, "No permission to list directory")
             return None
-        list.sort(key=lambda a: a.lower())
-        f = BytesIO()
-        displaypath = html.escape(
-            display_path if display_path is not None else urllib.parse.unquote(self.path)
+        # The page also depends on the request path (links, "..", the share
+        # token) and on whether a Logout button is shown.
+        key = (
+            "json" if as_json else "html", os.path.realpath(path), dir_stat.st_mtime_ns,
+            read_only, listing_root, display_path, self.path, bool(self.server_password),
         )
+        use_gzip = self.gzip_level > 0 and accepts_encoding(self.headers.get("Accept-Encoding"), "gzip")
+        # A directory changed this recently may change again without a new
+        # mtime, so its listing gets no validator a client could reuse.
+        cacheable = self.listing_is_cacheable(dir_stat)
+        etag = None
+        if cacheable:
+            etag = '"%s"' % hashlib.sha1(repr((__version__,) + key).encode("utf-8")).hexdigest()[:24]
+            if use_gzip:
+                etag = '%s-gzip"' % etag[:-1]
+        if cacheable and self.is_not_modified(etag, dir_stat.st_mtime):
+            self.send_response(304)
+            self.send_listing_validator_headers(etag)
+            self.end_headers()
+            return None
 
-        js_action_create_folder = "window.open('%s' + document.getElementById('folderName').value,'_self')" % (
-                self.path.strip() + "?createfolder=",
+        body = self.listing_cache.get(key)
+        if body is None and as_json:
+            try:
+                body = self.render_json_listing(path, request_path, display_path, params)
+            except OSError:
+                self.send_error(404, "No permission to list directory")
+                return None
+            if cacheable:
+                self.listing_cache.put(key, body, len(body))
+        if body is not None:
+            if use_gzip:
+                compressed = self.gzip_cache.get((etag, self.gzip_level)) if cacheable else None
+                if compressed is None:
+                    compressed = gzip.compress(body, self.gzip_level, mtime=0)
+                    if cacheable:
+                        self.gzip_cache.put((etag, self.gzip_level), compressed, len(compressed))
+                body = compressed
+            self.send_response(200)
+            if as_json:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+            else:
+                self.send_header("Content-type", "text/html; charset=utf-8")
+            if use_gzip:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_listing_validator_headers(etag)
+            self.end_headers()
+            return BytesIO(body)
+
+        try:
+            scanner = os.scandir(path)
+        except OSError:
+            self.send_error(404, "No permission to list directory")
+            return None
+        with scanner:
+            chunked = self.request_version != "HTTP/1.0"
+            if not chunked:
+                self.close_connection = True
+            self.send_response(200)
+            self.send_header("Content-type", "text/html; charset=utf-8")
+            if use_gzip:
+                self.send_header("Content-Encoding", "gzip")
+            if chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+            self.send_listing_validator_headers(etag)
+            self.end_headers()
+            if self.command == "HEAD":
+                return None
+
+            out = ChunkedWriter(self.wfile, chunked, self.copy_buffer_size)
+            if use_gzip:
+                out = GzipWriter(out, self.gzip_level)
+            head = b"".join(self.render_listing_head(request_path, read_only, listing_root, display_path))
+            out.write(head)
+            out.flush()
+            page = select_listing_page(
+                self.listed_entries(path, scanner), params["limit"], after=params["after"], before=params["before"],
             )
+            parts = self.render_listing_rows(page.entries, request_path, read_only, [])
+            self.render_listing_tail(self.render_page_links(page, params), parts)
+            rest = b"".join(parts)
+            out.write(rest)
+            if cacheable:
+                body = head + rest
+                self.listing_cache.put(key, body, len(body))
+            out.close()
+        return None
 
-        def customwrite(htmlstring):
-            f.write(htmlstring.encode('utf-8'))
-
-        customwrite("<!DOCTYPE html>\n")
-        customwrite("<html lang=\"en\">\n")
-        customwrite("<head>\n")
-        customwrite("<meta charset=\"utf-8\">\n")
-        customwrite("<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">\n")
-        customwrite("<script>\n")
-        customwrite("(function(){\n")
-        customwrite("var stored=localStorage.getItem('simple-server-theme');\n")
-        customwrite("var theme=stored||'dark';\n")
-        customwrite("document.documentElement.setAttribute('data-theme', theme);\n")
-        customwrite("})();\n")
-        customwrite("</script>\n")
-        customwrite("<title>Directory listing for %s</title>\n" % displaypath)
-        customwrite("<style>\n")
-        customwrite(":root{color-scheme:dark;--bg:#0b1120;--text:#e2e8f0;--muted:#94a3b8;"
-                    "--card:#0f172a;--border:#1e293b;--surface:#111827;--primary:#3b82f6;"
-                    "--secondary:#334155;--link:#60a5fa;--danger:#f87171;"
-                    "--shadow:0 12px 30px rgba(2,6,23,.6);}\n")
-        customwrite(":root[data-theme='light']{color-scheme:light;--bg:#f5f7fb;--text:#0f172a;--muted:#64748b;"
-                    "--card:#fff;--border:#e2e8f0;--surface:#f8fafc;--primary:#2563eb;"
-                    "--secondary:#0f172a;--link:#1d4ed8;--danger:#ef4444;"
-                    "--shadow:0 12px 30px rgba(15,23,42,.08);}\n")
-        customwrite("body{font-family:system-ui,-apple-system,Segoe UI,Roboto,Ubuntu,Arial,sans-serif;"
-                    "background:var(--bg);color:var(--text);margin:0;padding:32px;}\n")
-        customwrite(".container{max-width:960px;margin:0 auto;}\n")
-        customwrite(".card{background:var(--card);border-radius:16px;padding:24px;"
-                    "box-shadow:var(--shadow);border:1px solid var(--border);}\n")
-        customwrite(".header{display:flex;flex-direction:column;gap:6px;margin-bottom:18px;}\n")
-        customwrite(".header h2{margin:0;font-size:24px;}\n")
-        customwrite(".header .path{color:var(--muted);font-size:14px;}\n")
-        customwrite(".actions{display:flex;flex-wrap:wrap;gap:12px;margin-bottom:18px;}\n")
-        customwrite(".actions form{display:flex;align-items:center;gap:8px;"
-                    "background:var(--surface);padding:10px 12px;border-radius:12px;"
-                    "border:1px solid var(--border);}\n")
-        customwrite("input[type='text'],input[type='file'],select{font-size:14px;}\n")
-        customwrite(".btn{background:var(--primary);color:#fff;border:none;border-radius:8px;"
-                    "padding:8px 12px;font-size:14px;cursor:pointer;text-decoration:none;}\n")
-        customwrite(".btn.secondary{background:var(--secondary);}\n")
-        customwrite(".upload-panel{margin-bottom:18px;}\n")
-        customwrite(".upload-form{display:block;}\n")
-        customwrite(".upload-dropzone{display:flex;align-items:center;justify-content:center;"
-                    "flex-direction:column;gap:5px;min-height:110px;padding:18px;border:2px dashed var(--border);"
-                    "border-radius:12px;background:var(--surface);cursor:pointer;text-align:center;transition:.15s ease;}\n")
-        customwrite(".upload-dropzone:hover,.upload-dropzone:focus,.upload-dropzone.dragover{"
-                    "border-color:var(--primary);box-shadow:0 0 0 3px rgba(59,130,246,.18);outline:none;}\n")
-        customwrite(".upload-dropzone input{position:absolute;width:1px;height:1px;overflow:hidden;"
-                    "clip:rect(0 0 0 0);white-space:nowrap;}\n")
-        customwrite(".upload-hint{color:var(--muted);font-size:13px;}\n")
-        customwrite(".upload-controls{display:flex;gap:10px;margin-top:10px;}\n")
-        customwrite(".upload-queue{display:flex;flex-direction:column;gap:10px;list-style:none;margin:12px 0 0;padding:0;}\n")
-        customwrite(".upload-item{display:grid;grid-template-columns:minmax(0,1fr) auto;gap:7px 12px;"
-                    "padding:12px;border:1px solid var(--border);border-radius:10px;background:var(--surface);}\n")
-        customwrite(".upload-name{overflow:hidden;text-overflow:ellipsis;white-space:nowrap;font-weight:600;}\n")
-        customwrite(".upload-progress{grid-column:1;width:100%;height:9px;accent-color:var(--primary);}\n")
-        customwrite(".upload-state{grid-column:1;color:var(--muted);font-size:12px;}\n")
-        customwrite(".upload-item.success .upload-state{color:#10b981;}\n")
-        customwrite(".upload-item.failed .upload-state,.upload-item.cancelled .upload-state{color:var(--danger);}\n")
-        customwrite(".cancel-upload{grid-column:2;grid-row:1/4;align-self:center;background:transparent;"
-                    "color:var(--danger);border:1px solid var(--danger);border-radius:8px;padding:6px 9px;cursor:pointer;}\n")
-        customwrite(".cancel-upload:disabled{cursor:default;opacity:.55;}\n")
-        customwrite(".share-settings{display:flex;align-items:center;gap:8px;background:var(--surface);"
-                    "padding:10px 12px;border:1px solid var(--border);border-radius:12px;}\n")
-        customwrite(".share-settings select,.share-link{background:var(--card);color:var(--text);"
-                    "border:1px solid var(--border);border-radius:7px;padding:7px;}\n")
-        customwrite(".share-button{background:transparent;color:var(--link);border:1px solid var(--link);"
-                    "border-radius:8px;padding:4px 8px;font-size:12px;cursor:pointer;}\n")
-        customwrite(".share-button:disabled{cursor:wait;opacity:.6;}\n")
-        customwrite(".share-result{display:grid;grid-template-columns:minmax(0,1fr) auto;gap:8px;"
-                    "margin-bottom:18px;padding:12px;background:var(--surface);border:1px solid var(--border);"
-                    "border-radius:12px;}\n")
-        customwrite(".share-result[hidden]{display:none;}\n")
-        customwrite(".share-link{min-width:0;}\n")
-        customwrite(".share-status{grid-column:1/-1;color:var(--muted);font-size:12px;}\n")
-        customwrite(".list{list-style:none;margin:0;padding:0;}\n")
-        customwrite(".list li{display:flex;align-items:center;justify-content:space-between;"
-                    "padding:10px 12px;border-bottom:1px solid var(--border);}\n")
-        customwrite(".list li:last-child{border-bottom:none;}\n")
-        customwrite(".file-link{color:var(--link);text-decoration:none;font-weight:500;}\n")
-        customwrite(".file-meta{display:flex;align-items:center;gap:12px;color:var(--muted);font-size:12px;}\n")
-        customwrite(".delete{background:var(--danger);color:#fff;border-radius:8px;text-decoration:none;"
-                    "padding:4px 8px;font-size:12px;}\n")
-        customwrite(".footer{margin-top:20px;font-size:12px;color:var(--muted);}\n")
-        customwrite("</style>\n")
-        customwrite("</head>\n")
-        customwrite("<body>\n")
-        customwrite("<div class=\"container\">\n")
-        customwrite("<div class=\"card\">\n")
-        customwrite("<div class=\"header\">\n")
-        customwrite("<h2>%s</h2>\n" % ("Shared directory" if read_only else "Directory listing"))
-        customwrite("<div class=\"path\">%s</div>\n" % displaypath)
-        customwrite("</div>\n")
-        if not read_only:
-            customwrite("<div class=\"upload-panel\">\n")
-            customwrite("<form id=\"upload-form\" class=\"upload-form\" ENCTYPE=\"multipart/form-data\" method=\"post\">\n")
-            customwrite("<label id=\"upload-dropzone\" class=\"upload-dropzone\" for=\"upload-input\" tabindex=\"0\">\n")
-            customwrite("<strong>Drop files here or choose files</strong>\n")
-            customwrite("<span class=\"upload-hint\">Files upload individually so each transfer can be tracked or cancelled.</span>\n")
-            customwrite("<input id=\"upload-input\" name=\"file\" type=\"file\" multiple>\n")
-            customwrite("</label>\n")
-            customwrite("<div class=\"upload-controls\">\n")
-            customwrite("<button id=\"upload-submit\" class=\"btn\" type=\"submit\">Upload selected</button>\n")
-            customwrite("<button id=\"refresh-list\" class=\"btn secondary\" type=\"button\" hidden>Refresh listing</button>\n")
-            customwrite("</div>\n")
-            customwrite("</form>\n")
-            customwrite("<ul id=\"upload-queue\" class=\"upload-queue\" aria-live=\"polite\"></ul>\n")
-            customwrite("</div>\n")
-        customwrite("<div class=\"actions\">\n")
-        if not read_only:
-            customwrite("<form ENCTYPE=\"multipart/form-data\">")
-            customwrite("<label for=\"folderName\"><small>Create folder:</small></label>")
-            customwrite("<input type=\"text\" id=\"folderName\" placeholder=\"New folder\">")
-            customwrite("<button class=\"btn secondary\" type=\"button\" onclick=\"" + js_action_create_folder + "\">Create</button>")
-            customwrite("</form>\n")
-            customwrite("<a class=\"btn\" href='%s'>Download zip</a>\n" % (self.path + "?download",))
-            customwrite("<a class=\"btn secondary\" href='/__connect__'>Connect devices</a>\n")
-            customwrite("<div class=\"share-settings\">")
-            customwrite("<label for=\"share-expiry\"><small>Share expires:</small></label>")
-            customwrite("<select id=\"share-expiry\">")
-            customwrite("<option value=\"900\">15 minutes</option>")
-            customwrite("<option value=\"3600\" selected>1 hour</option>")
-            customwrite("<option value=\"86400\">24 hours</option>")
-            customwrite("</select></div>\n")
-        customwrite("<button class=\"btn secondary\" type=\"button\" id=\"theme-toggle\">Light mode</button>\n")
-        if self.server_password and not read_only:
-            customwrite("<a class=\"btn secondary\" href='/__logout__'>Logout</a>\n")
-        customwrite("</div>\n")
-        if not read_only:
-            customwrite("<div id=\"share-result\" class=\"share-result\" hidden>\n")
-            customwrite("<input id=\"share-link\" class=\"share-link\" type=\"text\" readonly aria-label=\"Generated share link\">\n")
-            customwrite("<button id=\"copy-share\" class=\"btn secondary\" type=\"button\">Copy</button>\n")
-            customwrite("<span id=\"share-status\" class=\"share-status\" aria-live=\"polite\"></span>\n")
-            customwrite("</div>\n")
-        customwrite("<ul class=\"list\">\n")
-        if self.path != listing_root:
-            customwrite('<li><a href="%s">..</a>\n' % (urllib.parse.quote(self.path + ".."),))
-        for name in list:
-            fullname = os.path.join(path, name)
-            displayname = linkname = name
-            # Append / for directories or @ for symbolic links
+    def wants_json_listing(self, query):
+        requested = urllib.parse.parse_qs(query).get("format")
+        if requested:
+            return requested[0] == "json"
+        return "application/json" in self.headers.get("Accept", "")
+
+    def parse_listing_params(self, query, allow_sorting=False):
+        """Validate the pagination (and, for JSON, sorting) parameters of a listing."""
+        params = urllib.parse.parse_qs(query)
+        sort = "name"
+        descending = False
+        match = None
+        if allow_sorting:
+            sort = params.get("sort", ["name"])[0]
+            if sort not in LISTING_SORT_FIELDS:
+                raise ValueError("Unknown sort field")
+            order = params.get("order", ["asc"])[0]
+            if order not in ("asc", "desc"):
+                raise ValueError("Unknown sort order")
+            descending = order == "desc"
+            match = params.get("glob", [None])[0]
+        limit = self.listing_page_size
+        if "limit" in params:
+            try:
+                limit = int(params["limit"][0])
+            except ValueError:
+                limit = 0
+            if not 0 < limit <= max(self.listing_max_page_size, self.listing_page_size):
+                raise ValueError("Invalid page size")
+        cursors = {}
+        for name in "after", "before":
+            cursors[name] = decode_cursor(params[name][0], sort, descending) if name in params else None
+        return {
+            "limit": limit,
+            "explicit_limit": "limit" in params,
+            "after": cursors["after"],
+            "before": cursors["before"],
+            "sort": sort,
+            "descending": descending,
+            "match": match,
+        }
 
-            size_display = ""
+    def render_json_listing(self, path, request_path, display_path, params):
+        with os.scandir(path) as scanner:
+            page = select_listing_page(
+                self.listed_entries(path, scanner),
+                params["limit"],
+                sort=params["sort"],
+                descending=params["descending"],
+                after=params["after"],
+                before=params["before"],
+                match=params["match"],
+            )
+        sort, descending = params["sort"], params["descending"]
+        end = page.start + len(page.entries)
+        payload = {
+            "path": display_path if display_path is not None else urllib.parse.unquote(request_path),
+            "sort": sort,
+            "order": "desc" if descending else "asc",
+            "total": page.total,
+            "start": page.start,
+            "entries": [
+                {
+                    "name": entry.name,
+                    "type": "directory" if entry.is_dir else "file",
+                    "symlink": entry.is_link,
+                    "size": entry.size,
+                    "mtime_ns": entry.mtime_ns,
+                    "etag": format_file_etag(entry.inode, entry.mtime_ns, entry.size),
+                }
+                for entry in page.entries
+            ],
+            "next_cursor": None,
+            "prev_cursor": None,
+        }
+        if page.entries and end < page.total:
+            payload["next_cursor"] = encode_cursor(sort, descending, listing_sort_key(page.entries[-1], sort))
+        if page.entries and page.start > 0:
+            payload["prev_cursor"] = encode_cursor(sort, descending, listing_sort_key(page.entries[0], sort))
+        return json.dumps(payload).encode("utf-8")
+
+    def render_page_links(self, page, params):
+        if page.start == 0 and page.start + len(page.entries) >= page.total:
+            return ""
+        extra = "&limit=%d" % params["limit"] if params["explicit_limit"] else ""
+        links = []
+        if page.start > 0:
+            links.append("<a href=\"?%s\">First</a>" % extra.lstrip("&"))
+            links.append("<a href=\"?before=%s%s\">Previous</a>" % (
+                encode_cursor("name", False, listing_sort_key(page.entries[0], "name")), extra,
+            ))
+        first = page.start + 1 if page.entries else page.start
+        links.append("<span>%d&ndash;%d of %d</span>" % (first, page.start + len(page.entries), page.total))
+        if page.entries and page.start + len(page.entries) < page.total:
+            links.append("<a href=\"?after=%s%s\">Next</a>" % (
+                encode_cursor("name", False, listing_sort_key(page.entries[-1], "name")), extra,
+            ))
+        return "".join(links)
 
-            if os.path.isdir(fullname):
-                displayname = name + "/"
-                linkname = name + "/"
-            else:
-                size_value = os.path.getsize(fullname)
-                size_value = sizeof_fmt(size_value)
+    def send_listing_validator_headers(self, etag):
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept, Accept-Encoding" if self.gzip_level > 0 else "Accept")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Referrer-Policy", "no-referrer")
 
-                size_display = "<span>(%s)</span>" % (size_value,)
+    def listing_is_cacheable(self, dir_stat):
+        return time.time() - dir_stat.st_mtime >= self.listing_cache_min_age
 
-            if os.path.islink(fullname):
-                displayname = name + "@"
+    def render_listing_head(self, request_path, read_only, listing_root, display_path):
+        """Return the page up to the first entry row as a list of bytes."""
+        displaypath = html.escape(
+            display_path if display_path is not None else urllib.parse.unquote(request_path)
+        )
+        parent = ""
+        if request_path != listing_root:
+            parent = '<li><a href="%s">..</a>\n' % (urllib.parse.quote(request_path + ".."),)
+        template = LISTING_HEADS[read_only, bool(self.server_password) and not read_only]
+        return template.render_parts({
+            "path": displaypath,
+            "create_folder": "window.open('%s' + document.getElementById('folderName').value,'_self')" % (
+                request_path.strip() + "?createfolder=",
+            ),
+            "download": request_path,
+            "parent": parent,
+        })
+
+    def render_listing_rows(self, entries, request_path, read_only, out):
+        """Append the rows for ENTRIES to OUT, a list of bytes."""
+        row_format = LISTING_ROWS[read_only]
+        quote = urllib.parse.quote
+        escape = html.escape
+        # quote() output has no characters html.escape() would change.
+        values = {"scope": quote(urllib.parse.unquote(request_path))}
+        minutes = {}
+        rows = []
+        for entry in entries:
+            displayname = linkname = entry.name
+            # Append / for directories or @ for symbolic links
+            size_display = ""
+            if entry.is_dir:
+                displayname = linkname = entry.name + "/"
+            else:
+                size_display = "<span>(%s)</span>" % (sizeof_fmt(entry.size),)
+            if entry.is_link:
+                displayname = entry.name + "@"
                 # Note: a link to a directory displays with @ and links with /
-            customwrite("<li>")
-            customwrite("<a class=\"file-link\" href=\"%s\">%s</a>" % (
-                urllib.parse.quote(linkname),
-                html.escape(displayname),
-            ))
-            customwrite("<div class=\"file-meta\">%s" % size_display)
-            if not read_only:
-                scope_path = urllib.parse.quote(
-                    urllib.parse.unquote(self.path) + linkname,
-                    safe='/',
-                )
-                customwrite("<button class=\"share-button\" type=\"button\" data-scope=\"%s\">Share</button>" % (
-                    html.escape(scope_path, quote=True),
-                ))
-                customwrite("<a class=\"delete\" href=\"%s\">Delete</a>" % (
-                    "?deletefile=" + html.escape(displayname),
-                ))
-            customwrite("</div></li>\n")
-        customwrite("</ul>\n")
-        customwrite("<div class=\"footer\">Powered By: Gil, check new version ")
-        customwrite("<a href=\"https://github.com/adrianogil/simple-server\">")
-        customwrite("here</a>.</div>\n")
-        customwrite("</div>\n</div>\n")
-        customwrite("<script>\n")
-        customwrite("(function(){\n")
-        customwrite("var button=document.getElementById('theme-toggle');\n")
-        customwrite("var root=document.documentElement;\n")
-        customwrite("function applyLabel(){\n")
-        customwrite("if(!button){return;}\n")
-        customwrite("var theme=root.getAttribute('data-theme')||'dark';\n")
-        customwrite("button.textContent=theme==='dark'?'Light mode':'Dark mode';\n")
-        customwrite("}\n")
-        customwrite("if(button){\n")
-        customwrite("button.addEventListener('click',function(){\n")
-        customwrite("var next=(root.getAttribute('data-theme')==='dark')?'light':'dark';\n")
-        customwrite("root.setAttribute('data-theme',next);\n")
-        customwrite("localStorage.setItem('simple-server-theme',next);\n")
-        customwrite("applyLabel();\n")
-        customwrite("});\n")
-        customwrite("}\n")
-        customwrite("applyLabel();\n")
-        customwrite("var uploadForm=document.getElementById('upload-form');\n")
-        customwrite("var uploadInput=document.getElementById('upload-input');\n")
-        customwrite("var uploadSubmit=document.getElementById('upload-submit');\n")
-        customwrite("var dropzone=document.getElementById('upload-dropzone');\n")
-        customwrite("var queue=document.getElementById('upload-queue');\n")
-        customwrite("var refresh=document.getElementById('refresh-list');\n")
-        customwrite("if(uploadForm){\n")
-        customwrite("function uploadFile(file){\n")
-        customwrite("var item=document.createElement('li');item.className='upload-item';\n")
-        customwrite("var name=document.createElement('span');name.className='upload-name';name.textContent=file.name;\n")
-        customwrite("var progress=document.createElement('progress');progress.className='upload-progress';"
-                    "progress.max=100;progress.value=0;\n")
-        customwrite("var state=document.createElement('span');state.className='upload-state';state.textContent='Starting…';\n")
-        customwrite("var cancel=document.createElement('button');cancel.type='button';cancel.className='cancel-upload';"
-                    "cancel.textContent='Cancel';\n")
-        customwrite("item.appendChild(name);item.appendChild(progress);item.appendChild(state);item.appendChild(cancel);"
-                    "queue.appendChild(item);\n")
-        customwrite("var data=new FormData();data.append('file',file,file.name);\n")
-        customwrite("var xhr=new XMLHttpRequest();xhr.open('POST',window.location.pathname,true);"
-                    "xhr.setRequestHeader('Accept','application/json');\n")
-        customwrite("xhr.upload.addEventListener('progress',function(event){if(!event.lengthComputable){return;}"
-                    "var percent=Math.round((event.loaded/event.total)*100);progress.value=percent;"
-                    "state.textContent=percent<100?percent+'%':'Processing…';});\n")
-        customwrite("xhr.addEventListener('load',function(){cancel.disabled=true;"
-                    "if(xhr.status>=200&&xhr.status<300){progress.value=100;item.classList.add('success');"
-                    "state.textContent='Complete';cancel.textContent='Done';refresh.hidden=false;return;}"
-                    "item.classList.add('failed');cancel.textContent='Failed';"
-                    "try{state.textContent=JSON.parse(xhr.responseText).message||'Upload failed';}"
-                    "catch(error){state.textContent='Upload failed ('+xhr.status+')';}});\n")
-        customwrite("xhr.addEventListener('error',function(){cancel.disabled=true;cancel.textContent='Failed';"
-                    "item.classList.add('failed');state.textContent='Network error';});\n")
-        customwrite("xhr.addEventListener('abort',function(){cancel.disabled=true;cancel.textContent='Cancelled';"
-                    "item.classList.add('cancelled');state.textContent='Cancelled';});\n")
-        customwrite("cancel.addEventListener('click',function(){xhr.abort();});xhr.send(data);\n")
-        customwrite("}\n")
-        customwrite("function uploadFiles(files){Array.prototype.forEach.call(files,uploadFile);}\n")
-        customwrite("uploadSubmit.hidden=true;\n")
-        customwrite("uploadInput.addEventListener('change',function(){uploadFiles(uploadInput.files);uploadInput.value='';});\n")
-        customwrite("uploadForm.addEventListener('submit',function(event){event.preventDefault();"
-                    "uploadFiles(uploadInput.files);uploadInput.value='';});\n")
-        customwrite("['dragenter','dragover'].forEach(function(type){dropzone.addEventListener(type,function(event){"
-                    "event.preventDefault();dropzone.classList.add('dragover');});});\n")
-        customwrite("['dragleave','drop'].forEach(function(type){dropzone.addEventListener(type,function(event){"
-                    "event.preventDefault();dropzone.classList.remove('dragover');});});\n")
-        customwrite("dropzone.addEventListener('drop',function(event){uploadFiles(event.dataTransfer.files);});\n")
-        customwrite("dropzone.addEventListener('keydown',function(event){if(event.key==='Enter'||event.key===' '){"
-                    "event.preventDefault();uploadInput.click();}});\n")
-        customwrite("refresh.addEventListener('click',function(){window.location.reload();});\n")
-        customwrite("}\n")
-        customwrite("var shareResult=document.getElementById('share-result');\n")
-        customwrite("if(shareResult){\n")
-        customwrite("var shareExpiry=document.getElementById('share-expiry');\n")
-        customwrite("var shareLink=document.getElementById('share-link');\n")
-        customwrite("var shareStatus=document.getElementById('share-status');\n")
-        customwrite("var copyShare=document.getElementById('copy-share');\n")
-        customwrite("Array.prototype.forEach.call(document.querySelectorAll('.share-button'),function(control){\n")
-        customwrite("control.addEventListener('click',function(){control.disabled=true;shareStatus.textContent='Creating link…';"
-                    "fetch('/__share__',{method:'POST',credentials:'same-origin',headers:{'Content-Type':'application/json'},"
-                    "body:JSON.stringify({path:control.dataset.scope,expires_in:Number(shareExpiry.value)})})"
-                    ".then(function(response){return response.json().then(function(data){if(!response.ok){"
-                    "throw new Error(data.message||'Could not create link');}return data;});})"
-                    ".then(function(data){shareLink.value=window.location.origin+data.url;shareResult.hidden=false;"
-                    "shareStatus.textContent='Expires '+new Date(data.expires_at*1000).toLocaleString();shareLink.select();})"
-                    ".catch(function(error){shareResult.hidden=false;shareLink.value='';shareStatus.textContent=error.message;})"
-                    ".then(function(){control.disabled=false;});});\n")
-        customwrite("});\n")
-        customwrite("function fallbackCopy(){shareLink.select();document.execCommand('copy');"
-                    "shareStatus.textContent='Link copied';}\n")
-        customwrite("copyShare.addEventListener('click',function(){if(!shareLink.value){return;}"
-                    "if(navigator.clipboard&&window.isSecureContext){navigator.clipboard.writeText(shareLink.value)"
-                    ".then(function(){shareStatus.textContent='Link copied';}).catch(fallbackCopy);return;}"
-                    "fallbackCopy();});\n")
-        customwrite("}\n")
-        customwrite("})();\n")
-        customwrite("</script>\n")
-        customwrite("</body>\n</html>\n")
-        length = f.tell()
-        f.seek(0)
-        self.send_response(200)
-        encoding = sys.getfilesystemencoding()
-        self.send_header("Content-type", "text/html; charset=%s" % encoding)
-        self.send_header("Content-Length", str(length))
-        self.send_header("Referrer-Policy", "no-referrer")
-        self.end_headers()
-        return f
+            minute = entry.mtime_ns // 60000000000
+            mtime = minutes.get(minute)
+            if mtime is None:
+                mtime = minutes[minute] = format_mtime(entry.mtime_ns)
+            values["href"] = quote(linkname)
+            values["value"] = quote(entry.name)
+            values["name"] = escape(displayname)
+            values["size"] = size_display
+            values["mtime"] = mtime
+            rows.append(row_format % values)
+        out.append("".join(rows).encode("utf-8"))
+        return out
+
+    def render_listing_tail(self, page_links, out):
+        """Append the rest of the page after the last entry row to OUT."""
+        pages = "<nav class=\"pages\">%s</nav>\n" % page_links if page_links else ""
+        return LISTING_TAIL.render_parts({"pages": pages}, out)
 
     def translate_path(self, path):
         """Translate a /-separated PATH to the local filename syntax.
@@ -1502,15 +3125,75 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
 
         """
         remaining = getattr(self, '_range_remaining', None)
-        if remaining is None:
-            shutil.copyfileobj(source, outputfile)
-            return
-        while remaining > 0:
-            chunk = source.read(min(self.copy_buffer_size, remaining))
-            if not chunk:
-                break
-            outputfile.write(chunk)
-            remaining -= len(chunk)
+        drop = self.advise_body(source, remaining)
+        try:
+            if outputfile is self.wfile and self.can_sendfile(source):
+                if hasattr(outputfile, "send_file_later"):
+                    # The asyncio engine sends the body with loop.sendfile()
+                    # once the handler returns, and drops the pages after it.
+                    outputfile.send_file_later(source, remaining, drop is not None)
+                    drop = None
+                    return
+                # socket.sendfile() hands the file to os.sendfile() with an
+                # explicit offset, so the body never passes through userspace.
+                self.connection.sendfile(source, source.tell(), remaining)
+                return
+            if remaining is None:
+                shutil.copyfileobj(source, outputfile)
+                return
+            while remaining > 0:
+                chunk = source.read(min(self.copy_buffer_size, remaining))
+                if not chunk:
+                    break
+                outputfile.write(chunk)
+                remaining -= len(chunk)
+        finally:
+            if drop is not None:
+                drop_cached_pages(*drop)
+
+    def advise_body(self, source, count):
+        """Give the kernel read-ahead hints for a file body about to be sent.
+
+        The prefetch window is sized from the body (or range) length.
+        Returns the (fd, offset, length) whose cached pages should be
+        dropped once the body is out, or None.
+
+        """
+        if not hasattr(os, "posix_fadvise") or not (self.readahead_max or self.drop_cache_min_size):
+            return None
+        try:
+            fd = source.fileno()
+            offset = source.tell()
+            if count is None:
+                count = os.fstat(fd).st_size - offset
+        except (AttributeError, OSError, ValueError):
+            return None
+        if self.readahead_max and count >= self.fadvise_min_size:
+            advise_sequential_read(fd, offset, count, self.readahead_max)
+        if self.drop_cache_min_size and count >= self.drop_cache_min_size:
+            return fd, offset, count
+        return None
+
+    def can_sendfile(self, source):
+        """Return True when SOURCE can go to the client with os.sendfile().
+
+        Only regular files written to a plain TCP socket qualify; in-memory
+        bodies and wrapped (e.g. TLS) sockets use the copy loop instead.
+
+        """
+        if not self.use_sendfile or not hasattr(os, "sendfile"):
+            return False
+        if (
+            type(getattr(self, "connection", None)) is not socket.socket
+            and not hasattr(getattr(self, "wfile", None), "send_file_later")
+        ):
+            return False
+        if isinstance(source, SharedFile):
+            return True
+        try:
+            return stat.S_ISREG(os.fstat(source.fileno()).st_mode)
+        except (AttributeError, OSError, ValueError):
+            return False
 
     def guess_type(self, path):
         """Guess the type of a file.
@@ -1546,21 +3229,510 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         '.h': 'text/plain',
         })
 
-try:
-    # Python 2.x
-    from SocketServer import ThreadingMixIn
-    from http.server import HTTPServer
-except ImportError:
-    # Python 3.x
-    from socketserver import ThreadingMixIn
-    from http.server import HTTPServer
+class BaseSimpleServer(HTTPServer):
+    """Listening socket and bookkeeping shared by both serving engines."""
+
+    engine = "threads"
+    max_threads = 64
+    worker_processes = 1
+    max_requests_per_worker = None
+    shutdown_poll_interval = 0.5
+    log_level = logging.INFO
 
-class ThreadingSimpleServer(ThreadingMixIn, HTTPServer):
     def __init__(self, server_address, request_handler_class, bind_and_activate=True):
         super().__init__(server_address, request_handler_class, bind_and_activate)
         self.started_at = time.monotonic()
         bound_interface, bound_port = self.server_address[:2]
         self.connection_urls = build_connection_urls(bound_interface, bound_port)
+        self.request_count_lock = threading.Lock()
+        self.requests_handled = 0
+        self.recycle_after = None
+
+    def handle_error(self, request, client_address):
+        logger.exception("Error while handling a request from %s", client_address)
+
+    def record_request(self):
+        """Count a served request and stop serving once a forked worker is due for recycling."""
+        if not self.recycle_after:
+            return
+        with self.request_count_lock:
+            self.requests_handled += 1
+            recycle = self.requests_handled == self.recycle_after
+        if recycle:
+            threading.Thread(target=self.shutdown, daemon=True).start()
+
+
+class ThreadingSimpleServer(BaseSimpleServer):
+    """HTTP server that hands connections to a bounded, autoscaling thread pool.
+
+    Accepted connections wait in a queue of at most queue_size entries.
+    Worker threads start on demand up to max_threads and retire after
+    thread_idle_timeout seconds without work, down to min_threads.  When
+    the queue is full the connection is answered with an immediate 503.
+
+    Between requests, keep-alive connections are parked on a selector
+    watched by one thread instead of holding a worker, so idle browsers
+    cannot starve new clients.  A parked connection goes back into the
+    queue when its next request arrives and is closed once it has been
+    idle for keep_alive_timeout.
+
+    """
+
+    daemon_threads = False
+    block_on_close = True
+    min_threads = 4
+    queue_size = 128
+    thread_idle_timeout = 60
+    retry_after_seconds = 1
+    parks_idle_connections = True
+
+    def __init__(self, server_address, request_handler_class, bind_and_activate=True):
+        super().__init__(server_address, request_handler_class, bind_and_activate)
+        # Only process_request() checks the bound, so the queue itself stays
+        # unbounded for resumed connections and the shutdown sentinels.
+        self.connection_queue = queue.Queue()
+        self.pool_lock = threading.Lock()
+        self.worker_threads = set()
+        self.idle_threads = 0
+        self.queued_connections = 0
+        self.rejected_connections = 0
+        # Handlers parked by workers, registered by the idle watcher thread.
+        self.idle_lock = threading.Lock()
+        self.idle_pending = []
+        self.idle_watcher = None
+        self.idle_closing = False
+        self.parked_connections = 0
+        self.idle_wakeup = self.idle_waker = None
+
+    def process_request(self, request, client_address):
+        # Only new connections count against the bound; resumed idle
+        # connections were already accepted.
+        with self.pool_lock:
+            accept = self.queued_connections < self.queue_size
+            if accept:
+                self.queued_connections += 1
+        if not accept:
+            self.reject_request(request)
+            return
+        self.dispatch((request, client_address))
+
+    def dispatch(self, item):
+        """Queue a new connection or a resumed handler and grow the pool if needed."""
+        self.connection_queue.put(item)
+        with self.pool_lock:
+            if self.idle_threads < self.connection_queue.qsize() and len(self.worker_threads) < self.max_threads:
+                worker = threading.Thread(target=self.process_queue, name="simple-server-worker")
+                worker.daemon = self.daemon_threads
+                self.worker_threads.add(worker)
+                worker.start()
+
+    def process_queue(self):
+        worker = threading.current_thread()
+        while True:
+            with self.pool_lock:
+                self.idle_threads += 1
+            try:
+                item = self.connection_queue.get(timeout=self.thread_idle_timeout)
+            except queue.Empty:
+                item = False
+            with self.pool_lock:
+                self.idle_threads -= 1
+                retire = item is None or (item is False and len(self.worker_threads) > self.min_threads)
+                if retire:
+                    self.worker_threads.discard(worker)
+                    return
+                if isinstance(item, tuple):
+                    self.queued_connections -= 1
+            if item is False:
+                continue
+            if isinstance(item, tuple):
+                handler = None
+                request, client_address = item
+            else:
+                handler = item
+                request, client_address = handler.request, handler.client_address
+            try:
+                if handler is None:
+                    handler = self.finish_request(request, client_address)
+                else:
+                    handler.resume()
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                if handler is not None and handler.park_requested:
+                    self.park_connection(handler)
+                else:
+                    self.shutdown_request(request)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def park_connection(self, handler):
+        """Watch an idle keep-alive connection without holding a worker thread."""
+        deadline = time.monotonic() + handler.keep_alive_timeout
+        with self.idle_lock:
+            closing = self.idle_closing
+            if not closing:
+                self.idle_pending.append((handler, deadline))
+                if self.idle_watcher is None:
+                    # Made on first use, after a pre-fork worker has forked,
+                    # so worker processes never share a wakeup channel.
+                    self.idle_wakeup, self.idle_waker = socket.socketpair()
+                    self.idle_wakeup.setblocking(False)
+                    self.idle_waker.setblocking(False)
+                    self.idle_watcher = threading.Thread(
+                        target=self.watch_idle_connections, name="simple-server-idle", daemon=True,
+                    )
+                    self.idle_watcher.start()
+        if closing:
+            self.close_parked(handler)
+            return
+        self.wake_idle_watcher()
+
+    def wake_idle_watcher(self):
+        try:
+            self.idle_waker.send(b"\0")
+        except OSError:
+            # A full wakeup buffer already guarantees a wakeup.
+            pass
+
+    def watch_idle_connections(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.idle_wakeup, selectors.EVENT_READ)
+        # Deadlines live in a heap; entries for handlers that were resumed
+        # or parked again since are skipped when they surface.
+        parked = {}
+        deadlines = []
+        order = itertools.count()
+        try:
+            while True:
+                with self.idle_lock:
+                    pending, self.idle_pending = self.idle_pending, []
+                    closing = self.idle_closing
+                for handler, deadline in pending:
+                    try:
+                        selector.register(handler.connection, selectors.EVENT_READ, handler)
+                    except (OSError, ValueError):
+                        self.close_parked(handler)
+                        continue
+                    parked[handler] = deadline
+                    heapq.heappush(deadlines, (deadline, next(order), handler))
+                if closing:
+                    return
+                now = time.monotonic()
+                while deadlines and (deadlines[0][0] <= now or parked.get(deadlines[0][2]) != deadlines[0][0]):
+                    deadline, _, handler = heapq.heappop(deadlines)
+                    if parked.get(handler) == deadline:
+                        del parked[handler]
+                        selector.unregister(handler.connection)
+                        self.close_parked(handler)
+                with self.idle_lock:
+                    self.parked_connections = len(parked)
+                timeout = deadlines[0][0] - now if deadlines else None
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is self.idle_wakeup:
+                        try:
+                            while self.idle_wakeup.recv(4096):
+                                pass
+                        except OSError:
+                            pass
+                        continue
+                    handler = key.data
+                    selector.unregister(handler.connection)
+                    del parked[handler]
+                    self.dispatch(handler)
+        finally:
+            for handler in parked:
+                self.close_parked(handler)
+            selector.close()
+
+    def close_parked(self, handler):
+        handler.park_requested = False
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        self.shutdown_request(handler.request)
+
+    def reject_request(self, request):
+        with self.pool_lock:
+            self.rejected_connections += 1
+        body = b"Server busy, please retry shortly.\n"
+        response = (
+            "HTTP/1.1 503 Service Unavailable\r\n"
+            "Retry-After: %d\r\n"
+            "Content-Type: text/plain; charset=utf-8\r\n"
+            "Content-Length: %d\r\n"
+            "Connection: close\r\n\r\n" % (self.retry_after_seconds, len(body))
+        ).encode("ascii") + body
+        try:
+            request.setblocking(False)
+            request.send(response)
+            # Drain whatever the client already sent so closing the socket
+            # does not reset the connection before the 503 is read.
+            request.recv(65536)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def connections_waiting(self):
+        return self.queued_connections > 0
+
+    def pool_stats(self):
+        with self.pool_lock:
+            return {
+                "threads": len(self.worker_threads),
+                "idle_threads": self.idle_threads,
+                "min_threads": self.min_threads,
+                "max_threads": self.max_threads,
+                "queue_depth": self.connection_queue.qsize(),
+                "queue_size": self.queue_size,
+                "rejected": self.rejected_connections,
+                "idle_connections": self.parked_connections,
+            }
+
+    def server_close(self):
+        super().server_close()
+        # Parked connections are closed before the sentinels go in, so no
+        # resumed connection is queued behind them.
+        with self.idle_lock:
+            self.idle_closing = True
+            watcher = self.idle_watcher
+        if watcher is not None:
+            self.wake_idle_watcher()
+            watcher.join()
+            self.idle_wakeup.close()
+            self.idle_waker.close()
+        # Sentinels queue up behind connections that were already accepted,
+        # so those are still served before the workers exit.
+        with self.pool_lock:
+            workers = list(self.worker_threads)
+        for _ in workers:
+            self.connection_queue.put(None)
+        if self.block_on_close and not self.daemon_threads:
+            for worker in workers:
+                worker.join()
+
+
+class LoopReader:
+    """Buffered request reader that handler threads fill from an asyncio stream.
+
+    The same buffer carries over between requests on a connection, so bytes a
+    client pipelined after one body become the start of the next request.
+
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, loop, reader):
+        self.loop = loop
+        self.reader = reader
+        self.buffer = bytearray()
+
+    async def fill(self):
+        chunk = await self.reader.read(self.chunk_size)
+        self.buffer += chunk
+        return bool(chunk)
+
+    async def wait_for_head(self, limit):
+        """Buffer one complete request head; False on EOF or an oversized head."""
+        while self.buffer.find(b"\r\n\r\n") < 0:
+            if len(self.buffer) > limit or not await self.fill():
+                return False
+        return True
+
+    def fill_from_thread(self):
+        return asyncio.run_coroutine_threadsafe(self.fill(), self.loop).result()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while self.fill_from_thread():
+                pass
+            size = len(self.buffer)
+        while len(self.buffer) < size and self.fill_from_thread():
+            pass
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readline(self, size=-1):
+        while True:
+            end = self.buffer.find(b"\n") + 1
+            if end:
+                break
+            if 0 <= size <= len(self.buffer) or not self.fill_from_thread():
+                end = len(self.buffer)
+                break
+        if 0 <= size < end:
+            end = size
+        data = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return data
+
+
+class LoopWriter:
+    """Response writer that handler threads use to send through an asyncio stream.
+
+    Writes are sent right away with backpressure, so generated responses
+    stream as before.  File bodies are queued with send_file_later() and
+    everything after them is held back until the loop replays the queue.
+
+    """
+
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.pending = []
+
+    async def send(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def write(self, data):
+        if self.pending:
+            self.pending.append(bytes(data))
+        else:
+            asyncio.run_coroutine_threadsafe(self.send(data), self.loop).result()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def send_file_later(self, source, count, drop_pages=False):
+        self.pending.append((os.dup(source.fileno()), source.tell(), count, drop_pages))
+
+
+class AsyncSimpleServer(BaseSimpleServer):
+    """Serve the request handler's routes from a single asyncio event loop.
+
+    Connections wait for their next request head on the loop, so idle
+    keep-alive clients and slow downloads do not hold a thread.  Each request
+    is routed by the handler in an executor thread, where stat, listing and
+    archive work may block, and file bodies go out through loop.sendfile().
+
+    """
+
+    max_head_size = 64 * 1024
+
+    def __init__(self, server_address, request_handler_class, bind_and_activate=True):
+        super().__init__(server_address, request_handler_class, bind_and_activate)
+        self.loop = None
+        self.stop_requested = False
+        self.is_shut_down = threading.Event()
+        self.is_shut_down.set()
+        self.connections = {}
+        self.busy_threads = 0
+
+    def serve_forever(self, poll_interval=0.5):
+        self.is_shut_down.clear()
+        try:
+            asyncio.run(self.serve_async())
+        finally:
+            self.is_shut_down.set()
+
+    def shutdown(self):
+        self.stop_requested = True
+        loop = self.loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self.stopped.set)
+        self.is_shut_down.wait()
+
+    async def serve_async(self):
+        self.stopped = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        if self.stop_requested:
+            return
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            self.max_threads,
+            thread_name_prefix="simple-server-io",
+        )
+        listener = await asyncio.start_server(self.handle_connection, sock=self.socket)
+        try:
+            await self.stopped.wait()
+        finally:
+            listener.close()
+            for task, idle in list(self.connections.items()):
+                if idle:
+                    task.cancel()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            self.executor.shutdown(wait=True)
+            self.loop = None
+
+    def pool_stats(self):
+        return {
+            "engine": "asyncio",
+            "connections": len(self.connections),
+            "busy_threads": self.busy_threads,
+            "max_threads": self.max_threads,
+        }
+
+    def connections_waiting(self):
+        return False
+
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        handler_class = self.RequestHandlerClass
+        handler = handler_class.__new__(handler_class)
+        handler.server = self
+        handler.request = handler.connection = None
+        handler.client_address = writer.get_extra_info("peername")
+        handler.requests_remaining = handler.max_keep_alive_requests
+        rfile = LoopReader(self.loop, reader)
+        try:
+            while not self.stop_requested:
+                # Only connections that already served a request are cut off
+                # while idle at shutdown; a new one still gets its first answer.
+                self.connections[task] = handler.requests_remaining < handler.max_keep_alive_requests
+                try:
+                    has_head = await asyncio.wait_for(
+                        rfile.wait_for_head(self.max_head_size),
+                        handler.keep_alive_timeout,
+                    )
+                except (asyncio.TimeoutError, ConnectionError):
+                    break
+                if not has_head:
+                    break
+                self.connections[task] = False
+                if not await self.handle_request_async(handler, rfile, writer):
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+
+    async def handle_request_async(self, handler, rfile, writer):
+        handler.close_connection = True
+        handler.rfile = rfile
+        handler.wfile = wfile = LoopWriter(self.loop, writer)
+        self.busy_threads += 1
+        try:
+            await self.loop.run_in_executor(self.executor, handler.handle_one_request)
+            while wfile.pending:
+                item = wfile.pending.pop(0)
+                if isinstance(item, tuple):
+                    fd, offset, count, drop_pages = item
+                    with open(fd, "rb") as source:
+                        await self.loop.sendfile(writer.transport, source, offset, count)
+                        if drop_pages:
+                            drop_cached_pages(fd, offset, count or 0)
+                else:
+                    writer.write(item)
+            await writer.drain()
+        except ConnectionError:
+            return False
+        except Exception:
+            self.handle_error(None, handler.client_address)
+            return False
+        finally:
+            self.busy_threads -= 1
+            for item in wfile.pending:
+                if isinstance(item, tuple):
+                    os.close(item[0])
+        handler.requests_remaining -= 1
+        self.record_request()
+        return not handler.close_connection
+
 
 REGISTRY_DIR = os.path.join(os.path.expanduser("~"), ".simple-server")
 REGISTRY_PATH = os.path.join(REGISTRY_DIR, "servers.json")
@@ -1602,12 +3774,12 @@ def list_servers():
     if not active:
         print("No running servers found.")
         return
-    print("PID\tADDRESS\tPORT\tSTARTED\tCWD")
+    print("PID\tADDRESS\tPORT\tWORKERS\tSTARTED\tCWD")
     for entry in active:
         started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.get("started_at", 0)))
         print(
             f"{entry.get('pid')}\t{entry.get('interface')}\t{entry.get('port')}\t"
-            f"{started}\t{entry.get('cwd')}"
+            f"{entry.get('workers', 1)}\t{started}\t{entry.get('cwd')}"
         )
 
 
@@ -1627,12 +3799,13 @@ def list_servers_porcelain():
         print(f"{entry.get('port')}\t{entry.get('cwd')}")
 
 
-def register_server(interface, port, cwd):
+def register_server(interface, port, cwd, workers=1):
     entry = {
         "pid": os.getpid(),
         "interface": interface,
         "port": port,
         "cwd": cwd,
+        "workers": workers,
         "started_at": time.time(),
     }
     entries = load_registry()
@@ -1653,6 +3826,229 @@ def handle_exit(signum, frame):
     raise KeyboardInterrupt
 
 
+def share_handler_state(handler_class):
+    """Move session and share state into a manager process shared by forked workers.
+
+    Login sessions and share links are created by whichever worker handles
+    the request, so every worker reads and writes the same dictionaries
+    through proxies instead of its own class-level copies.
+
+    """
+    manager = multiprocessing.managers.SyncManager(ctx=multiprocessing.get_context("fork"))
+    manager.start(signal.signal, (signal.SIGINT, signal.SIG_IGN))
+    handler_class.session_store = manager.dict(handler_class.session_store)
+    handler_class.session_lock = manager.Lock()
+    handler_class.share_store = manager.dict(handler_class.share_store)
+    handler_class.share_lock = manager.Lock()
+    return manager
+
+
+def run_worker(server):
+    """Serve from the inherited listening socket in a forked child; never returns."""
+    exit_code = 0
+    # The inherited queue has no listener thread in this process.
+    log_listener = configure_logging(logger.level)
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(
+            signal.SIGTERM,
+            lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start(),
+        )
+        server.recycle_after = server.max_requests_per_worker
+        server.serve_forever(server.shutdown_poll_interval)
+        server.server_close()
+    except BaseException:
+        logger.exception("Worker process %s failed", os.getpid())
+        exit_code = 1
+    finally:
+        log_listener.stop()
+        os._exit(exit_code)
+
+
+def supervise_workers(server, workers, stop_timeout=10):
+    """Fork WORKERS children sharing SERVER's socket and restart any that exit."""
+    # Workers share one non-blocking listening socket; whichever loses the
+    # race for a connection just returns to its selector.
+    server.socket.settimeout(0)
+    manager = share_handler_state(server.RequestHandlerClass)
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            run_worker(server)
+        children.add(pid)
+
+    try:
+        for _ in range(workers):
+            spawn()
+        while True:
+            time.sleep(server.shutdown_poll_interval)
+            for pid in list(children):
+                exited, status = os.waitpid(pid, os.WNOHANG)
+                if exited:
+                    # A worker only exits cleanly after max_requests_per_worker.
+                    if os.waitstatus_to_exitcode(status) == 0:
+                        logger.info("Worker process %s recycled; starting a replacement", pid)
+                    else:
+                        logger.warning("Worker process %s exited; starting a replacement", pid)
+                    children.discard(pid)
+                    spawn()
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        deadline = time.monotonic() + stop_timeout
+        while children and time.monotonic() < deadline:
+            for pid in list(children):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    children.discard(pid)
+            time.sleep(0.05)
+        for pid in children:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        manager.shutdown()
+
+
+def positive_int(value):
+    number = int(value)
+    if number <= 0:
+        raise ValueError("must be positive")
+    return number
+
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise ValueError("must not be negative")
+    return number
+
+
+def compression_level(value):
+    number = int(value)
+    if not 0 <= number <= 9:
+        raise ValueError("must be between 0 and 9")
+    return number
+
+
+def positive_float(value):
+    number = float(value)
+    if not number > 0:
+        raise ValueError("must be positive")
+    return number
+
+
+SERVER_ENGINES = {
+    "threads": ThreadingSimpleServer,
+    "asyncio": AsyncSimpleServer,
+}
+
+
+def engine_name(value):
+    if value not in SERVER_ENGINES:
+        raise ValueError("unknown engine")
+    return value
+
+
+def megabytes(value):
+    number = float(value)
+    if number < 0:
+        raise ValueError("must not be negative")
+    return int(number * 1024 * 1024)
+
+
+def encoding_list(value):
+    if value.lower() == "off":
+        return ()
+    codings = tuple(item.strip().lower() for item in value.split(","))
+    if any(coding not in PRECOMPRESSED_SUFFIXES for coding in codings):
+        raise ValueError("unknown coding")
+    return codings
+
+
+def log_level(value):
+    if value.lower() not in LOG_LEVELS:
+        raise ValueError("unknown log level")
+    return LOG_LEVELS[value.lower()]
+
+
+# Tuning options take one value and set an attribute on their target.
+SERVER_OPTIONS = {
+    "--keep-alive-timeout": (SimpleHTTPRequestHandler, "keep_alive_timeout", positive_float),
+    "--max-keep-alive-requests": (SimpleHTTPRequestHandler, "max_keep_alive_requests", positive_int),
+    "--engine": (BaseSimpleServer, "engine", engine_name),
+    "--threads": (BaseSimpleServer, "max_threads", positive_int),
+    "--min-threads": (ThreadingSimpleServer, "min_threads", positive_int),
+    "--queue-size": (ThreadingSimpleServer, "queue_size", positive_int),
+    "--workers": (BaseSimpleServer, "worker_processes", positive_int),
+    "--max-requests-per-worker": (BaseSimpleServer, "max_requests_per_worker", positive_int),
+    "--poll-interval": (BaseSimpleServer, "shutdown_poll_interval", positive_float),
+    "--log-level": (BaseSimpleServer, "log_level", log_level),
+    "--listing-page-size": (SimpleHTTPRequestHandler, "listing_page_size", positive_int),
+    "--listing-cache-size": (SimpleHTTPRequestHandler.listing_cache, "max_bytes", megabytes),
+    "--precompressed": (SimpleHTTPRequestHandler, "precompressed_encodings", encoding_list),
+    "--gzip-level": (SimpleHTTPRequestHandler, "gzip_level", compression_level),
+    "--gzip-min-size": (SimpleHTTPRequestHandler, "gzip_min_size", non_negative_int),
+    "--gzip-cache-size": (SimpleHTTPRequestHandler.gzip_cache, "max_bytes", megabytes),
+    "--small-file-cache-size": (SimpleHTTPRequestHandler.small_file_cache, "max_bytes", megabytes),
+    "--small-file-max-size": (SimpleHTTPRequestHandler, "small_file_max_size", non_negative_int),
+    "--max-ranges": (SimpleHTTPRequestHandler, "max_byte_ranges", positive_int),
+    "--zip-level": (SimpleHTTPRequestHandler, "zip_level", compression_level),
+    "--zip-workers": (SimpleHTTPRequestHandler.zip_pool, "workers", positive_int),
+    "--archive-cache": (SimpleHTTPRequestHandler.archive_cache, "directory", os.path.abspath),
+    "--archive-cache-size": (SimpleHTTPRequestHandler.archive_cache, "max_bytes", megabytes),
+    "--readahead": (SimpleHTTPRequestHandler, "readahead_max", megabytes),
+    "--drop-cache-min-size": (SimpleHTTPRequestHandler, "drop_cache_min_size", megabytes),
+    "--upload-session-ttl": (SimpleHTTPRequestHandler, "upload_session_ttl", positive_float),
+    "--open-file-cache": (SimpleHTTPRequestHandler.open_file_cache, "max_fds", non_negative_int),
+    "--open-file-cache-valid": (SimpleHTTPRequestHandler.open_file_cache, "valid_for", positive_float),
+}
+
+
+def parse_server_options(argv):
+    options = {}
+    remaining = []
+    index = 0
+    while index < len(argv):
+        arg = argv[index]
+        if arg not in SERVER_OPTIONS:
+            remaining.append(arg)
+            index += 1
+            continue
+        if index + 1 >= len(argv):
+            raise ValueError("Missing value for %s option." % arg)
+        convert = SERVER_OPTIONS[arg][2]
+        try:
+            options[arg] = convert(argv[index + 1])
+        except ValueError:
+            raise ValueError("Invalid value for %s option: %s" % (arg, argv[index + 1]))
+        index += 2
+    return remaining, options
+
+
+def apply_server_options(options):
+    for arg, value in options.items():
+        target, attribute, _ = SERVER_OPTIONS[arg]
+        setattr(target, attribute, value)
+
+
+def check_archive_cache(cache, served_root):
+    """Refuse an archive cache inside SERVED_ROOT.
+
+    Its files would be listed, served and swept into the very archives it
+    caches, changing their fingerprints on every download.
+
+    """
+    if not cache.directory:
+        return
+    served_root = os.path.realpath(served_root)
+    cache_root = os.path.realpath(cache.directory)
+    if cache_root == served_root or cache_root.startswith(served_root.rstrip(os.sep) + os.sep):
+        raise ValueError("--archive-cache must be outside the served directory.")
+
+
 def parse_args(argv):
     password = None
     local_only = False
@@ -1694,7 +4090,8 @@ def resolve_bind_address(args, local_only=False):
     return interface, port
 
 
-args, server_password, local_only = parse_args(sys.argv[1:])
+server_argv, server_options = parse_server_options(sys.argv[1:])
+args, server_password, local_only = parse_args(server_argv)
 
 if args and args[0] == "list":
     if len(args) > 1 and args[1] == "--porcelain":
@@ -1709,24 +4106,40 @@ if len(args) > 1:
     os.chdir(args[1])
 
 SimpleHTTPRequestHandler.server_password = server_password
+apply_server_options(server_options)
 
 
 def run_server():
-    server = ThreadingSimpleServer((interface, port), SimpleHTTPRequestHandler)
+    workers = BaseSimpleServer.worker_processes
+    if workers > 1 and not hasattr(os, "fork"):
+        raise SystemExit("--workers requires os.fork(), which is not available on this platform.")
+    try:
+        check_archive_cache(SimpleHTTPRequestHandler.archive_cache, os.getcwd())
+    except ValueError as error:
+        raise SystemExit(str(error))
+    server_class = SERVER_ENGINES[BaseSimpleServer.engine]
+    server = server_class((interface, port), SimpleHTTPRequestHandler)
+    log_listener = configure_logging(BaseSimpleServer.log_level)
+    atexit.register(log_listener.stop)
     actual_port = server.server_address[1]
-    register_server(interface, actual_port, os.getcwd())
+    register_server(interface, actual_port, os.getcwd(), workers)
     atexit.register(deregister_server)
     signal.signal(signal.SIGINT, handle_exit)
     signal.signal(signal.SIGTERM, handle_exit)
     print('Started HTTP server on ' + interface + ':' + str(actual_port))
+    print('Serving engine: ' + BaseSimpleServer.engine)
+    if workers > 1:
+        print('Worker processes: ' + str(workers))
     print('Available connections:')
     for url in server.connection_urls:
         print('  ' + url)
     print('Connection page: ' + server.connection_urls[0] + '__connect__')
+    sys.stdout.flush()
     try:
-        while 1:
-            sys.stdout.flush()
-            server.handle_request()
+        if workers > 1:
+            supervise_workers(server, workers)
+        else:
+            server.serve_forever(server.shutdown_poll_interval)
     except KeyboardInterrupt:
         deregister_server()
         print('Finished.')
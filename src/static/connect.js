@@ -0,0 +1 @@
+(function(){function fallbackCopy(value){var input=document.createElement('textarea');input.value=value;input.setAttribute('readonly','');input.style.position='fixed';input.style.opacity='0';document.body.appendChild(input);input.select();var copied=document.execCommand('copy');document.body.removeChild(input);return copied?Promise.resolve():Promise.reject();}document.querySelectorAll('.copy-button').forEach(function(button){button.addEventListener('click',function(){var status=button.parentElement.querySelector('.copy-status');var value=button.getAttribute('data-url');var action=navigator.clipboard&&navigator.clipboard.writeText?navigator.clipboard.writeText(value):fallbackCopy(value);action.then(function(){status.textContent='Copied to clipboard.';button.textContent='Copied';}).catch(function(){status.textContent='Copy failed. Select the URL above.';});});});})();
@@ -0,0 +1,76 @@
+(function(){
+var button=document.getElementById('theme-toggle');
+var root=document.documentElement;
+function applyLabel(){
+if(!button){return;}
+var theme=root.getAttribute('data-theme')||'dark';
+button.textContent=theme==='dark'?'Light mode':'Dark mode';
+}
+if(button){
+button.addEventListener('click',function(){
+var next=(root.getAttribute('data-theme')==='dark')?'light':'dark';
+root.setAttribute('data-theme',next);
+localStorage.setItem('simple-server-theme',next);
+applyLabel();
+});
+}
+applyLabel();
+var uploadForm=document.getElementById('upload-form');
+var uploadInput=document.getElementById('upload-input');
+var uploadSubmit=document.getElementById('upload-submit');
+var dropzone=document.getElementById('upload-dropzone');
+var queue=document.getElementById('upload-queue');
+var refresh=document.getElementById('refresh-list');
+if(uploadForm){
+var chunkSize=8*1024*1024;
+function encodeMetadata(value){return btoa(unescape(encodeURIComponent(value)));}
+function uploadFile(file){
+var item=document.createElement('li');item.className='upload-item';
+var name=document.createElement('span');name.className='upload-name';name.textContent=file.name;
+var progress=document.createElement('progress');progress.className='upload-progress';progress.max=100;progress.value=0;
+var state=document.createElement('span');state.className='upload-state';state.textContent='Starting…';
+var cancel=document.createElement('button');cancel.type='button';cancel.className='cancel-upload';cancel.textContent='Cancel';
+item.appendChild(name);item.appendChild(progress);item.appendChild(state);item.appendChild(cancel);queue.appendChild(item);
+var key='simple-server-upload:'+file.name+':'+file.size+':'+file.lastModified;
+var url=localStorage.getItem(key);var xhr=null;var cancelled=false;var retries=0;
+function setProgress(sent){var percent=file.size?Math.round((sent/file.size)*100):100;progress.value=percent;state.textContent=percent<100?percent+'%':'Processing…';}
+function finish(ok,message){cancel.disabled=true;xhr=null;if(ok){localStorage.removeItem(key);progress.value=100;item.classList.add('success');state.textContent='Complete';cancel.textContent='Done';refresh.hidden=false;return;}item.classList.add('failed');cancel.textContent='Failed';state.textContent=message;}
+function failMessage(request){try{return JSON.parse(request.responseText).message||'Upload failed';}catch(error){return 'Upload failed ('+request.status+')';}}
+function send(method,target,headers,body,onload,onprogress){var request=xhr=new XMLHttpRequest();request.open(method,target,true);request.setRequestHeader('Tus-Resumable','1.0.0');Object.keys(headers).forEach(function(name){request.setRequestHeader(name,headers[name]);});if(onprogress){request.upload.addEventListener('progress',onprogress);}request.addEventListener('load',function(){onload(request);});request.addEventListener('error',retry);request.send(body);}
+function retry(){if(cancelled){return;}if(retries>=5){finish(false,'Network error');return;}retries+=1;state.textContent='Connection lost, retrying…';setTimeout(resume,1000*Math.pow(2,retries));}
+function create(){send('POST','/__uploads__',{'Upload-Length':String(file.size),'Upload-Metadata':'filename '+encodeMetadata(file.name)},null,function(request){if(request.status!==201){finish(false,failMessage(request));return;}url=request.getResponseHeader('Location');localStorage.setItem(key,url);if(file.size===0){finish(true);return;}patch(0);});}
+function resume(){if(cancelled){return;}if(!url){create();return;}send('HEAD',url,{},null,function(request){if(request.status!==200){localStorage.removeItem(key);url=null;create();return;}patch(Number(request.getResponseHeader('Upload-Offset')));});}
+function patch(offset){var end=Math.min(offset+chunkSize,file.size);send('PATCH',url,{'Content-Type':'application/offset+octet-stream','Upload-Offset':String(offset)},file.slice(offset,end),function(request){if(request.status===204){retries=0;var next=Number(request.getResponseHeader('Upload-Offset'));setProgress(next);if(next>=file.size){finish(true);return;}patch(next);return;}if(request.status===409||request.status>500){retry();return;}finish(false,failMessage(request));},function(event){setProgress(offset+event.loaded);});}
+cancel.addEventListener('click',function(){cancelled=true;if(xhr){xhr.abort();}cancel.disabled=true;cancel.textContent='Cancelled';item.classList.add('cancelled');state.textContent='Cancelled';localStorage.removeItem(key);if(url){var request=new XMLHttpRequest();request.open('DELETE',url,true);request.setRequestHeader('Tus-Resumable','1.0.0');request.send();}});
+resume();
+}
+function uploadFiles(files){Array.prototype.forEach.call(files,uploadFile);}
+uploadSubmit.hidden=true;
+uploadInput.addEventListener('change',function(){uploadFiles(uploadInput.files);uploadInput.value='';});
+uploadForm.addEventListener('submit',function(event){event.preventDefault();uploadFiles(uploadInput.files);uploadInput.value='';});
+['dragenter','dragover'].forEach(function(type){dropzone.addEventListener(type,function(event){event.preventDefault();dropzone.classList.add('dragover');});});
+['dragleave','drop'].forEach(function(type){dropzone.addEventListener(type,function(event){event.preventDefault();dropzone.classList.remove('dragover');});});
+dropzone.addEventListener('drop',function(event){uploadFiles(event.dataTransfer.files);});
+dropzone.addEventListener('keydown',function(event){if(event.key==='Enter'||event.key===' '){event.preventDefault();uploadInput.click();}});
+refresh.addEventListener('click',function(){window.location.reload();});
+}
+var shareResult=document.getElementById('share-result');
+if(shareResult){
+var shareExpiry=document.getElementById('share-expiry');
+var shareLink=document.getElementById('share-link');
+var shareStatus=document.getElementById('share-status');
+var copyShare=document.getElementById('copy-share');
+Array.prototype.forEach.call(document.querySelectorAll('.share-button'),function(control){
+control.addEventListener('click',function(){control.disabled=true;shareStatus.textContent='Creating link…';fetch('/__share__',{method:'POST',credentials:'same-origin',headers:{'Content-Type':'application/json'},body:JSON.stringify({path:control.dataset.scope,expires_in:Number(shareExpiry.value)})}).then(function(response){return response.json().then(function(data){if(!response.ok){throw new Error(data.message||'Could not create link');}return data;});}).then(function(data){shareLink.value=window.location.origin+data.url;shareResult.hidden=false;shareStatus.textContent='Expires '+new Date(data.expires_at*1000).toLocaleString();shareLink.select();}).catch(function(error){shareResult.hidden=false;shareLink.value='';shareStatus.textContent=error.message;}).then(function(){control.disabled=false;});});
+});
+function fallbackCopy(){shareLink.select();document.execCommand('copy');shareStatus.textContent='Link copied';}
+copyShare.addEventListener('click',function(){if(!shareLink.value){return;}if(navigator.clipboard&&window.isSecureContext){navigator.clipboard.writeText(shareLink.value).then(function(){shareStatus.textContent='Link copied';}).catch(fallbackCopy);return;}fallbackCopy();});
+}
+var downloadSelected=document.getElementById('download-selected');
+if(downloadSelected){
+var selectBoxes=document.querySelectorAll('.select-entry input');
+function updateSelection(){var count=0;Array.prototype.forEach.call(selectBoxes,function(box){if(box.checked){count+=1;}});downloadSelected.disabled=count===0;downloadSelected.textContent=count?'Download selected ('+count+')':'Download selected';}
+Array.prototype.forEach.call(selectBoxes,function(box){box.addEventListener('change',updateSelection);});
+updateSelection();
+}
+})();
@@ -0,0 +1,5 @@
+(function(){
+var stored=localStorage.getItem('simple-server-theme');
+var theme=stored||'dark';
+document.documentElement.setAttribute('data-theme', theme);
+})();
@@ -1,5 +1,7 @@
+import os
 from pathlib import Path
 import sys
+import tempfile
 import unittest
 
 
@@ -88,6 +90,66 @@ class CommandLineTests(unittest.TestCase):
             ("192.0.2.10", 9002),
         )
 
+    def test_tuning_options_are_split_from_positional_arguments(self):
+        remaining, options = simpleserver.parse_server_options(
+            ["9000", "--keep-alive-timeout", "2.5", "--local", "--max-keep-alive-requests", "10"],
+        )
+
+        self.assertEqual(remaining, ["9000", "--local"])
+        self.assertEqual(
+            options,
+            {"--keep-alive-timeout": 2.5, "--max-keep-alive-requests": 10},
+        )
+
+    def test_logging_options_accept_named_levels_and_poll_interval(self):
+        remaining, options = simpleserver.parse_server_options(
+            ["--log-level", "OFF", "--poll-interval", "0.1"],
+        )
+
+        self.assertEqual(remaining, [])
+        self.assertEqual(options["--poll-interval"], 0.1)
+        self.assertGreater(options["--log-level"], simpleserver.logging.CRITICAL)
+
+    def test_precompressed_option_takes_codings_or_off(self):
+        _, options = simpleserver.parse_server_options(["--precompressed", "GZIP"])
+        self.assertEqual(options["--precompressed"], ("gzip",))
+        _, options = simpleserver.parse_server_options(["--precompressed", "off"])
+        self.assertEqual(options["--precompressed"], ())
+
+    def test_archive_cache_must_be_outside_the_served_directory(self):
+        with tempfile.TemporaryDirectory() as served, tempfile.TemporaryDirectory() as elsewhere:
+            simpleserver.check_archive_cache(simpleserver.ArchiveCache(), served)
+            simpleserver.check_archive_cache(simpleserver.ArchiveCache(elsewhere), served)
+            simpleserver.check_archive_cache(simpleserver.ArchiveCache(served + "-cache"), served)
+            for directory in (served, os.path.join(served, "cache")):
+                with self.subTest(directory=directory):
+                    with self.assertRaises(ValueError):
+                        simpleserver.check_archive_cache(simpleserver.ArchiveCache(directory), served)
+
+    def test_tuning_options_reject_missing_and_invalid_values(self):
+        for argv in (
+            ["--keep-alive-timeout"],
+            ["--max-keep-alive-requests", "0"],
+            ["--log-level", "chatty"],
+            ["--poll-interval", "-1"],
+            ["--precompressed", "gzip,br"],
+            ["--gzip-level", "10"],
+            ["--gzip-min-size", "-1"],
+            ["--open-file-cache", "many"],
+            ["--small-file-cache-size", "-1"],
+            ["--max-ranges", "0"],
+            ["--open-file-cache-valid", "0"],
+            ["--zip-level", "10"],
+            ["--zip-workers", "0"],
+            ["--archive-cache-size", "-5"],
+            ["--readahead", "-1"],
+            ["--drop-cache-min-size", "lots"],
+            ["--upload-session-ttl", "0"],
+        ):
+            with self.subTest(argv=argv):
+                with self.assertRaises(ValueError):
+                    simpleserver.parse_server_options(argv)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,12 +1,21 @@
+import base64
+import gzip
 import http.client
 from io import BytesIO
 import json
 import os
+import re
 from pathlib import Path
+import socket
 import sys
+import tarfile
 import tempfile
 import threading
+import time
 import unittest
+import urllib.parse
+from unittest import mock
+import zipfile
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -26,10 +35,17 @@ class QuietRequestHandler(simpleserver.SimpleHTTPRequestHandler):
         pass
 
 
+class SingleWorkerServer(simpleserver.ThreadingSimpleServer):
+    min_threads = 1
+    max_threads = 1
+    queue_size = 1
+
+
 class LocalServer:
-    def __init__(self, directory, password=None):
+    def __init__(self, directory, password=None, server_class=simpleserver.ThreadingSimpleServer):
         self.directory = directory
         self.password = password
+        self.server_class = server_class
 
     def __enter__(self):
         self.original_cwd = os.getcwd()
@@ -40,7 +56,7 @@ class LocalServer:
             QuietRequestHandler.session_store.clear()
             QuietRequestHandler.share_store.clear()
 
-            self.server = simpleserver.ThreadingSimpleServer(
+            self.server = self.server_class(
                 ("127.0.0.1", 0),
                 QuietRequestHandler,
             )
@@ -83,6 +99,14 @@ def request(server_address, method, path, body=None, headers=None):
         connection.close()
 
 
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition was not met in time")
+        time.sleep(0.01)
+
+
 def multipart_upload(filename, content):
     boundary = "simple-server-test-boundary"
     body = (
@@ -131,6 +155,150 @@ class HttpResponseSmokeTests(unittest.TestCase):
         self.assertNotIn("secret-token", messages[0])
         self.assertIn("/__share__/<redacted>/child.txt", messages[0])
 
+    def test_file_bodies_use_sendfile_for_full_and_ranged_responses(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, "body.bin")
+            path.write_bytes(b"0123456789")
+            server_side, client_side = socket.socketpair()
+            try:
+                handler = object.__new__(QuietRequestHandler)
+                handler.connection = server_side
+                handler.wfile = server_side.makefile("wb", buffering=0)
+                with open(path, "rb") as source:
+                    self.assertTrue(handler.can_sendfile(source))
+                    handler._range_remaining = None
+                    handler.copyfile(source, handler.wfile)
+                    source.seek(2)
+                    handler._range_remaining = 4
+                    handler.copyfile(source, handler.wfile)
+                server_side.shutdown(socket.SHUT_WR)
+                received = b""
+                while True:
+                    chunk = client_side.recv(1024)
+                    if not chunk:
+                        break
+                    received += chunk
+            finally:
+                server_side.close()
+                client_side.close()
+
+            self.assertEqual(received, b"0123456789" + b"2345")
+
+    def test_file_bodies_fall_back_to_copy_loop(self):
+        handler = object.__new__(QuietRequestHandler)
+        handler.use_sendfile = False
+        handler.connection = None
+        handler.wfile = BytesIO()
+        self.assertFalse(handler.can_sendfile(BytesIO(b"in memory")))
+
+        source = BytesIO(b"0123456789")
+        source.seek(3)
+        handler._range_remaining = 5
+        handler.copyfile(source, handler.wfile)
+
+        self.assertEqual(handler.wfile.getvalue(), b"34567")
+
+    @unittest.skipUnless(hasattr(os, "posix_fadvise"), "posix_fadvise is not available")
+    def test_large_bodies_get_read_ahead_and_drop_cache_hints(self):
+        handler = object.__new__(QuietRequestHandler)
+        handler.use_sendfile = False
+        handler.connection = None
+        handler.fadvise_min_size = 100
+        handler.readahead_max = 64
+        handler.drop_cache_min_size = 1000
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, "large.bin")
+            path.write_bytes(b"x" * 2000)
+            with open(path, "rb") as source, \
+                    mock.patch.object(simpleserver.os, "posix_fadvise") as fadvise:
+                fd = source.fileno()
+                for offset, count in ((10, 50), (10, 500), (0, None)):
+                    with self.subTest(offset=offset, count=count):
+                        fadvise.reset_mock()
+                        handler.wfile = BytesIO()
+                        source.seek(offset)
+                        handler._range_remaining = count
+                        handler.copyfile(source, handler.wfile)
+                        hints = [call.args for call in fadvise.call_args_list]
+                        if count == 50:
+                            # Small bodies go out without hints.
+                            self.assertEqual(hints, [])
+                        elif count == 500:
+                            self.assertEqual(hints, [
+                                (fd, 10, 500, os.POSIX_FADV_SEQUENTIAL),
+                                (fd, 10, 64, os.POSIX_FADV_WILLNEED),
+                            ])
+                        else:
+                            self.assertEqual(hints, [
+                                (fd, 0, 2000, os.POSIX_FADV_SEQUENTIAL),
+                                (fd, 0, 64, os.POSIX_FADV_WILLNEED),
+                                (fd, 0, 2000, os.POSIX_FADV_DONTNEED),
+                            ])
+                        self.assertEqual(len(handler.wfile.getvalue()), count or 2000)
+
+                fadvise.reset_mock()
+                handler.readahead_max = 0
+                handler.drop_cache_min_size = 0
+                source.seek(0)
+                handler.copyfile(source, BytesIO())
+                fadvise.assert_not_called()
+
+    def test_access_log_reports_file_transfer_mode(self):
+        handler = object.__new__(simpleserver.SimpleHTTPRequestHandler)
+        handler.requestline = "GET /video.mp4 HTTP/1.1"
+        handler.transfer_mode = "sendfile"
+        messages = []
+        handler.log_message = lambda message, *args: messages.append(message % args)
+
+        handler.log_request(200)
+        handler.log_request(404)
+
+        self.assertTrue(messages[0].endswith(" sendfile"))
+        self.assertNotIn("sendfile", messages[1])
+
+    def test_access_log_tags_gzip_responses_only(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "a.txt").write_bytes(b"gzip me " * 1000)
+            messages = []
+
+            def log_message(handler, message, *args):
+                messages.append(message % args)
+
+            with mock.patch.object(QuietRequestHandler, "log_message", log_message):
+                with LocalServer(directory) as address:
+                    connection = http.client.HTTPConnection(*address, timeout=5)
+                    try:
+                        for path in ("/a.txt", "/healthz"):
+                            connection.request("GET", path, headers={"Accept-Encoding": "gzip"})
+                            connection.getresponse().read()
+                    finally:
+                        connection.close()
+
+            self.assertEqual(len(messages), 2)
+            self.assertTrue(messages[0].startswith('"GET /a.txt HTTP/1.1" 200'))
+            self.assertTrue(messages[0].endswith(" gzip"))
+            self.assertTrue(messages[1].startswith('"GET /healthz HTTP/1.1" 200'))
+            self.assertNotIn("gzip", messages[1])
+
+    def test_access_log_goes_through_the_leveled_logger(self):
+        handler = object.__new__(simpleserver.SimpleHTTPRequestHandler)
+        handler.client_address = ("192.0.2.1", 1234)
+        handler.requestline = "GET /notes.txt HTTP/1.1"
+        original_level = simpleserver.logger.level
+        try:
+            with self.assertLogs(simpleserver.logger, "INFO") as captured:
+                handler.log_request(200, 5)
+            self.assertIn('"GET /notes.txt HTTP/1.1" 200 5', captured.output[0])
+
+            simpleserver.logger.setLevel(simpleserver.LOG_LEVELS["off"])
+            records = []
+            handler.address_string = lambda: records.append("formatted") or "192.0.2.1"
+            handler.log_request(200, 5)
+            handler.log_error("code %d", 500)
+            self.assertEqual(records, [])
+        finally:
+            simpleserver.logger.setLevel(original_level)
+
     def test_incomplete_upload_is_rejected_before_writing_a_file(self):
         body, headers = multipart_upload(
             "cancelled.txt",
@@ -153,6 +321,38 @@ class HttpResponseSmokeTests(unittest.TestCase):
             self.assertEqual(message, "Upload cancelled or incomplete.")
             self.assertFalse(Path(directory, "cancelled.txt").exists())
 
+    def test_rejected_upload_leaves_no_partial_files(self):
+        boundary = "simple-server-test-boundary"
+        body = b""
+        for filename in ("good.txt", "../escape.txt"):
+            body += (
+                "--%s\r\n"
+                "Content-Disposition: form-data; name=\"file\"; filename=\"%s\"\r\n"
+                "\r\n" % (boundary, filename)
+            ).encode("utf-8") + b"content\r\n"
+        body += ("--%s--\r\n" % boundary).encode("ascii")
+        handler = object.__new__(QuietRequestHandler)
+        handler.headers = {
+            "Content-Type": "multipart/form-data; boundary=%s" % boundary,
+            "Content-Length": str(len(body)),
+        }
+        handler.rfile = BytesIO(body)
+        handler.close_connection = False
+
+        with tempfile.TemporaryDirectory() as directory:
+            original_cwd = os.getcwd()
+            try:
+                os.chdir(directory)
+                result, message = handler.deal_post_data()
+            finally:
+                os.chdir(original_cwd)
+
+            self.assertFalse(result)
+            self.assertIn("invalid filename", message)
+            self.assertEqual(os.listdir(directory), [])
+            self.assertEqual(handler.rfile.read(), b"")
+            self.assertFalse(handler.close_connection)
+
     def test_health_endpoint_returns_json_for_get_and_head(self):
         with tempfile.TemporaryDirectory() as directory:
             with LocalServer(directory, password="test-secret") as address:
@@ -174,6 +374,68 @@ class HttpResponseSmokeTests(unittest.TestCase):
                 self.assertGreater(int(headers["Content-Length"]), 0)
                 self.assertEqual(body, b"")
 
+    def test_full_connection_queue_is_rejected_with_retry_after(self):
+        with tempfile.TemporaryDirectory() as directory:
+            local_server = LocalServer(directory, server_class=SingleWorkerServer)
+            with local_server as address:
+                server = local_server.server
+                busy = socket.create_connection(address, timeout=5)
+                queued = None
+                try:
+                    wait_until(lambda: server.pool_stats()["threads"] == 1
+                               and server.pool_stats()["idle_threads"] == 0)
+                    queued = socket.create_connection(address, timeout=5)
+                    wait_until(lambda: server.pool_stats()["queue_depth"] == 1)
+
+                    with socket.create_connection(address, timeout=5) as rejected:
+                        response = b""
+                        while True:
+                            chunk = rejected.recv(4096)
+                            if not chunk:
+                                break
+                            response += chunk
+                finally:
+                    busy.close()
+                    if queued is not None:
+                        queued.close()
+
+                self.assertTrue(response.startswith(b"HTTP/1.1 503 "))
+                self.assertIn(b"Retry-After: 1\r\n", response)
+                wait_until(lambda: server.pool_stats()["idle_threads"] == 1)
+                status, headers, body = request(address, "GET", "/healthz")
+                pool = json.loads(body)["pool"]
+                self.assertEqual(status, 200)
+                self.assertEqual(pool["rejected"], 1)
+                self.assertEqual(pool["max_threads"], 1)
+                self.assertEqual(pool["queue_size"], 1)
+
+    def test_idle_keep_alive_connections_do_not_hold_worker_threads(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "hello.txt").write_bytes(b"hello")
+            local_server = LocalServer(directory, server_class=SingleWorkerServer)
+            with mock.patch.object(QuietRequestHandler, "keep_alive_timeout", 30), local_server as address:
+                server = local_server.server
+                idle = http.client.HTTPConnection(*address, timeout=5)
+                try:
+                    idle.request("GET", "/hello.txt")
+                    self.assertEqual(idle.getresponse().read(), b"hello")
+                    idle_socket = idle.sock
+                    wait_until(lambda: server.pool_stats()["idle_connections"] == 1)
+
+                    # The only worker thread is free for another client.
+                    started = time.monotonic()
+                    status, headers, body = request(address, "GET", "/hello.txt")
+                    self.assertEqual((status, body), (200, b"hello"))
+                    self.assertLess(time.monotonic() - started, 2)
+
+                    idle.request("GET", "/hello.txt")
+                    self.assertEqual(idle.getresponse().read(), b"hello")
+                    self.assertIs(idle.sock, idle_socket)
+                    wait_until(lambda: server.pool_stats()["idle_connections"] == 1)
+                finally:
+                    idle.close()
+                wait_until(lambda: server.pool_stats()["idle_connections"] == 0)
+
     def test_connection_page_lists_urls_with_inline_qr_codes(self):
         with tempfile.TemporaryDirectory() as directory:
             local_server = LocalServer(directory)
@@ -194,7 +456,10 @@ class HttpResponseSmokeTests(unittest.TestCase):
                 self.assertIn(b"http://192.168.1.50:", body)
                 self.assertEqual(body.count(b'class="qr-code"'), 2)
                 self.assertNotIn(b"Local-only mode", body)
-                self.assertNotIn(b"<script src=", body)
+                # Scripts come from the server itself, so the page works offline.
+                self.assertNotIn(b"<script>", body)
+                for source in re.findall(rb'<script src="([^"]+)"', body):
+                    self.assertTrue(source.startswith(b"/__static__/"))
 
                 status, headers, body = request(address, "HEAD", "/__connect__")
                 self.assertEqual(status, 200)
@@ -240,6 +505,65 @@ class HttpResponseSmokeTests(unittest.TestCase):
                 self.assertEqual(headers.get_content_type(), "text/plain")
                 self.assertEqual(headers["Content-Length"], str(len(content)))
 
+    def test_idle_keep_alive_connections_close_without_warnings(self):
+        def wait_for_close(connection):
+            while connection.recv(65536):
+                pass
+
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "hello.txt").write_bytes(b"hello")
+            with mock.patch.object(QuietRequestHandler, "keep_alive_timeout", 0.2), \
+                    LocalServer(directory) as address:
+                with self.assertNoLogs("simpleserver", "WARNING"):
+                    with socket.create_connection(address, timeout=5) as idle:
+                        wait_for_close(idle)
+                    with socket.create_connection(address, timeout=5) as served:
+                        served.sendall(b"GET /hello.txt HTTP/1.1\r\nHost: localhost\r\n\r\n")
+                        wait_for_close(served)
+
+                with self.assertLogs("simpleserver", "WARNING") as logs:
+                    with socket.create_connection(address, timeout=5) as stalled:
+                        stalled.sendall(b"GET /hello.txt HT")
+                        wait_for_close(stalled)
+                self.assertIn("Request timed out", logs.output[0])
+
+    def test_keep_alive_reuses_one_connection_until_the_request_cap(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "hello.txt").write_bytes(b"hello")
+            Path(directory, "folder").mkdir()
+            original_cap = QuietRequestHandler.max_keep_alive_requests
+            original_timeout = QuietRequestHandler.keep_alive_timeout
+            QuietRequestHandler.max_keep_alive_requests = 4
+            QuietRequestHandler.keep_alive_timeout = 2.5
+            try:
+                with LocalServer(directory) as address:
+                    connection = http.client.HTTPConnection(*address, timeout=5)
+                    try:
+                        responses = []
+                        sockets = []
+                        for path in ("/", "/missing.txt", "/folder", "/hello.txt"):
+                            connection.request("GET", path)
+                            sockets.append(connection.sock)
+                            response = connection.getresponse()
+                            responses.append((response.status, response.headers, response.read()))
+                        self.assertIsNone(connection.sock)
+                    finally:
+                        connection.close()
+            finally:
+                QuietRequestHandler.max_keep_alive_requests = original_cap
+                QuietRequestHandler.keep_alive_timeout = original_timeout
+
+            self.assertEqual(len(set(map(id, sockets))), 1)
+            self.assertEqual([status for status, _, _ in responses], [200, 404, 301, 200])
+            # Every body is delimited, either by length or by chunked framing.
+            self.assertEqual(responses[0][1]["Transfer-Encoding"], "chunked")
+            for status, headers, body in responses[1:]:
+                self.assertEqual(headers["Content-Length"], str(len(body)))
+            self.assertEqual(responses[1][1]["Keep-Alive"], "timeout=3, max=2")
+            self.assertEqual(responses[2][1]["Location"], "/folder/")
+            self.assertEqual(responses[3][1]["Connection"], "close")
+            self.assertEqual(responses[3][2], b"hello")
+
     def test_static_file_range_responses(self):
         content = b"0123456789"
         with tempfile.TemporaryDirectory() as directory:
@@ -315,6 +639,212 @@ class HttpResponseSmokeTests(unittest.TestCase):
                 self.assertEqual(status, 200)
                 self.assertEqual(body, content)
 
+    def test_precompressed_sidecars_are_negotiated(self):
+        content = b'{"rows": [' + b'"value", ' * 500 + b'"end"]}'
+        encoded = gzip.compress(content, mtime=0)
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "data.json").write_bytes(content)
+            Path(directory, "data.json.gz").write_bytes(encoded)
+            Path(directory, "data.json.zst").write_bytes(b"zstd frame")
+            Path(directory, "stale.txt.gz").write_bytes(gzip.compress(b"old"))
+            time.sleep(0.01)
+            Path(directory, "stale.txt").write_bytes(b"new")
+
+            with LocalServer(directory) as address:
+                status, plain_headers, body = request(address, "GET", "/data.json")
+                self.assertEqual((status, body), (200, content))
+                self.assertIsNone(plain_headers["Content-Encoding"])
+                self.assertEqual(plain_headers["Vary"], "Accept-Encoding")
+
+                status, headers, body = request(
+                    address, "GET", "/data.json", headers={"Accept-Encoding": "gzip, deflate"},
+                )
+                self.assertEqual((status, body), (200, encoded))
+                self.assertEqual(headers["Content-Encoding"], "gzip")
+                self.assertEqual(headers["Content-Type"], "application/json")
+                self.assertEqual(headers["Vary"], "Accept-Encoding")
+                self.assertEqual(headers["Content-Length"], str(len(encoded)))
+                gzip_etag = headers["ETag"]
+                self.assertTrue(gzip_etag.endswith('-gzip"'))
+                self.assertNotEqual(gzip_etag, plain_headers["ETag"])
+
+                status, headers, body = request(
+                    address, "GET", "/data.json", headers={"Accept-Encoding": "gzip;q=0.5, zstd"},
+                )
+                self.assertEqual((headers["Content-Encoding"], body), ("zstd", b"zstd frame"))
+                status, headers, body = request(
+                    address, "GET", "/data.json", headers={"Accept-Encoding": "gzip, zstd;q=0"},
+                )
+                self.assertEqual(headers["Content-Encoding"], "gzip")
+
+                status, headers, body = request(
+                    address, "GET", "/data.json",
+                    headers={"Accept-Encoding": "gzip", "Range": "bytes=10-19", "If-Range": gzip_etag},
+                )
+                self.assertEqual((status, body), (206, encoded[10:20]))
+                self.assertEqual(headers["Content-Range"], "bytes 10-19/%d" % len(encoded))
+                status, headers, body = request(
+                    address, "GET", "/data.json",
+                    headers={"Accept-Encoding": "gzip", "Range": "bytes=10-19", "If-Range": plain_headers["ETag"]},
+                )
+                self.assertEqual((status, body), (200, encoded))
+
+                status, _, body = request(
+                    address, "GET", "/data.json",
+                    headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag},
+                )
+                self.assertEqual((status, body), (304, b""))
+                status, _, body = request(
+                    address, "GET", "/data.json",
+                    headers={"Accept-Encoding": "identity", "If-None-Match": gzip_etag},
+                )
+                self.assertEqual((status, body), (200, content))
+
+                status, headers, body = request(
+                    address, "GET", "/stale.txt", headers={"Accept-Encoding": "gzip"},
+                )
+                self.assertEqual(body, b"new")
+                self.assertIsNone(headers["Content-Encoding"])
+                self.assertIsNone(headers["Vary"])
+
+                # A sidecar requested by name is an ordinary file.
+                status, headers, body = request(
+                    address, "GET", "/data.json.gz", headers={"Accept-Encoding": "gzip"},
+                )
+                self.assertEqual(body, encoded)
+                self.assertIsNone(headers["Content-Encoding"])
+
+    def test_text_files_and_listings_are_gzipped_on_the_fly(self):
+        content = "\n".join("line %d of a compressible log" % index for index in range(2000)).encode("ascii")
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "app.log.txt").write_bytes(content)
+            Path(directory, "photo.jpg").write_bytes(b"\xff\xd8" + os.urandom(4096))
+            Path(directory, "small.txt").write_bytes(b"tiny")
+            accept = {"Accept-Encoding": "gzip"}
+
+            with LocalServer(directory) as address:
+                status, headers, body = request(address, "GET", "/app.log.txt", headers=accept)
+                self.assertEqual(status, 200)
+                self.assertEqual(headers["Content-Encoding"], "gzip")
+                self.assertEqual(headers["Transfer-Encoding"], "chunked")
+                self.assertEqual(headers["Vary"], "Accept-Encoding")
+                self.assertEqual(gzip.decompress(body), content)
+                self.assertLess(len(body), len(content) // 4)
+                etag = headers["ETag"]
+                self.assertTrue(etag.endswith('-gzip"'))
+
+                # The second request is answered from the compressed cache,
+                # so it has a length and honours ranges.
+                status, headers, cached = request(address, "GET", "/app.log.txt", headers=accept)
+                self.assertEqual((status, cached), (200, body))
+                self.assertEqual(headers["Content-Length"], str(len(body)))
+                status, headers, part = request(
+                    address, "GET", "/app.log.txt", headers=dict(accept, Range="bytes=0-9", **{"If-Range": etag}),
+                )
+                self.assertEqual((status, part), (206, body[:10]))
+                self.assertEqual(headers["Content-Encoding"], "gzip")
+                status, _, _ = request(address, "GET", "/app.log.txt", headers=dict(accept, **{"If-None-Match": etag}))
+                self.assertEqual(status, 304)
+
+                status, headers, plain = request(address, "GET", "/app.log.txt")
+                self.assertEqual(plain, content)
+                self.assertIsNone(headers["Content-Encoding"])
+                self.assertEqual(headers["Vary"], "Accept-Encoding")
+
+                for name in ("/photo.jpg", "/small.txt"):
+                    with self.subTest(name=name):
+                        status, headers, _ = request(address, "GET", name, headers=accept)
+                        self.assertEqual(status, 200)
+                        self.assertIsNone(headers["Content-Encoding"])
+                        self.assertIsNone(headers["Vary"])
+
+                status, headers, body = request(address, "GET", "/", headers=accept)
+                self.assertEqual(headers["Content-Encoding"], "gzip")
+                self.assertIn(b"app.log.txt", gzip.decompress(body))
+                status, headers, body = request(address, "GET", "/?format=json", headers=accept)
+                self.assertEqual(headers["Content-Encoding"], "gzip")
+                self.assertEqual(len(json.loads(gzip.decompress(body))["entries"]), 3)
+
+                _, _, health = request(address, "GET", "/healthz")
+                self.assertGreaterEqual(json.loads(health)["caches"]["gzip"]["hits"], 2)
+
+    def test_gzip_responses_over_the_entry_limit_are_not_cached(self):
+        content = os.urandom(8192).hex().encode("ascii")
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "big.txt").write_bytes(content)
+            accept = {"Accept-Encoding": "gzip"}
+            cache = simpleserver.ByteBudgetCache(1024 * 1024)
+            with mock.patch.object(QuietRequestHandler, "gzip_cache", cache), \
+                    mock.patch.object(QuietRequestHandler, "gzip_cache_max_entry_size", 1024), \
+                    LocalServer(directory) as address:
+                for _ in range(2):
+                    status, headers, body = request(address, "GET", "/big.txt", headers=accept)
+                    self.assertEqual(status, 200)
+                    self.assertEqual(headers["Transfer-Encoding"], "chunked")
+                    self.assertEqual(gzip.decompress(body), content)
+                self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_multiple_ranges_are_sent_as_multipart_byteranges(self):
+        content = bytes(range(256)) * 40
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "doc.pdf").write_bytes(content)
+
+            for server_class in (simpleserver.ThreadingSimpleServer, simpleserver.AsyncSimpleServer):
+                with self.subTest(engine=server_class.__name__):
+                    with LocalServer(directory, server_class=server_class) as address:
+                        status, headers, body = request(
+                            address, "GET", "/doc.pdf",
+                            headers={"Range": "bytes=9000-9099, 0-9, 5-19, 20-29, -16"},
+                        )
+                        self.assertEqual(status, 206)
+                        self.assertEqual(headers["Content-Length"], str(len(body)))
+                        boundary = re.fullmatch(
+                            r"multipart/byteranges; boundary=(\w+)", headers["Content-Type"],
+                        ).group(1).encode("ascii")
+                        self.assertTrue(body.endswith(b"\r\n--" + boundary + b"--\r\n"))
+                        parts = body.split(b"\r\n--" + boundary)[1:-1]
+                        received = []
+                        for part in parts:
+                            head, _, data = part.partition(b"\r\n\r\n")
+                            self.assertIn(b"Content-Type: application/pdf", head)
+                            first, last = map(int, re.search(rb"Content-Range: bytes (\d+)-(\d+)/10240", head).groups())
+                            self.assertEqual(data, content[first:last + 1])
+                            received.append((first, last))
+                        # Overlapping and adjacent ranges are merged and sorted.
+                        self.assertEqual(received, [(0, 29), (9000, 9099), (10224, 10239)])
+
+                        status, headers, body = request(
+                            address, "HEAD", "/doc.pdf", headers={"Range": "bytes=0-0,2-2"},
+                        )
+                        self.assertEqual((status, body), (206, b""))
+                        self.assertTrue(headers["Content-Type"].startswith("multipart/byteranges"))
+
+                        status, headers, body = request(
+                            address, "GET", "/doc.pdf", headers={"Range": "bytes=0-9,10-19"},
+                        )
+                        self.assertEqual((status, body), (206, content[:20]))
+                        self.assertEqual(headers["Content-Range"], "bytes 0-19/10240")
+
+                        too_many = ",".join("%d-%d" % (index * 10, index * 10) for index in range(100))
+                        status, headers, body = request(address, "GET", "/doc.pdf", headers={"Range": "bytes=" + too_many})
+                        self.assertEqual((status, body), (200, content))
+
+                        status, _, _ = request(address, "GET", "/doc.pdf", headers={"Range": "bytes=20000-,30000-"})
+                        self.assertEqual(status, 416)
+
+    def test_byte_range_parsing(self):
+        parse = simpleserver.parse_byte_ranges
+        self.assertEqual(parse("bytes=0-4", 10), [(0, 4)])
+        self.assertEqual(parse("bytes=8-, -3, 0-0, 1-1", 10), [(0, 1), (7, 9)])
+        self.assertEqual(parse("bytes=2-50, 100-200", 10), [(2, 9)])
+        self.assertIsNone(parse("items=0-4", 10))
+        self.assertIsNone(parse("bytes=0-0, 2-2, 4-4", 10, max_ranges=2))
+        self.assertEqual(parse("bytes=0-0, 1-1, 2-2", 10, max_ranges=1), [(0, 2)])
+        for value in ("bytes=5-2", "bytes=abc", "bytes=0-1,", "bytes=-0", "bytes=10-"):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse(value, 10)
+
     def test_static_file_cache_revalidation(self):
         content = b"cacheable content"
         with tempfile.TemporaryDirectory() as directory:
@@ -473,6 +1003,594 @@ class HttpResponseSmokeTests(unittest.TestCase):
                 )
                 self.assertEqual(status, 404)
 
+    def test_directory_download_streams_a_zip_without_temporary_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "docs", "nested").mkdir(parents=True)
+            Path(directory, "docs", "readme.txt").write_bytes(b"read me")
+            Path(directory, "docs", "nested", "data.bin").write_bytes(bytes(range(256)) * 64)
+            Path(directory, "docs", "photo.jpg").write_bytes(b"\xff\xd8" * 512)
+
+            with LocalServer(directory) as server_address:
+                connection = http.client.HTTPConnection(*server_address, timeout=5)
+                try:
+                    connection.request("HEAD", "/docs/?download")
+                    response = connection.getresponse()
+                    response.read()
+                    self.assertEqual(response.status, 200)
+                    self.assertEqual(response.headers["Transfer-Encoding"], "chunked")
+
+                    connection.request("GET", "/docs/?download")
+                    response = connection.getresponse()
+                    body = response.read()
+                    self.assertEqual(response.status, 200)
+                    self.assertEqual(response.headers["Content-Type"], "application/zip")
+                    self.assertIn('filename="docs.zip"', response.headers["Content-Disposition"])
+                    self.assertIsNone(response.headers["Content-Length"])
+
+                    # The chunked body ended cleanly, so the connection is reusable.
+                    connection.request("GET", "/docs/readme.txt")
+                    self.assertEqual(connection.getresponse().read(), b"read me")
+                finally:
+                    connection.close()
+
+            with zipfile.ZipFile(BytesIO(body)) as archive:
+                self.assertEqual(
+                    archive.namelist(),
+                    ["docs/", "docs/photo.jpg", "docs/readme.txt", "docs/nested/", "docs/nested/data.bin"],
+                )
+                self.assertEqual(archive.read("docs/nested/data.bin"), bytes(range(256)) * 64)
+                self.assertEqual(archive.getinfo("docs/nested/data.bin").compress_type, zipfile.ZIP_DEFLATED)
+                self.assertEqual(archive.getinfo("docs/photo.jpg").compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(sorted(os.listdir(directory)), ["docs"])
+
+    def test_directory_download_as_tar_and_tar_gz(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "docs", "nested").mkdir(parents=True)
+            Path(directory, "docs", "readme.txt").write_bytes(b"read me")
+            Path(directory, "docs", "nested", "data.bin").write_bytes(bytes(range(256)) * 64)
+            os.symlink("../readme.txt", os.path.join(directory, "docs", "nested", "readme-link"))
+            os.mkfifo(os.path.join(directory, "docs", "pipe"))
+
+            with LocalServer(directory) as address:
+                status, _, page = request(address, "GET", "/docs/")
+                self.assertEqual(status, 200)
+                self.assertIn(b'<option value="tar.gz">', page)
+
+                for archive_format, mode, content_type in (
+                    ("tar", "r:", "application/x-tar"),
+                    ("tar.gz", "r:gz", "application/gzip"),
+                ):
+                    with self.subTest(archive_format=archive_format):
+                        status, headers, body = request(
+                            address, "GET", "/docs/?download=" + archive_format,
+                        )
+                        self.assertEqual(status, 200)
+                        self.assertEqual(headers["Content-Type"], content_type)
+                        self.assertEqual(headers["Transfer-Encoding"], "chunked")
+                        self.assertIn('filename="docs.%s"' % archive_format, headers["Content-Disposition"])
+                        with tarfile.open(fileobj=BytesIO(body), mode=mode) as archive:
+                            self.assertEqual(
+                                archive.getnames(),
+                                ["docs", "docs/nested", "docs/readme.txt",
+                                 "docs/nested/data.bin", "docs/nested/readme-link"],
+                            )
+                            self.assertEqual(archive.extractfile("docs/nested/data.bin").read(), bytes(range(256)) * 64)
+                            self.assertEqual(archive.getmember("docs/nested/readme-link").linkname, "../readme.txt")
+
+                status, headers, body = request(address, "GET", "/docs/?download=zip")
+                self.assertEqual(headers["Content-Type"], "application/zip")
+                status, _, _ = request(address, "GET", "/docs/?download=rar")
+                self.assertEqual(status, 400)
+
+    def test_selected_entries_download_as_one_archive(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "docs", "nested").mkdir(parents=True)
+            Path(directory, "docs", "a.txt").write_bytes(b"a")
+            Path(directory, "docs", "b.txt").write_bytes(b"b")
+            Path(directory, "docs", "nested", "c.txt").write_bytes(b"c")
+            Path(directory, "secret.txt").write_bytes(b"secret")
+            form_headers = {"Content-Type": "application/x-www-form-urlencoded"}
+
+            def post(fields, headers=form_headers):
+                body = urllib.parse.urlencode(fields).encode("ascii")
+                return request(address, "POST", "/__download__", body=body, headers=headers)
+
+            with LocalServer(directory) as address:
+                page = request(address, "GET", "/docs/")[2]
+                self.assertIn(b'<input type="checkbox" name="path" value="a.txt" form="download-form"', page)
+                self.assertIn(b'formaction="/__download__"', page)
+
+                selection = [("dir", "/docs/"), ("path", "a.txt"), ("path", "nested"), ("download", "zip")]
+                status, headers, body = post(selection)
+                self.assertEqual(status, 200)
+                self.assertIn('filename="docs-selection.zip"', headers["Content-Disposition"])
+                with zipfile.ZipFile(BytesIO(body)) as archive:
+                    self.assertEqual(archive.namelist(), ["docs/a.txt", "docs/nested/", "docs/nested/c.txt"])
+
+                selection[-1] = ("download", "tar.gz")
+                status, headers, body = post(selection)
+                self.assertEqual(headers["Content-Type"], "application/gzip")
+                with tarfile.open(fileobj=BytesIO(body), mode="r:gz") as archive:
+                    self.assertEqual(archive.getnames(), ["docs/a.txt", "docs/nested", "docs/nested/c.txt"])
+
+                for fields, expected in (
+                    ([("dir", "/docs/"), ("path", "../secret.txt")], 400),
+                    ([("dir", "/docs/"), ("path", "..%2Fsecret.txt")], 400),
+                    ([("dir", "/docs/"), ("path", "missing.txt")], 404),
+                    ([("dir", "/docs/")], 400),
+                    ([("dir", "/docs/"), ("path", "a.txt"), ("download", "rar")], 400),
+                    ([("dir", "/nowhere/"), ("path", "a.txt")], 404),
+                ):
+                    with self.subTest(fields=fields):
+                        self.assertEqual(post(fields)[0], expected)
+                status, _, _ = post(selection, headers={"Content-Type": "application/json"})
+                self.assertEqual(status, 415)
+
+    def test_directory_archives_are_cached_by_tree_fingerprint(self):
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as cache_dir:
+            Path(directory, "release", "bin").mkdir(parents=True)
+            Path(directory, "release", "notes.txt").write_bytes(b"release notes " * 100)
+            Path(directory, "release", "bin", "tool").write_bytes(os.urandom(50000))
+            cache = simpleserver.ArchiveCache(cache_dir, max_bytes=10 * 1024 * 1024)
+
+            with mock.patch.object(QuietRequestHandler, "archive_cache", cache), \
+                    LocalServer(directory) as address:
+                status, headers, built = request(address, "GET", "/release/?download")
+                self.assertEqual(status, 200)
+                self.assertEqual(headers["Transfer-Encoding"], "chunked")
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+                status, headers, cached = request(address, "GET", "/release/?download")
+                self.assertEqual(status, 200)
+                self.assertEqual(cached, built)
+                self.assertEqual(headers["Content-Length"], str(len(built)))
+                self.assertEqual(headers["Content-Type"], "application/zip")
+                self.assertIn('filename="release.zip"', headers["Content-Disposition"])
+                etag = headers["ETag"]
+                self.assertFalse(etag.startswith("W/"))
+
+                status, headers, part = request(
+                    address, "GET", "/release/?download",
+                    headers={"Range": "bytes=100-", "If-Range": etag},
+                )
+                self.assertEqual(status, 206)
+                self.assertEqual(part, built[100:])
+                status, _, _ = request(address, "GET", "/release/?download", headers={"If-None-Match": etag})
+                self.assertEqual(status, 304)
+
+                # Any change to the tree misses and builds a new archive.
+                Path(directory, "release", "notes.txt").write_bytes(b"new notes")
+                status, headers, rebuilt = request(address, "GET", "/release/?download")
+                self.assertEqual(headers["Transfer-Encoding"], "chunked")
+                with zipfile.ZipFile(BytesIO(rebuilt)) as archive:
+                    self.assertEqual(archive.read("release/notes.txt"), b"new notes")
+                self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+                # Over budget, the least recently used archive goes first.
+                cache.max_bytes = len(rebuilt) + 1000
+                Path(directory, "release", "extra.txt").write_bytes(b"extra")
+                request(address, "GET", "/release/?download")
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+                stats = request(address, "GET", "/healthz")[2]
+                self.assertEqual(json.loads(stats)["caches"]["archives"]["hits"], 3)
+            self.assertEqual(sorted(os.listdir(directory)), ["release"])
+
+    def test_archive_cache_failures_do_not_break_the_download(self):
+        class FullDisk:
+            def write(self, data):
+                raise OSError(28, "No space left on device")
+
+            def close(self):
+                pass
+
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as cache_dir:
+            Path(directory, "docs").mkdir()
+            Path(directory, "docs", "readme.txt").write_bytes(b"read me")
+            cache = simpleserver.ArchiveCache(cache_dir)
+            partial_path = os.path.join(cache_dir, ".part-full")
+            Path(partial_path).write_bytes(b"")
+
+            with mock.patch.object(QuietRequestHandler, "archive_cache", cache), \
+                    mock.patch.object(cache, "create", return_value=(FullDisk(), partial_path)), \
+                    LocalServer(directory) as address:
+                status, headers, body = request(address, "GET", "/docs/?download")
+            self.assertEqual(status, 200)
+            with zipfile.ZipFile(BytesIO(body)) as archive:
+                self.assertEqual(archive.read("docs/readme.txt"), b"read me")
+            self.assertEqual(os.listdir(cache_dir), [])
+
+    def test_uncached_zip_download_starts_before_the_tree_is_walked(self):
+        events = []
+        os_walk = os.walk
+        end_headers = QuietRequestHandler.end_headers
+
+        def walk(path):
+            for step in os_walk(path):
+                events.append("directory")
+                yield step
+
+        def headers_sent(handler):
+            events.append("headers")
+            end_headers(handler)
+
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "docs").mkdir()
+            Path(directory, "docs", "readme.txt").write_bytes(b"read me")
+            with mock.patch.object(simpleserver.os, "walk", walk), \
+                    mock.patch.object(QuietRequestHandler, "end_headers", headers_sent), \
+                    LocalServer(directory) as address:
+                status, headers, body = request(address, "GET", "/docs/?download")
+            self.assertEqual(status, 200)
+            self.assertEqual(events, ["headers", "directory"])
+
+    def test_directory_scan_uses_cached_stats_and_case_insensitive_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "beta.txt").write_bytes(b"12345")
+            Path(directory, "Alpha").mkdir()
+            os.symlink("missing-target", os.path.join(directory, "dangling"))
+            os.utime(os.path.join(directory, "beta.txt"), ns=(0, 1_700_000_000_000_000_000))
+
+            with os.scandir(directory) as scanner:
+                entries = simpleserver.select_listing_page(scanner, 10).entries
+
+            self.assertEqual([entry.name for entry in entries], ["Alpha", "beta.txt", "dangling"])
+            alpha, beta, dangling = entries
+            self.assertTrue(alpha.is_dir)
+            self.assertEqual(alpha.size, 0)
+            self.assertEqual((beta.is_dir, beta.size, beta.mtime_ns), (False, 5, 1_700_000_000_000_000_000))
+            self.assertTrue(dangling.is_link)
+
+            with LocalServer(directory) as address:
+                status, headers, body = request(address, "GET", "/")
+            self.assertEqual(status, 200)
+            self.assertIn(
+                ("<time>%s</time>" % simpleserver.format_mtime(beta.mtime_ns)).encode("ascii"),
+                body,
+            )
+            self.assertIn(b"dangling@", body)
+
+    def test_directory_listing_is_cached_and_revalidated_with_etags(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "first.txt").write_bytes(b"1")
+            past = time.time() - 60
+            os.utime(directory, (past, past))
+            cache = simpleserver.ByteBudgetCache(1024 * 1024)
+            original_cache = QuietRequestHandler.listing_cache
+            QuietRequestHandler.listing_cache = cache
+            try:
+                with LocalServer(directory) as address:
+                    status, headers, body = request(address, "GET", "/")
+                    self.assertEqual(status, 200)
+                    etag = headers["ETag"]
+                    self.assertEqual(headers["Cache-Control"], "no-cache")
+
+                    status, headers, cached_body = request(address, "GET", "/")
+                    self.assertEqual(cached_body, body)
+                    self.assertEqual(headers["ETag"], etag)
+
+                    status, headers, body = request(address, "GET", "/", headers={"If-None-Match": etag})
+                    self.assertEqual(status, 304)
+                    self.assertEqual(body, b"")
+
+                    stats = json.loads(request(address, "GET", "/healthz")[2])["caches"]["listing"]
+                    self.assertEqual(stats["hits"], 1)
+                    self.assertEqual(stats["entries"], 1)
+
+                    Path(directory, "second.txt").write_bytes(b"2")
+                    os.utime(directory, (past + 1, past + 1))
+                    status, headers, body = request(address, "GET", "/", headers={"If-None-Match": etag})
+                    self.assertEqual(status, 200)
+                    self.assertNotEqual(headers["ETag"], etag)
+                    self.assertIn(b"second.txt", body)
+
+                    # A directory changed just now may change again within
+                    # its timestamp granularity: no validator, no 304.
+                    Path(directory, "third.txt").write_bytes(b"3")
+                    for accept_encoding in ("identity", "gzip"):
+                        status, headers, body = request(
+                            address,
+                            "GET",
+                            "/",
+                            headers={"If-None-Match": "*", "Accept-Encoding": accept_encoding},
+                        )
+                        self.assertEqual(status, 200)
+                        self.assertNotIn("ETag", headers)
+            finally:
+                QuietRequestHandler.listing_cache = original_cache
+
+    def test_listing_pages_follow_cursors_in_both_directions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("b", "A", "d", "C", "e"):
+                Path(directory, name).write_bytes(name.encode("ascii") * 3)
+
+            def page(**kwargs):
+                with os.scandir(directory) as scanner:
+                    return simpleserver.select_listing_page(scanner, 2, **kwargs)
+
+            first = page()
+            self.assertEqual([entry.name for entry in first.entries], ["A", "b"])
+            self.assertEqual((first.total, first.start), (5, 0))
+            second = page(after=simpleserver.listing_sort_key(first.entries[-1], "name"))
+            self.assertEqual([entry.name for entry in second.entries], ["C", "d"])
+            self.assertEqual(second.start, 2)
+            back = page(before=simpleserver.listing_sort_key(second.entries[0], "name"))
+            self.assertEqual(back, first)
+            last = page(before=("zzz", "zzz"))
+            self.assertEqual(([entry.name for entry in last.entries], last.start), (["d", "e"], 3))
+            filtered = page(match="[A-C]", descending=True)
+            self.assertEqual([entry.name for entry in filtered.entries], ["C", "A"])
+
+    def test_directory_listing_is_paginated_and_streamed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for index in range(5):
+                Path(directory, "file-%d.txt" % index).write_bytes(b"x")
+
+            with LocalServer(directory) as address:
+                status, headers, body = request(address, "GET", "/?limit=2")
+                self.assertEqual(status, 200)
+                self.assertEqual(headers["Transfer-Encoding"], "chunked")
+                self.assertIn(b"file-0.txt", body)
+                self.assertNotIn(b"file-2.txt", body)
+                self.assertIn(b"1&ndash;2 of 5", body)
+                next_link = re.search(rb'href="(\?after=[^"]+)">Next', body).group(1).decode("ascii")
+
+                status, headers, body = request(address, "GET", "/" + next_link)
+                self.assertEqual(status, 200)
+                self.assertIn(b"file-2.txt", body)
+                self.assertNotIn(b"file-1.txt", body)
+                self.assertIn(b">Previous</a>", body)
+
+                for query in ("?limit=0", "?after=bm90LWEtY3Vyc29y"):
+                    with self.subTest(query=query):
+                        self.assertEqual(request(address, "GET", "/" + query)[0], 400)
+
+                original_page_size = QuietRequestHandler.listing_page_size
+                QuietRequestHandler.listing_page_size = 3
+                try:
+                    status, headers, body = request(address, "GET", "/")
+                finally:
+                    QuietRequestHandler.listing_page_size = original_page_size
+                self.assertIn(b"1&ndash;3 of 5", body)
+                self.assertIn(b'href="?after=', body)
+
+    def test_json_listing_sorts_filters_and_pages_with_cursors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "docs").mkdir()
+            for name, size in (("a.txt", 30), ("b.log", 10), ("c.txt", 20), ("d.txt", 40)):
+                Path(directory, "docs", name).write_bytes(b"x" * size)
+            Path(directory, "docs", "sub").mkdir()
+
+            with LocalServer(directory) as address:
+                status, headers, body = request(
+                    address, "GET", "/docs/", headers={"Accept": "application/json"},
+                )
+                self.assertEqual(status, 200)
+                self.assertEqual(headers.get_content_type(), "application/json")
+                self.assertEqual(headers["Vary"], "Accept, Accept-Encoding")
+                listing = json.loads(body)
+                self.assertEqual(listing["path"], "/docs/")
+                self.assertEqual(
+                    [(entry["name"], entry["type"]) for entry in listing["entries"]],
+                    [("a.txt", "file"), ("b.log", "file"), ("c.txt", "file"),
+                     ("d.txt", "file"), ("sub", "directory")],
+                )
+                fs = os.stat(os.path.join(directory, "docs", "a.txt"))
+                self.assertEqual(listing["entries"][0]["size"], 30)
+                self.assertEqual(listing["entries"][0]["mtime_ns"], fs.st_mtime_ns)
+                status, file_headers, _ = request(address, "HEAD", "/docs/a.txt")
+                self.assertEqual(listing["entries"][0]["etag"], file_headers["ETag"])
+
+                status, headers, body = request(
+                    address, "GET", "/docs/?format=json&sort=size&order=desc&glob=*.txt&limit=2",
+                )
+                first = json.loads(body)
+                self.assertEqual([entry["name"] for entry in first["entries"]], ["d.txt", "a.txt"])
+                self.assertEqual((first["total"], first["start"], first["prev_cursor"]), (3, 0, None))
+
+                status, headers, body = request(
+                    address, "GET",
+                    "/docs/?format=json&sort=size&order=desc&glob=*.txt&limit=2&after=" + first["next_cursor"],
+                )
+                second = json.loads(body)
+                self.assertEqual([entry["name"] for entry in second["entries"]], ["c.txt"])
+                self.assertIsNone(second["next_cursor"])
+                self.assertEqual(second["start"], 2)
+
+                for query in ("sort=owner", "order=up", "sort=name&after=" + first["next_cursor"]):
+                    with self.subTest(query=query):
+                        status, _, _ = request(address, "GET", "/docs/?format=json&" + query)
+                        self.assertEqual(status, 400)
+
+                status, headers, body = create_share(address, "/docs/")
+                share_url = json.loads(body)["url"]
+                status, headers, body = request(address, "GET", share_url + "?format=json&sort=mtime")
+                self.assertEqual(status, 200)
+                shared = json.loads(body)
+                self.assertEqual(shared["path"], "/")
+                self.assertEqual(len(shared["entries"]), 5)
+
+    def test_static_assets_are_fingerprinted_immutable_and_precompressed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with LocalServer(directory, password="secret") as address:
+                status, headers, page = request(address, "GET", "/__login__")
+                stylesheet = re.search(rb'<link rel="stylesheet" href="([^"]+)"', page).group(1).decode("ascii")
+                self.assertRegex(stylesheet, r"^/__static__/login\.[0-9a-f]{16}\.css$")
+
+                status, headers, body = request(address, "GET", stylesheet)
+                self.assertEqual(status, 200)
+                self.assertEqual(headers.get_content_type(), "text/css")
+                self.assertEqual(headers["Cache-Control"], "public, max-age=31536000, immutable")
+                self.assertEqual(headers["Vary"], "Accept-Encoding")
+                self.assertIsNone(headers["Content-Encoding"])
+                self.assertIn(b"--primary", body)
+
+                status, gzip_headers, compressed = request(
+                    address, "GET", stylesheet, headers={"Accept-Encoding": "br, gzip;q=0.8"},
+                )
+                self.assertEqual(gzip_headers["Content-Encoding"], "gzip")
+                self.assertEqual(gzip.decompress(compressed), body)
+                self.assertNotEqual(gzip_headers["ETag"], headers["ETag"])
+
+                status, _, body = request(
+                    address, "GET", stylesheet,
+                    headers={"Accept-Encoding": "gzip;q=0", "If-None-Match": headers["ETag"]},
+                )
+                self.assertEqual((status, body), (304, b""))
+                self.assertEqual(request(address, "GET", "/__static__/login.0000000000000000.css")[0], 404)
+
+    def test_byte_budget_cache_evicts_least_recently_used_items(self):
+        cache = simpleserver.ByteBudgetCache(10)
+        cache.put("a", b"aaaa", 4)
+        cache.put("b", b"bbbb", 4)
+        self.assertEqual(cache.get("a"), b"aaaa")
+        cache.put("c", b"cccc", 4)
+        cache.put("huge", b"x" * 11, 11)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNone(cache.get("huge"))
+        self.assertEqual(cache.get("c"), b"cccc")
+        self.assertEqual(cache.stats()["bytes"], 8)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_open_file_cache_shares_descriptors_and_revalidates(self):
+        def describe(path, file_stat):
+            return '"%d"' % file_stat.st_size, "text/plain"
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ("a.txt", "b.txt", "c.txt")]
+            for index, path in enumerate(paths):
+                Path(path).write_bytes(b"0123456789"[:index + 5])
+            cache = simpleserver.OpenFileCache(max_fds=2, valid_for=60)
+
+            first = cache.open(paths[0], describe)
+            second = cache.open(paths[0], describe)
+            self.assertEqual(first.fileno(), second.fileno())
+            self.assertEqual((first.entry.etag, first.entry.content_type), ('"5"', "text/plain"))
+            first.seek(2)
+            self.assertEqual(first.read(2), b"23")
+            self.assertEqual(second.read(), b"01234")
+            second.close()
+
+            # Evicting an entry that is still being read defers the close.
+            cache.open(paths[1], describe).close()
+            cache.open(paths[2], describe).close()
+            self.assertEqual(cache.stats()["evictions"], 1)
+            self.assertEqual(cache.stats()["open_fds"], 2)
+            self.assertEqual(first.read(), b"4")
+            fd = first.fileno()
+            first.close()
+            with self.assertRaises(OSError):
+                os.fstat(fd)
+
+            missing = os.path.join(directory, "missing.txt.gz")
+            for _ in range(2):
+                with self.assertRaises(FileNotFoundError):
+                    cache.stat(missing, describe)
+            with self.assertRaises(OSError):
+                cache.open(directory, describe)
+            self.assertGreaterEqual(cache.stats()["hits"], 2)
+
+            cache.valid_for = 0
+            for _ in range(2):
+                self.assertEqual(cache.stat(paths[2], describe).st_size, 7)
+            self.assertEqual(cache.stats()["revalidations"], 1)
+            os.replace(paths[0], paths[2])
+            self.assertEqual(cache.stat(paths[2], describe).st_size, 5)
+            cache.clear()
+            self.assertEqual(cache.stats()["open_fds"], 0)
+
+    def test_files_are_served_through_the_open_file_cache(self):
+        content = bytes(range(256)) * 64
+        original_cache = QuietRequestHandler.open_file_cache
+        QuietRequestHandler.open_file_cache = simpleserver.OpenFileCache(max_fds=8, valid_for=60)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                Path(directory, "media.bin").write_bytes(content)
+                Path(directory, "page.txt").write_bytes(b"x" * 4096)
+
+                for server_class in (simpleserver.ThreadingSimpleServer, simpleserver.AsyncSimpleServer):
+                    with self.subTest(engine=server_class.__name__):
+                        with LocalServer(directory, server_class=server_class) as address:
+                            for _ in range(2):
+                                status, headers, body = request(address, "GET", "/media.bin")
+                                self.assertEqual((status, body), (200, content))
+                            status, headers, body = request(
+                                address, "GET", "/media.bin", headers={"Range": "bytes=1000-1999"},
+                            )
+                            self.assertEqual((status, body), (206, content[1000:2000]))
+                            status, headers, body = request(
+                                address, "GET", "/page.txt", headers={"Accept-Encoding": "gzip"},
+                            )
+                            self.assertEqual(gzip.decompress(body), b"x" * 4096)
+                            self.assertEqual(request(address, "GET", "/missing.bin")[0], 404)
+                            self.assertEqual(request(address, "GET", "/")[0], 200)
+
+                stats = QuietRequestHandler.open_file_cache.stats()
+                self.assertGreater(stats["hits"], 4)
+                self.assertEqual(stats["open_fds"], 2)
+        finally:
+            QuietRequestHandler.open_file_cache.clear()
+            QuietRequestHandler.open_file_cache = original_cache
+
+    def test_small_files_are_served_from_memory_until_they_change(self):
+        icon = bytes(range(200)) * 3
+        manifest = b'{"name": "app", "icons": []}' * 40
+        written = []
+        original_flush = QuietRequestHandler.flush_headers
+
+        def recording_flush(handler):
+            written.append(b"".join(handler._headers_buffer))
+            original_flush(handler)
+
+        with tempfile.TemporaryDirectory() as directory:
+            icon_path = Path(directory, "favicon.ico")
+            icon_path.write_bytes(icon)
+            Path(directory, "manifest.json").write_bytes(manifest)
+            Path(directory, "fresh.txt").write_bytes(b"just written")
+            for name in ("favicon.ico", "manifest.json"):
+                os.utime(Path(directory, name), (time.time() - 60, time.time() - 60))
+
+            with LocalServer(directory) as address, \
+                    mock.patch.object(QuietRequestHandler, "flush_headers", recording_flush):
+                before = QuietRequestHandler.small_file_cache.stats()
+                for _ in range(3):
+                    status, headers, body = request(address, "GET", "/favicon.ico")
+                    self.assertEqual((status, body), (200, icon))
+                # Headers and body of a cached file leave in a single write.
+                self.assertTrue(written[-1].startswith(b"HTTP/1.1 200"))
+                self.assertTrue(written[-1].endswith(b"\r\n\r\n" + icon))
+                etag = headers["ETag"]
+                status, _, body = request(address, "GET", "/favicon.ico", headers={"If-None-Match": etag})
+                self.assertEqual((status, body), (304, b""))
+                status, headers, body = request(address, "GET", "/favicon.ico", headers={"Range": "bytes=0-9"})
+                self.assertEqual((status, body), (206, icon[:10]))
+
+                after = QuietRequestHandler.small_file_cache.stats()
+                self.assertEqual(after["hits"] - before["hits"], 3)
+
+                # Same size, new content and an older mtime: still not stale.
+                icon_path.write_bytes(icon[::-1])
+                os.utime(icon_path, (time.time() - 30, time.time() - 30))
+                status, headers, body = request(address, "GET", "/favicon.ico")
+                self.assertEqual(body, icon[::-1])
+                self.assertNotEqual(headers["ETag"], etag)
+
+                for _ in range(2):
+                    status, headers, body = request(
+                        address, "GET", "/manifest.json", headers={"Accept-Encoding": "gzip"},
+                    )
+                    self.assertEqual(headers["Content-Encoding"], "gzip")
+                    self.assertEqual(gzip.decompress(body), manifest)
+                for _ in range(2):
+                    status, headers, body = request(address, "GET", "/fresh.txt")
+                    self.assertEqual(body, b"just written")
+
+                _, _, health = request(address, "GET", "/healthz")
+                small_files = json.loads(health)["caches"]["small_files"]
+                self.assertEqual(small_files["hits"] - before["hits"], 3)
+                self.assertEqual(small_files["entries"] - before["entries"], 2)
+                self.assertIn("hit_ratio", small_files)
+
     def test_directory_listing_and_missing_file_responses(self):
         with tempfile.TemporaryDirectory() as directory:
             Path(directory, "visible file.txt").write_text(
@@ -489,13 +1607,19 @@ class HttpResponseSmokeTests(unittest.TestCase):
                 self.assertIn(b"visible%20file.txt", body)
                 self.assertIn(b'id="upload-dropzone"', body)
                 self.assertIn(b'id="upload-input" name="file" type="file" multiple', body)
-                self.assertIn(b"xhr.upload.addEventListener('progress'", body)
-                self.assertIn(b"cancel.addEventListener('click'", body)
-                self.assertIn(b"dropzone.addEventListener('drop'", body)
                 self.assertIn(b'id="share-expiry"', body)
                 self.assertIn(b'class="share-button"', body)
-                self.assertIn(b"fetch('/__share__'", body)
                 self.assertIn(b'href=\'/__connect__\'>Connect devices', body)
+                self.assertNotIn(b"<style>", body)
+                script_url = re.search(rb'<script src="(/__static__/listing\.[0-9a-f]+\.js)"', body).group(1)
+
+                status, headers, script = request(address, "GET", script_url.decode("ascii"))
+                self.assertEqual(status, 200)
+                self.assertIn(b"request.upload.addEventListener('progress'", script)
+                self.assertIn(b"send('PATCH',url", script)
+                self.assertIn(b"cancel.addEventListener('click'", script)
+                self.assertIn(b"dropzone.addEventListener('drop'", script)
+                self.assertIn(b"fetch('/__share__'", script)
 
                 status, headers, body = request(address, "GET", "/missing.txt")
                 self.assertEqual(status, 404)
@@ -633,6 +1757,183 @@ class HttpResponseSmokeTests(unittest.TestCase):
                     b"uploaded safely",
                 )
 
+    def test_resumable_upload_continues_from_the_server_offset(self):
+        content = b"0123456789" * 1000
+        with tempfile.TemporaryDirectory() as directory:
+            with LocalServer(directory) as address:
+                status, headers, body = request(
+                    address,
+                    "POST",
+                    "/__uploads__",
+                    headers={
+                        "Tus-Resumable": "1.0.0",
+                        "Upload-Length": str(len(content)),
+                        "Upload-Metadata": "filename " + base64.b64encode(b"big.bin").decode("ascii"),
+                    },
+                )
+                self.assertEqual(status, 201)
+                self.assertEqual(headers["Tus-Resumable"], "1.0.0")
+                self.assertEqual(headers["Upload-Offset"], "0")
+                self.assertEqual(headers["Upload-Length"], str(len(content)))
+                self.assertIn("Upload-Expires", headers)
+                location = headers["Location"]
+                self.assertTrue(location.startswith("/__uploads__/"))
+
+                # Declare 6000 bytes but drop the connection after 4000.
+                connection = socket.create_connection(address, timeout=5)
+                connection.sendall((
+                    "PATCH %s HTTP/1.1\r\n"
+                    "Host: localhost\r\n"
+                    "Tus-Resumable: 1.0.0\r\n"
+                    "Content-Type: application/offset+octet-stream\r\n"
+                    "Upload-Offset: 0\r\n"
+                    "Content-Length: 6000\r\n"
+                    "\r\n" % location
+                ).encode("ascii") + content[:4000])
+                connection.close()
+
+                def offset():
+                    return request(address, "HEAD", location)[1]["Upload-Offset"]
+
+                wait_until(lambda: offset() == "4000")
+                patch_headers = {
+                    "Tus-Resumable": "1.0.0",
+                    "Content-Type": "application/offset+octet-stream",
+                }
+                status, headers, body = request(
+                    address,
+                    "PATCH",
+                    location,
+                    body=content[:10],
+                    headers=dict(patch_headers, **{"Upload-Offset": "0"}),
+                )
+                self.assertEqual(status, 409)
+                self.assertEqual(headers["Upload-Offset"], "4000")
+                self.assertFalse(Path(directory, "big.bin").exists())
+
+                status, headers, body = request(
+                    address,
+                    "PATCH",
+                    location,
+                    body=content[4000:],
+                    headers=dict(patch_headers, **{"Upload-Offset": "4000"}),
+                )
+                self.assertEqual(status, 204)
+                self.assertEqual(headers["Upload-Offset"], str(len(content)))
+                self.assertEqual(Path(directory, "big.bin").read_bytes(), content)
+                self.assertEqual(request(address, "HEAD", location)[0], 404)
+                self.assertEqual(request(address, "DELETE", location)[0], 404)
+
+                status, headers, body = request(
+                    address,
+                    "POST",
+                    "/__uploads__",
+                    headers={
+                        "Upload-Length": "10",
+                        "Upload-Metadata": "filename " + base64.b64encode(b"../escape.bin").decode("ascii"),
+                    },
+                )
+                self.assertEqual(status, 400)
+
+                status, headers, body = request(
+                    address,
+                    "POST",
+                    "/__uploads__",
+                    headers={
+                        "Upload-Length": "10",
+                        "Upload-Metadata": "filename " + base64.b64encode(b"dropped.bin").decode("ascii"),
+                    },
+                )
+                self.assertEqual(status, 201)
+                self.assertEqual(request(address, "DELETE", headers["Location"])[0], 204)
+                self.assertEqual(request(address, "HEAD", headers["Location"])[0], 404)
+                self.assertFalse(Path(directory, "dropped.bin").exists())
+                self.assertEqual(request(address, "PATCH", "/big.bin", body=b"x")[0], 405)
+
+                # An empty upload is committed on creation; a failed rename is a 500.
+                with mock.patch("simple_uploads.os.replace", side_effect=PermissionError):
+                    status, headers, body = request(
+                        address,
+                        "POST",
+                        "/__uploads__",
+                        headers={
+                            "Upload-Length": "0",
+                            "Upload-Metadata": "filename " + base64.b64encode(b"empty.bin").decode("ascii"),
+                        },
+                    )
+                self.assertEqual(status, 500)
+                self.assertEqual(json.loads(body)["message"], "Upload could not be saved.")
+                self.assertFalse(Path(directory, "empty.bin").exists())
+
+    def test_upload_staging_files_are_neither_listed_nor_served(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "visible.txt").write_bytes(b"visible")
+            # A form upload still being written beside its destination.
+            Path(directory, "docs").mkdir()
+            Path(directory, "docs", ".upload-0123456789abcdef.part").write_bytes(b"partial")
+            with LocalServer(directory) as address:
+                status, headers, body = request(
+                    address,
+                    "POST",
+                    "/__uploads__",
+                    headers={
+                        "Upload-Length": "10",
+                        "Upload-Metadata": "filename " + base64.b64encode(b"pending.bin").decode("ascii"),
+                    },
+                )
+                self.assertEqual(status, 201)
+                upload_id = headers["Location"].rsplit("/", 1)[1]
+                staging = Path(directory, ".simple-server-uploads")
+                info = json.loads(staging.joinpath(upload_id + ".json").read_text(encoding="utf-8"))
+                self.assertEqual(info["destination"], "pending.bin")
+
+                for path in ("/", "/?format=json"):
+                    status, headers, body = request(address, "GET", path)
+                    self.assertEqual(status, 200)
+                    self.assertIn(b"visible.txt", body)
+                    self.assertNotIn(b".simple-server-uploads", body)
+                status, headers, body = request(address, "GET", "/docs/?format=json")
+                self.assertEqual(json.loads(body)["entries"], [])
+                for path in (
+                    "/.simple-server-uploads/",
+                    "/.simple-server-uploads",
+                    "/.simple-server-uploads/%s.json" % upload_id,
+                    "/.simple-server-uploads/%s.part" % upload_id,
+                    "/.simple-server-uploads/?download",
+                    "/.simple-server-uploads/?deletefile=%s.json" % upload_id,
+                    "/?deletefile=.simple-server-uploads",
+                    "/docs/.upload-0123456789abcdef.part",
+                ):
+                    with self.subTest(path=path):
+                        self.assertEqual(request(address, "GET", path)[0], 404)
+
+                for archive_format in ("zip", "tar"):
+                    status, headers, body = request(address, "GET", "/?download=" + archive_format)
+                    self.assertEqual(status, 200)
+                    if archive_format == "zip":
+                        with zipfile.ZipFile(BytesIO(body)) as archive:
+                            names = archive.namelist()
+                    else:
+                        with tarfile.open(fileobj=BytesIO(body)) as archive:
+                            names = archive.getnames()
+                    self.assertIn(os.path.basename(directory) + "/visible.txt", names)
+                    self.assertFalse([name for name in names if ".simple-server-uploads" in name])
+                    self.assertFalse([name for name in names if ".upload-" in name])
+
+                body = urllib.parse.urlencode({"dir": "/", "path": ".simple-server-uploads"}).encode("ascii")
+                status, _, _ = request(
+                    address,
+                    "POST",
+                    "/__download__",
+                    body=body,
+                    headers={"Content-Type": "application/x-www-form-urlencoded"},
+                )
+                self.assertEqual(status, 404)
+                self.assertEqual(create_share(address, "/.simple-server-uploads/")[0], 404)
+                self.assertEqual(request(address, "HEAD", "/__uploads__/" + upload_id)[0], 200)
+            self.assertTrue(staging.joinpath(upload_id + ".part").exists())
+            self.assertTrue(Path(directory, "docs", ".upload-0123456789abcdef.part").exists())
+
     def test_password_login_allows_access_to_static_file(self):
         content = b"protected content\n"
         with tempfile.TemporaryDirectory() as directory:
@@ -677,5 +1978,93 @@ class HttpResponseSmokeTests(unittest.TestCase):
                 self.assertEqual(body, content)
 
 
+class AsyncEngineSmokeTests(unittest.TestCase):
+    def test_files_ranges_and_keep_alive_on_the_event_loop(self):
+        content = bytes(range(256)) * 1024
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "media.bin").write_bytes(content)
+
+            with LocalServer(directory, server_class=simpleserver.AsyncSimpleServer) as address:
+                connection = http.client.HTTPConnection(*address, timeout=5)
+                try:
+                    connection.request("GET", "/media.bin")
+                    response = connection.getresponse()
+                    self.assertEqual(response.status, 200)
+                    self.assertEqual(response.read(), content)
+                    first_socket = connection.sock
+
+                    connection.request("GET", "/media.bin", headers={"Range": "bytes=1000-1999"})
+                    response = connection.getresponse()
+                    self.assertEqual(response.status, 206)
+                    self.assertEqual(response.read(), content[1000:2000])
+
+                    connection.request("HEAD", "/media.bin")
+                    response = connection.getresponse()
+                    self.assertEqual(response.read(), b"")
+                    self.assertEqual(response.headers["Content-Length"], str(len(content)))
+
+                    connection.request("GET", "/missing.txt")
+                    response = connection.getresponse()
+                    self.assertEqual(response.status, 404)
+                    response.read()
+                    self.assertIs(connection.sock, first_socket)
+                finally:
+                    connection.close()
+
+                status, headers, body = request(address, "GET", "/healthz")
+                self.assertEqual(json.loads(body)["pool"]["engine"], "asyncio")
+
+    def test_uploads_listings_and_login_on_the_event_loop(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with LocalServer(
+                directory,
+                password="loop-secret",
+                server_class=simpleserver.AsyncSimpleServer,
+            ) as address:
+                login_body = b"password=loop-secret&next=%2F"
+                status, headers, body = request(
+                    address,
+                    "POST",
+                    "/__login__",
+                    body=login_body,
+                    headers={
+                        "Content-Type": "application/x-www-form-urlencoded",
+                        "Content-Length": str(len(login_body)),
+                    },
+                )
+                self.assertEqual(status, 303)
+                cookie = headers["Set-Cookie"].split(";", 1)[0]
+
+                upload_body, upload_headers = multipart_upload("loop.txt", b"x" * 200000)
+                upload_headers["Accept"] = "application/json"
+                upload_headers["Cookie"] = cookie
+                status, headers, body = request(
+                    address,
+                    "POST",
+                    "/",
+                    body=upload_body,
+                    headers=upload_headers,
+                )
+                self.assertEqual(status, 200)
+                self.assertEqual(Path(directory, "loop.txt").read_bytes(), b"x" * 200000)
+
+                status, headers, body = request(address, "GET", "/", headers={"Cookie": cookie})
+                self.assertEqual(status, 200)
+                self.assertIn(b"loop.txt", body)
+
+    def test_shutdown_closes_idle_keep_alive_connections(self):
+        with tempfile.TemporaryDirectory() as directory:
+            local_server = LocalServer(directory, server_class=simpleserver.AsyncSimpleServer)
+            with local_server as address:
+                idle = http.client.HTTPConnection(*address, timeout=5)
+                idle.request("GET", "/healthz")
+                self.assertEqual(idle.getresponse().read()[:1], b"{")
+                wait_until(lambda: local_server.server.pool_stats()["busy_threads"] == 0)
+            try:
+                self.assertEqual(idle.sock.recv(1), b"")
+            finally:
+                idle.close()
+
+
 if __name__ == "__main__":
     unittest.main()
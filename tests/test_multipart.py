@@ -0,0 +1,86 @@
+from io import BytesIO
+from pathlib import Path
+import sys
+import unittest
+
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = PROJECT_ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from simple_multipart import (  # noqa: E402
+    IncompleteBody,
+    MultipartParser,
+    parse_content_type,
+)
+
+
+BOUNDARY = "----form-boundary-1234"
+
+
+def build_body(parts, preamble=b""):
+    body = preamble
+    for name, filename, content in parts:
+        disposition = 'form-data; name="%s"' % name
+        if filename is not None:
+            disposition += '; filename="%s"' % filename
+        body += ("--%s\r\nContent-Disposition: %s\r\n\r\n" % (BOUNDARY, disposition)).encode("utf-8")
+        body += content + b"\r\n"
+    return body + ("--%s--\r\n" % BOUNDARY).encode("ascii")
+
+
+def read_parts(body, chunk_size, content_length=None):
+    parser = MultipartParser(
+        BytesIO(body),
+        BOUNDARY,
+        len(body) if content_length is None else content_length,
+        chunk_size=chunk_size,
+    )
+    return [
+        (part.name, part.filename, b"".join(part.iter_chunks()))
+        for part in parser
+    ]
+
+
+class MultipartParserTests(unittest.TestCase):
+    def test_content_type_parameters_are_parsed(self):
+        ctype, params = parse_content_type('multipart/form-data; boundary="abc def"')
+
+        self.assertEqual(ctype, "multipart/form-data")
+        self.assertEqual(params["boundary"], "abc def")
+
+    def test_parts_are_split_at_every_chunk_size(self):
+        # Contents that contain boundary-like bytes must survive chunk splits.
+        parts = [
+            ("note", None, b"plain field"),
+            ("file", "first.bin", bytes(range(256)) * 40 + b"\r\n--" + BOUNDARY[:-1].encode()),
+            ("file", "empty.txt", b""),
+            ("file", "second.txt", b"\r\n\r\nline\r\n"),
+        ]
+        body = build_body(parts, preamble=b"ignored preamble\r\n")
+
+        for chunk_size in (1, 7, len(BOUNDARY), 4096, len(body)):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(read_parts(body, chunk_size), parts)
+
+    def test_unread_parts_are_skipped(self):
+        body = build_body([("file", "a.txt", b"a" * 1000), ("file", "b.txt", b"b")])
+        parser = MultipartParser(BytesIO(body), BOUNDARY, len(body), chunk_size=64)
+
+        names = [part.filename for part in parser]
+
+        self.assertEqual(names, ["a.txt", "b.txt"])
+        self.assertEqual(parser.remaining, 0)
+
+    def test_truncated_body_is_reported_as_incomplete(self):
+        body = build_body([("file", "a.txt", b"payload")])
+
+        for truncated, declared in ((body[:-10], None), (body, len(body) + 10)):
+            with self.subTest(declared=declared):
+                with self.assertRaises(IncompleteBody):
+                    read_parts(truncated, 16, content_length=declared)
+
+
+if __name__ == "__main__":
+    unittest.main()
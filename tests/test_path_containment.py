@@ -49,6 +49,22 @@ class PathContainmentTests(unittest.TestCase):
                     with self.assertRaises(ValueError):
                         simpleserver.resolve_contained_child(directory, name)
 
+    def test_upload_names_are_taken_literally(self):
+        with tempfile.TemporaryDirectory() as directory:
+            original_cwd = os.getcwd()
+            os.chdir(directory)
+            try:
+                root = os.path.realpath(directory)
+                for name in ("big%41.bin", "a%20b.txt", "100% done.txt"):
+                    with self.subTest(name=name):
+                        self.assertEqual(simpleserver.resolve_upload_name(name), os.path.join(root, name))
+                for name in (None, "", "..", "../outside.txt", "nested/file.txt"):
+                    with self.subTest(name=name):
+                        with self.assertRaises(ValueError):
+                            simpleserver.resolve_upload_name(name)
+            finally:
+                os.chdir(original_cwd)
+
     def test_rejects_a_symlink_that_resolves_outside_root(self):
         with tempfile.TemporaryDirectory() as parent:
             served = Path(parent, "served")
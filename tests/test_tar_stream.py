@@ -0,0 +1,87 @@
+from io import BytesIO
+import os
+from pathlib import Path
+import sys
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = PROJECT_ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+import simple_tar  # noqa: E402
+from simple_tar import TarStreamWriter, walk_tree  # noqa: E402
+
+
+class UnseekableSink:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, chunk):
+        self.data += chunk
+
+
+class TarStreamWriterTests(unittest.TestCase):
+    def test_tree_is_walked_in_order_without_following_links(self):
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory, "tree")
+            Path(root, "b", "inner").mkdir(parents=True)
+            Path(root, "a.txt").write_bytes(b"a")
+            Path(root, "b", "inner", "c.txt").write_bytes(b"c")
+            os.symlink(directory, str(Path(root, "loop")))
+
+            names = [arcname for arcname, _, _ in walk_tree(str(root), "tree")]
+
+            self.assertEqual(names, ["tree", "tree/a.txt", "tree/b", "tree/loop", "tree/b/inner", "tree/b/inner/c.txt"])
+            excluded = [arcname for arcname, _, _ in walk_tree(str(root), "tree", exclude={str(Path(root, "b"))})]
+            self.assertEqual(excluded, ["tree", "tree/a.txt", "tree/loop"])
+
+    def test_links_are_kept_and_special_files_skipped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory, "tree")
+            root.mkdir()
+            Path(root, "data.bin").write_bytes(bytes(range(256)) * 300)
+            os.symlink("data.bin", str(Path(root, "link")))
+            os.mkfifo(str(Path(root, "pipe")))
+            sink = UnseekableSink()
+
+            writer = TarStreamWriter(sink)
+            skipped = [
+                arcname for arcname, path, file_stat in walk_tree(str(root), "tree")
+                if not writer.add(arcname, path, file_stat)
+            ]
+            writer.close()
+
+            self.assertEqual(skipped, ["tree/pipe"])
+            with tarfile.open(fileobj=BytesIO(bytes(sink.data)), mode="r:") as archive:
+                self.assertEqual(archive.getnames(), ["tree", "tree/data.bin", "tree/link"])
+                self.assertTrue(archive.getmember("tree").isdir())
+                link = archive.getmember("tree/link")
+                self.assertTrue(link.issym())
+                self.assertEqual(link.linkname, "data.bin")
+                self.assertEqual(archive.extractfile("tree/data.bin").read(), bytes(range(256)) * 300)
+
+    def test_file_that_shrinks_while_read_is_padded_to_its_header_size(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, "shrinking.log")
+            path.write_bytes(b"x" * 1000)
+            file_stat = path.stat()
+            os.truncate(path, 10)
+            sink = UnseekableSink()
+
+            writer = TarStreamWriter(sink)
+            # The size in the header comes from before the file shrank.
+            with mock.patch.object(simple_tar.os, "fstat", return_value=file_stat):
+                self.assertTrue(writer.add("shrinking.log", str(path), file_stat))
+            writer.close()
+
+            with tarfile.open(fileobj=BytesIO(bytes(sink.data)), mode="r:") as archive:
+                self.assertEqual(archive.extractfile("shrinking.log").read(), b"x" * 10 + bytes(990))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+from pathlib import Path
+import sys
+import unittest
+
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = PROJECT_ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from simple_templates import Template  # noqa: E402
+
+
+class TemplateTests(unittest.TestCase):
+    def test_static_text_is_encoded_once_and_slots_filled_per_render(self):
+        template = Template("<title>{title}</title><p>{{literal}}</p>{body}\n")
+
+        self.assertEqual(template.fields, ("title", "body"))
+        self.assertEqual(template.literals, (b"<title>", b"</title><p>{literal}</p>", b"\n"))
+        self.assertEqual(
+            template.render(title="café", body=b"<b>raw</b>"),
+            "<title>café</title><p>{literal}</p><b>raw</b>\n".encode("utf-8"),
+        )
+
+    def test_constants_are_filled_at_compile_time(self):
+        template = Template('<script src="{url}"></script>{body}', url="/__static__/a.1.js")
+
+        self.assertEqual(template.fields, ("body",))
+        self.assertEqual(template.render(body=""), b'<script src="/__static__/a.1.js"></script>')
+
+    def test_parts_are_appended_to_an_existing_list(self):
+        out = [b"head"]
+        Template("{a}-{a}").render_parts({"a": "x"}, out)
+
+        self.assertEqual(b"".join(out), b"headx-x")
+
+    def test_missing_slot_is_an_error(self):
+        with self.assertRaises(KeyError):
+            Template("{a}{b}").render(a="x")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import base64
+from io import BytesIO
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+import unittest
+
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = PROJECT_ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from simple_uploads import UploadError, UploadStore, parse_upload_metadata  # noqa: E402
+
+
+class UploadMetadataTests(unittest.TestCase):
+    def test_pairs_are_base64_decoded(self):
+        name = base64.b64encode("résumé.pdf".encode("utf-8")).decode("ascii")
+        metadata = parse_upload_metadata("filename %s, is_confidential" % name)
+        self.assertEqual(metadata, {"filename": "résumé.pdf", "is_confidential": ""})
+        self.assertEqual(parse_upload_metadata(None), {})
+
+    def test_malformed_values_are_rejected(self):
+        with self.assertRaises(ValueError):
+            parse_upload_metadata("filename not*base64")
+        with self.assertRaises(ValueError):
+            parse_upload_metadata("filename " + base64.b64encode(b"\xff\xfe").decode("ascii"))
+
+
+class UploadStoreTests(unittest.TestCase):
+    def test_chunks_are_appended_at_the_current_offset(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = UploadStore(os.path.join(directory, "staging"), ttl=60)
+            destination = os.path.join(directory, "data.bin")
+            session = store.create(destination, 10)
+
+            self.assertEqual(session.append(BytesIO(b"abcd"), 0, 4), 4)
+            # A body cut off early keeps what arrived.
+            self.assertEqual(store.get(session.id).append(BytesIO(b"ef"), 4, 4), 6)
+            with self.assertRaises(UploadError) as raised:
+                session.append(BytesIO(b"zz"), 2, 2)
+            self.assertEqual(raised.exception.status, 409)
+            with self.assertRaises(UploadError) as raised:
+                session.append(BytesIO(b"x" * 5), 6, 5)
+            self.assertEqual(raised.exception.status, 413)
+
+            self.assertEqual(session.append(BytesIO(b"ghij"), 6, 4), 10)
+            session.commit(destination)
+            self.assertEqual(Path(destination).read_bytes(), b"abcdefghij")
+            self.assertIsNone(store.get(session.id))
+            self.assertEqual(os.listdir(store.directory), [])
+
+    def test_idle_sessions_expire(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = UploadStore(directory, ttl=60)
+            idle = store.create(os.path.join(directory, "idle.bin"), 10)
+            active = store.create(os.path.join(directory, "active.bin"), 10)
+            stale = time.time() - 120
+            os.utime(idle.part_path, (stale, stale))
+
+            self.assertIsNone(store.get("../" + active.id))
+            self.assertIsNone(store.get(idle.id))
+            self.assertFalse(os.path.exists(store.path_for(idle.id, ".json")))
+
+            os.utime(active.part_path, (stale, stale))
+            store.expire()
+            self.assertEqual(os.listdir(directory), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import http.client
+import json
+import os
+from pathlib import Path
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = PROJECT_ROOT / "src"
+
+
+def request(port, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.headers, response.read()
+    finally:
+        connection.close()
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "worker processes require os.fork()")
+class WorkerProcessTests(unittest.TestCase):
+    def test_worker_group_registers_once_shares_sessions_and_recycles(self):
+        with tempfile.TemporaryDirectory() as home, tempfile.TemporaryDirectory() as served:
+            Path(served, "hello.txt").write_bytes(b"hello from a worker")
+            registry = Path(home, ".simple-server", "servers.json")
+            log_path = Path(home, "server.log")
+            log_file = open(log_path, "wb")
+            self.addCleanup(log_file.close)
+            process = subprocess.Popen(
+                [
+                    sys.executable,
+                    str(SRC_DIR / "simpleserver.py"),
+                    "127.0.0.1:0",
+                    served,
+                    "--workers", "2",
+                    "--max-requests-per-worker", "2",
+                    "--password", "worker-secret",
+                ],
+                env=dict(os.environ, HOME=home),
+                stdout=subprocess.DEVNULL,
+                stderr=log_file,
+            )
+            try:
+                deadline = time.monotonic() + 10
+                entries = []
+                while not entries and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    if registry.exists():
+                        entries = json.loads(registry.read_text(encoding="utf-8") or "[]")
+                self.assertEqual(len(entries), 1)
+                self.assertEqual(entries[0]["pid"], process.pid)
+                self.assertEqual(entries[0]["workers"], 2)
+                port = entries[0]["port"]
+
+                login_body = b"password=worker-secret&next=%2Fhello.txt"
+                status, headers, body = request(
+                    port,
+                    "POST",
+                    "/__login__",
+                    body=login_body,
+                    headers={
+                        "Content-Type": "application/x-www-form-urlencoded",
+                        "Content-Length": str(len(login_body)),
+                    },
+                )
+                self.assertEqual(status, 303)
+                cookie = headers["Set-Cookie"].split(";", 1)[0]
+
+                # Enough requests to reach both workers and outlive recycled ones.
+                for _ in range(10):
+                    status, headers, body = request(
+                        port,
+                        "GET",
+                        "/hello.txt",
+                        headers={"Cookie": cookie},
+                    )
+                    self.assertEqual(status, 200)
+                    self.assertEqual(body, b"hello from a worker")
+
+                # Planned recycles are routine, not warnings about crashed workers.
+                deadline = time.monotonic() + 10
+                while b"recycled" not in log_path.read_bytes() and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                log = log_path.read_bytes()
+                self.assertIn(b"recycled; starting a replacement", log)
+                self.assertNotIn(b"exited; starting a replacement", log)
+            finally:
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=15)
+
+            self.assertEqual(json.loads(registry.read_text(encoding="utf-8")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
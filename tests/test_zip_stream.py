@@ -0,0 +1,123 @@
+from io import BytesIO
+import os
+from pathlib import Path
+import sys
+import tempfile
+import unittest
+import zipfile
+
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = PROJECT_ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from simple_zip import (  # noqa: E402
+    DEFLATE_BLOCK_SIZE,
+    MAX_LOOKAHEAD,
+    ZIP_COUNT_LIMIT,
+    ZIP_STORED,
+    CompressionPool,
+    ZipStreamWriter,
+)
+
+
+class UnseekableSink:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, chunk):
+        self.data += chunk
+
+
+class ZipStreamWriterTests(unittest.TestCase):
+    def test_streamed_archive_reads_back_with_zipfile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            text = Path(directory, "notes.txt")
+            text.write_text("streamed " * 1000, encoding="utf-8")
+            binary = Path(directory, "random.bin")
+            binary.write_bytes(os.urandom(200 * 1024))
+            sink = UnseekableSink()
+
+            writer = ZipStreamWriter(sink.write)
+            writer.add_directory("tree", text.stat().st_mtime)
+            writer.add_file(str(text), "tree/notes.txt")
+            writer.add_file(str(binary), "tree/sub/random.bin")
+            writer.close()
+
+            with zipfile.ZipFile(BytesIO(bytes(sink.data))) as archive:
+                self.assertIsNone(archive.testzip())
+                self.assertEqual(
+                    archive.namelist(),
+                    ["tree/", "tree/notes.txt", "tree/sub/random.bin"],
+                )
+                self.assertTrue(archive.getinfo("tree/").is_dir())
+                self.assertEqual(archive.read("tree/notes.txt"), text.read_bytes())
+                self.assertEqual(archive.read("tree/sub/random.bin"), binary.read_bytes())
+                self.assertLess(archive.getinfo("tree/notes.txt").compress_size, 1000)
+
+    def test_parallel_compression_writes_the_same_archive_in_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            files = []
+            for index in range(40):
+                path = Path(directory, "file-%02d.txt" % index)
+                path.write_bytes(("line %d\n" % index).encode("ascii") * (index * 500))
+                files.append(path)
+            large = Path(directory, "large.log")
+            large.write_bytes(b"".join(b"entry %08d\n" % i for i in range(DEFLATE_BLOCK_SIZE // 5)))
+            files.insert(7, large)
+            archives = []
+            for pool in (None, CompressionPool(1), CompressionPool(4)):
+                sink = UnseekableSink()
+                writer = ZipStreamWriter(sink.write, pool=pool)
+                for path in files:
+                    writer.add_file(str(path), "tree/" + path.name)
+                writer.close()
+                archives.append(bytes(sink.data))
+
+            self.assertEqual(archives[0], archives[1])
+            self.assertEqual(archives[0], archives[2])
+            with zipfile.ZipFile(BytesIO(archives[2])) as archive:
+                self.assertIsNone(archive.testzip())
+                self.assertEqual(archive.namelist(), ["tree/" + path.name for path in files])
+                self.assertEqual(archive.read("tree/large.log"), large.read_bytes())
+                self.assertLess(archive.getinfo("tree/large.log").compress_size, large.stat().st_size // 4)
+
+    def test_read_ahead_is_bounded_however_many_workers_there_are(self):
+        self.assertEqual(ZipStreamWriter(UnseekableSink().write, pool=CompressionPool(2)).lookahead,
+                         4 * DEFLATE_BLOCK_SIZE)
+        self.assertEqual(ZipStreamWriter(UnseekableSink().write, pool=CompressionPool(64)).lookahead,
+                         MAX_LOOKAHEAD)
+        self.assertEqual(ZipStreamWriter(UnseekableSink().write, pool=CompressionPool(1)).lookahead, 0)
+
+    def test_compressed_formats_and_level_zero_are_stored(self):
+        content = b"compressible " * 1000
+        for level, name, expected in (
+            (6, "movie.MP4", zipfile.ZIP_STORED),
+            (6, "bundle.tar.gz", zipfile.ZIP_STORED),
+            (6, "notes.txt", zipfile.ZIP_DEFLATED),
+            (0, "notes.txt", zipfile.ZIP_STORED),
+        ):
+            with self.subTest(level=level, name=name):
+                sink = UnseekableSink()
+                writer = ZipStreamWriter(sink.write, compresslevel=level)
+                writer.add_fileobj(BytesIO(content), name, os.stat(__file__))
+                writer.close()
+                with zipfile.ZipFile(BytesIO(bytes(sink.data))) as archive:
+                    self.assertEqual(archive.getinfo(name).compress_type, expected)
+                    self.assertEqual(archive.read(name), content)
+
+    def test_entry_count_past_the_classic_limit_uses_zip64_end_records(self):
+        sink = UnseekableSink()
+        writer = ZipStreamWriter(sink.write, compression=ZIP_STORED)
+        for index in range(ZIP_COUNT_LIMIT + 1):
+            writer.add_directory("d%d" % index, 0)
+        writer.close()
+
+        self.assertIn(b"PK\x06\x06", sink.data[-200:])
+        with zipfile.ZipFile(BytesIO(bytes(sink.data))) as archive:
+            self.assertEqual(len(archive.infolist()), ZIP_COUNT_LIMIT + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()